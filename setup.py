@@ -35,6 +35,9 @@ setup(
         'ralph_assets>=1.0.0',
         'django-mptt==0.5.5',
     ],
+    extras_require={
+        'numpy': ['numpy'],
+    },
     entry_points={
         'console_scripts': [
         ],
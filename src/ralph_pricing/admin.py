@@ -5,10 +5,14 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import datetime
+
 from django.contrib import admin
+from django.db.models import Max, Min
 from lck.django.common.admin import ModelAdmin
 
 from ralph_pricing import models
+from ralph_pricing.plugins.rollup import roll_up_day
 
 
 def register(model):
@@ -18,6 +22,52 @@ def register(model):
     return decorator
 
 
+class PricingModelAdmin(ModelAdmin):
+    """Bumps the data versions after the changes made in the admin."""
+
+    def get_changed_dates(self, obj):
+        """
+        Return the ``(start, end)`` range of the days whose reports show
+        the object, or ``None`` if they don't show it or its signals bump
+        the data versions already.
+        """
+
+        return None
+
+    def save_model(self, request, obj, form, change):
+        super(PricingModelAdmin, self).save_model(request, obj, form, change)
+        dates = self.get_changed_dates(obj)
+        if dates is not None:
+            models.bump_data_version(*dates)
+
+    def delete_model(self, request, obj):
+        # The daily data of the object is deleted together with it.
+        dates = self.get_changed_dates(obj)
+        super(PricingModelAdmin, self).delete_model(request, obj)
+        if dates is not None:
+            models.bump_data_version(*dates)
+
+    def save_formset(self, request, form, formset, change):
+        super(PricingModelAdmin, self).save_formset(
+            request,
+            form,
+            formset,
+            change,
+        )
+        dates = set()
+        for inline_form in formset.forms:
+            if 'date' not in inline_form.fields:
+                continue
+            if (inline_form.has_changed() or
+                    inline_form in formset.deleted_forms):
+                dates.add(inline_form.initial.get('date'))
+                dates.add(inline_form.instance.date)
+        # The usage prices and extra costs are handled by their signals.
+        for date in dates - {None}:
+            models.bump_data_version(date)
+            models.run_rollup(roll_up_day, date)
+
+
 class DailyDeviceInline(admin.TabularInline):
     model = models.DailyDevice
 
@@ -31,45 +81,64 @@ class DailyUsageInline(admin.TabularInline):
 
 
 @register(models.Device)
-class DeviceAdmin(ModelAdmin):
+class DeviceAdmin(PricingModelAdmin):
     list_display = ('name', 'sn', 'barcode')
     list_filter = ('is_virtual', 'is_blade')
     search_fields = ('name', 'sn', 'barcode')
     inlines = [DailyDeviceInline, DailyPartInline, DailyUsageInline]
 
+    def get_changed_dates(self, obj):
+        start = end = None
+        for model in (models.DailyDevice, models.DailyPart, models.DailyUsage):
+            dates = model.objects.filter(pricing_device=obj).aggregate(
+                start=Min('date'),
+                end=Max('date'),
+            )
+            if dates['start'] is None:
+                continue
+            start = min(start or dates['start'], dates['start'])
+            end = max(end or dates['end'], dates['end'])
+        if start is None:
+            return None
+        return start, end
+
 
 class ExtraCostInline(admin.TabularInline):
     model = models.ExtraCost
 
 
 @register(models.Venture)
-class VentureAdmin(ModelAdmin):
+class VentureAdmin(PricingModelAdmin):
     list_display = ('name', 'department', 'venture_id', 'business_segment',
                     'profit_center')
     list_filter = ('department', 'business_segment', 'profit_center')
     search_fields = ('name', 'venture_id', 'symbol')
     inlines = [ExtraCostInline]
 
+    def get_changed_dates(self, obj):
+        # The reports of every day show all the ventures.
+        return datetime.date.min, datetime.date.max
+
 
 class UsagePriceInline(admin.TabularInline):
     model = models.UsagePrice
 
 
 @register(models.UsageType)
-class UsageTypeAdmin(ModelAdmin):
+class UsageTypeAdmin(PricingModelAdmin):
     list_display = ('name',)
     search_fields = ('name',)
     inlines = [UsagePriceInline]
 
 
 @register(models.ExtraCostType)
-class ExtraCostTypeAdmin(ModelAdmin):
+class ExtraCostTypeAdmin(PricingModelAdmin):
     list_display = ('name',)
     search_fields = ('name',)
     inlines = [ExtraCostInline]
 
 
 @register(models.SplunkName)
-class SplunkNameAdmin(ModelAdmin):
+class SplunkNameAdmin(PricingModelAdmin):
     list_display = ('splunk_name', 'pricing_device')
     search_fields = ('splunk_name',)
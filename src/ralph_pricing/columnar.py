@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+"""
+Columnar computation of the usages of all the ventures with NumPy, used by
+the venture reports when the ``PRICING_REPORTS_BACKEND`` setting is
+``'numpy'``.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from decimal import Decimal as D
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from ralph_pricing.models import (
+    DailyUsage,
+    MULTIPLE_PRICES,
+    PRICE_PLACES,
+    PriceCalendar,
+    UsageType,
+)
+
+
+class UsageColumns(object):
+    """
+    The daily usages of all the ventures between ``start`` and ``end``,
+    loaded with a single query into columns of venture index, type index,
+    day offset and value. The counts and prices of every venture and usage
+    type are then computed with grouped sums, pricing the values with a
+    matrix of the prices of every type on every day of the range.
+    """
+
+    def __init__(self, start, end, query=None, calendar=None):
+        if numpy is None:
+            raise ImportError("NumPy is required for the 'numpy' backend.")
+        if query is None:
+            query = DailyUsage.objects
+        days = (end - start).days + 1
+        rows = query.filter(
+            date__gte=start,
+            date__lte=end,
+        ).values_list(
+            'pricing_venture',
+            'type',
+            'date',
+            'value',
+        ).order_by()
+        ventures, types, dates, values = zip(*rows) or ([], [], [], [])
+        self.venture_ids, venture_index = numpy.unique(
+            numpy.array([v or 0 for v in ventures], dtype=numpy.int64),
+            return_inverse=True,
+        )
+        self.type_ids, type_index = numpy.unique(
+            numpy.array(types, dtype=numpy.int64),
+            return_inverse=True,
+        )
+        day_offset = (
+            numpy.array(dates, dtype='datetime64[D]') -
+            numpy.datetime64(start, 'D')
+        ).astype(numpy.int64)
+        values = numpy.array(values, dtype=numpy.float64)
+        type_ids = [int(type_id) for type_id in self.type_ids]
+        if calendar is None:
+            calendar = PriceCalendar(types=type_ids, start=start, end=end)
+        prices = numpy.empty((len(type_ids), days))
+        prices.fill(numpy.nan)
+        for i, type_id in enumerate(type_ids):
+            for segment_start, segment_end, price in calendar.price_segments(
+                type_id,
+                start,
+                end,
+            ):
+                if price is None or price is MULTIPLE_PRICES:
+                    continue
+                prices[
+                    i,
+                    (segment_start - start).days:(segment_end - start).days + 1
+                ] = float(price)
+        average = dict(UsageType.objects.filter(
+            id__in=type_ids,
+        ).values_list('id', 'average'))
+        shape = len(self.venture_ids), len(self.type_ids)
+        groups = venture_index * shape[1] + type_index
+        size = shape[0] * shape[1]
+        self.used = numpy.bincount(
+            groups,
+            minlength=size,
+        ).reshape(shape) > 0
+        self.counts = numpy.bincount(
+            groups,
+            weights=values,
+            minlength=size,
+        ).reshape(shape).astype(numpy.float64)
+        self.counts[:, numpy.array(
+            [average[type_id] for type_id in type_ids],
+            dtype=bool,
+        )] /= days
+        # A value without a price on its day makes the whole sum NaN
+        self.prices = numpy.bincount(
+            groups,
+            weights=values * prices[type_index, day_offset],
+            minlength=size,
+        ).reshape(shape)
+
+    def get_usages(self):
+        """
+        Return a dict of ``{(venture_id, type_id): (count, price)}``, like
+        ``get_usages_count_price_by_type`` grouped by ``pricing_venture``.
+        """
+
+        usages = {}
+        places = D(10) ** -PRICE_PLACES
+        for i, j in zip(*numpy.nonzero(self.used)):
+            venture_id = int(self.venture_ids[i]) or None
+            price = self.prices[i, j]
+            if numpy.isnan(price):
+                price = None
+            else:
+                price = D(price).quantize(places)
+            usages[venture_id, int(self.type_ids[j])] = (
+                float(self.counts[i, j]),
+                price,
+            )
+        return usages
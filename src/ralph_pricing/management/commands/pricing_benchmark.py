@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import textwrap
+import datetime
+import time
+import uuid
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max, Sum, signals
+
+from ralph_pricing.models import (
+    DailyDevice,
+    DailyPart,
+    DailyUsage,
+    Device,
+    UsageType,
+    Venture,
+    bump_all_data_version,
+)
+
+
+# The signals bumping the data versions of all the days for the usage types
+DATA_VERSION_SIGNALS = (
+    (signals.post_save, 'ralph_pricing.data_version.UsageType.save'),
+    (signals.post_delete, 'ralph_pricing.data_version.UsageType.delete'),
+)
+
+
+def create_dataset(run, ventures, devices, days, start):
+    """
+    Fill the database with a synthetic dataset of ``devices`` devices spread
+    over ``ventures`` ventures, with daily devices, two parts and a usage of
+    every usage type for every device on each of ``days`` days. The names
+    include the ``run`` id.
+    """
+
+    usage_types = [
+        UsageType.objects.create(name='benchmark {0} {1}'.format(run, i))
+        for i in range(3)
+    ]
+    venture_id = Venture.objects.aggregate(m=Max('venture_id'))['m'] or 0
+    venture_objects = [
+        Venture.objects.create(
+            venture_id=venture_id + i + 1,
+            name='benchmark {0} {1}'.format(run, i),
+        )
+        for i in range(ventures)
+    ]
+    device_id = Device.objects.aggregate(m=Max('device_id'))['m'] or 0
+    asset_id = max(
+        Device.objects.aggregate(m=Max('asset_id'))['m'] or 0,
+        DailyPart.objects.aggregate(m=Max('asset_id'))['m'] or 0,
+    )
+    Device.objects.bulk_create([
+        Device(
+            device_id=device_id + i + 1,
+            asset_id=asset_id + i + 1,
+            name='benchmark-{0}-{1}.local'.format(run, i),
+        )
+        for i in range(devices)
+    ])
+    device_objects = list(Device.objects.filter(
+        device_id__gt=device_id,
+    ).order_by('device_id'))
+    part_asset_id = asset_id + devices
+    for day in range(days):
+        date = start + datetime.timedelta(days=day)
+        daily_devices = []
+        daily_parts = []
+        daily_usages = []
+        for i, device in enumerate(device_objects):
+            venture = venture_objects[i % ventures]
+            daily_devices.append(DailyDevice(
+                date=date,
+                name=device.name,
+                pricing_device=device,
+                pricing_venture=venture,
+                price=1000,
+                deprecation_rate=25,
+            ))
+            for part in range(2):
+                daily_parts.append(DailyPart(
+                    date=date,
+                    name='part {0}'.format(part),
+                    pricing_device=device,
+                    asset_id=part_asset_id + 2 * i + part + 1,
+                    price=100,
+                    deprecation_rate=25,
+                ))
+            for usage_type in usage_types:
+                daily_usages.append(DailyUsage(
+                    date=date,
+                    pricing_device=device,
+                    pricing_venture=venture,
+                    type=usage_type,
+                    value=i + day,
+                ))
+        DailyDevice.objects.bulk_create(daily_devices)
+        DailyPart.objects.bulk_create(daily_parts)
+        DailyUsage.objects.bulk_create(daily_usages)
+    return venture_objects, device_objects, usage_types
+
+
+def delete_dataset(run):
+    """Delete the dataset created by :func:`create_dataset` in the run."""
+
+    prefix = 'benchmark {0} '.format(run)
+    devices = Device.objects.filter(
+        name__startswith='benchmark-{0}-'.format(run),
+    )
+    usage_types = UsageType.objects.filter(name__startswith=prefix)
+    DailyUsage.objects.filter(type__in=usage_types).delete()
+    DailyPart.objects.filter(pricing_device__in=devices).delete()
+    DailyDevice.objects.filter(pricing_device__in=devices).delete()
+    devices.delete()
+    usage_types.delete()
+    for venture in Venture.objects.filter(name__startswith=prefix):
+        venture.delete()
+
+
+def get_queries(venture, device, usage_type, start, end):
+    """The access paths used by the reports and the plugins."""
+
+    return [
+        ('usages of a venture', DailyUsage.objects.filter(
+            pricing_venture=venture,
+            type=usage_type,
+            date__gte=start,
+            date__lte=end,
+        ).values('type').annotate(total=Sum('value')).order_by()),
+        ('usages of a device', DailyUsage.objects.filter(
+            pricing_device=device,
+            type=usage_type,
+            date__gte=start,
+            date__lte=end,
+        ).values('type').annotate(total=Sum('value')).order_by()),
+        ('daily devices of a venture', DailyDevice.objects.filter(
+            pricing_venture=venture,
+            date__gte=start,
+            date__lte=end,
+        )),
+        ('daily parts of a device', DailyPart.objects.filter(
+            pricing_device=device,
+            date__gte=start,
+            date__lte=end,
+        )),
+        ('device by name', Device.objects.filter(name=device.name)),
+    ]
+
+
+def explain(query):
+    """Return the lines of the query plan of the database."""
+
+    sql, params = query.query.sql_with_params()
+    if connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN'
+    else:
+        prefix = 'EXPLAIN'
+    cursor = connection.cursor()
+    cursor.execute('{0} {1}'.format(prefix, sql), params)
+    return [
+        ' '.join(unicode(column) for column in row)
+        for row in cursor.fetchall()
+    ]
+
+
+def measure(query, repeat):
+    """Return the best time of evaluating the query, in milliseconds."""
+
+    best = None
+    for i in range(repeat):
+        started = time.time()
+        list(query.all())
+        elapsed = time.time() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return best * 1000
+
+
+class Command(BaseCommand):
+    """
+    Show the query plans and timings of the report queries on a synthetic
+    dataset, which is rolled back or deleted at the end. Run it before and
+    after migrating to compare the plans of a schema with and without the
+    indexes.
+    """
+
+    help = textwrap.dedent(__doc__).strip()
+    requires_model_validation = True
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--ventures',
+            dest='ventures',
+            type='int',
+            default=20,
+            help="The number of synthetic ventures.",
+        ),
+        make_option(
+            '--devices',
+            dest='devices',
+            type='int',
+            default=200,
+            help="The number of synthetic devices.",
+        ),
+        make_option(
+            '--days',
+            dest='days',
+            type='int',
+            default=30,
+            help="The number of synthetic days.",
+        ),
+        make_option(
+            '--repeat',
+            dest='repeat',
+            type='int',
+            default=5,
+            help="How many times to run every query.",
+        ),
+    )
+
+    def handle(self, ventures, devices, days, repeat, *args, **options):
+        run = uuid.uuid4().hex[:8]
+        # The dataset is rolled back, and the data versions of all the days
+        # aren't bumped for its usage types.
+        for signal, dispatch_uid in DATA_VERSION_SIGNALS:
+            signal.disconnect(sender=UsageType, dispatch_uid=dispatch_uid)
+        try:
+            with transaction.commit_manually():
+                try:
+                    self.run_benchmark(
+                        run,
+                        ventures,
+                        devices,
+                        days,
+                        repeat,
+                    )
+                finally:
+                    print('Deleting the dataset...')
+                    transaction.rollback()
+                    # SQLite commits before the EXPLAIN statements.
+                    delete_dataset(run)
+                    transaction.commit()
+        finally:
+            for signal, dispatch_uid in DATA_VERSION_SIGNALS:
+                signal.connect(
+                    bump_all_data_version,
+                    sender=UsageType,
+                    dispatch_uid=dispatch_uid,
+                )
+
+    def run_benchmark(self, run, ventures, devices, days, repeat):
+        end = datetime.date.today()
+        start = end - datetime.timedelta(days=days - 1)
+        print('Creating the dataset...')
+        venture_objects, device_objects, usage_types = create_dataset(
+            run,
+            ventures,
+            devices,
+            days,
+            start,
+        )
+        queries = get_queries(
+            venture_objects[-1],
+            device_objects[-1],
+            usage_types[-1],
+            start,
+            end,
+        )
+        for name, query in queries:
+            print('{0}: {1:.2f} ms'.format(name, measure(query, repeat)))
+            for line in explain(query):
+                print('    {0}'.format(line))
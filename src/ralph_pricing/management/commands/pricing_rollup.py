@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import textwrap
+import datetime
+from optparse import make_option
+
+from dateutil import rrule
+from django.core.management.base import BaseCommand, CommandError
+
+from ralph_pricing.models import bump_data_version
+from ralph_pricing.plugins.rollup import update_daily_venture_costs
+
+
+class Command(BaseCommand):
+    """Roll up the daily venture costs for a range of dates"""
+
+    help = textwrap.dedent(__doc__).strip()
+    requires_model_validation = True
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--start',
+            dest='start',
+            default=None,
+            help="The first date to roll up, defaults to today.",
+        ),
+        make_option(
+            '--end',
+            dest='end',
+            default=None,
+            help="The last date to roll up, defaults to the start date.",
+        ),
+    )
+
+    def handle(self, start, end, *args, **options):
+        if start:
+            start = datetime.datetime.strptime(start, '%Y-%m-%d').date()
+        else:
+            start = datetime.date.today()
+        if end:
+            end = datetime.datetime.strptime(end, '%Y-%m-%d').date()
+        else:
+            end = start
+        if start > end:
+            raise CommandError("The start date is after the end date.")
+        for day in rrule.rrule(rrule.DAILY, dtstart=start, until=end):
+            count = update_daily_venture_costs(day.date())
+            print('{0}: {1} venture costs rolled up'.format(
+                day.date().isoformat(),
+                count,
+            ))
+        bump_data_version(start, end)
@@ -7,11 +7,118 @@ from __future__ import unicode_literals
 
 import textwrap
 import datetime
+import itertools
+import multiprocessing
+import time
+from multiprocessing.queues import SimpleQueue
 from optparse import make_option
 
-from django.core.management.base import BaseCommand
+from dateutil import rrule
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_connection
 
 from ralph.util import plugin
+from ralph_pricing import sync
+from ralph_pricing.models import Backfill, BackfillDay, bump_data_version
+
+
+TIMELINE_WIDTH = 40
+
+
+def sync_day(args):
+    """
+    Run all the plugins of the ``chain`` and the rollup for the ``date``
+    of a backfill, possibly in a worker process, and record the finished
+    day. Returns the date, the names of the failed plugins and the time
+    it took.
+    """
+
+    backfill_id, chain, date = args
+    started = time.time()
+    results = list(sync.run_plugins(chain, date, sync.SerialPool()))
+    if 'rollup' in plugin.BY_NAME.get(chain, {}):
+        results.append(sync.run_plugin(chain, 'rollup', date))
+    bump_data_version(date)
+    failed = sorted(
+        result['name'] for result in results if not result['success']
+    )
+    # The day is synchronised again when its plugins failed before.
+    BackfillDay.objects.filter(backfill_id=backfill_id, date=date).delete()
+    BackfillDay.objects.create(
+        backfill_id=backfill_id,
+        date=date,
+        failed=', '.join(failed),
+    )
+    return date, failed, time.time() - started
+
+
+def get_backfill(start, end=None):
+    """
+    Return the latest unfinished :class:`Backfill` from ``start`` to
+    ``end``, or create a new one. Without ``end``, an unfinished backfill
+    from ``start`` is resumed up to the day it was started for, and a new
+    one ends today.
+    """
+
+    backfills = Backfill.objects.filter(start=start, finished=None)
+    if end is not None:
+        backfills = backfills.filter(end=end)
+    try:
+        return backfills.order_by('-id')[0]
+    except IndexError:
+        return Backfill.objects.create(
+            start=start,
+            end=end or datetime.date.today(),
+        )
+
+
+def run_backfill(chain, backfill, processes=0):
+    """
+    Synchronise all the days of the ``backfill`` in ``processes`` worker
+    processes, or in this one. The plugins writing the rows shared by all
+    the days, :data:`ralph_pricing.sync.SHARED_PLUGINS`, run for one day at
+    a time. The days the backfill already synchronised without failures
+    are skipped, and it is finished when none of its days failed. Yields
+    the results of :func:`sync_day` as the days finish.
+    """
+
+    finished = set(backfill.days.filter(
+        failed='',
+    ).values_list('date', flat=True))
+    days = [
+        (backfill.id, chain, day.date())
+        for day in rrule.rrule(
+            rrule.DAILY,
+            dtstart=backfill.start,
+            until=backfill.end,
+        )
+        if day.date() not in finished
+    ]
+    any_failed = False
+    if processes:
+        # The forked workers open their own database connections.
+        close_connection()
+        # The days run at once, but only one of them writes the ventures
+        # and the devices at a time.
+        pool = multiprocessing.Pool(
+            processes,
+            sync.init_worker,
+            (None, multiprocessing.RLock()),
+        )
+        try:
+            for result in pool.imap_unordered(sync_day, days):
+                any_failed = any_failed or bool(result[1])
+                yield result
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for result in itertools.imap(sync_day, days):
+            any_failed = any_failed or bool(result[1])
+            yield result
+    if not any_failed:
+        backfill.finished = datetime.datetime.now()
+        backfill.save()
 
 
 class Command(BaseCommand):
@@ -30,26 +137,80 @@ class Command(BaseCommand):
             '--run-only',
             dest='run_only',
             default=None,
-            help="Run only the selected plugin, ignore dependencies.",
+            help="Run only the selected plugin and the rollup, ignore "
+                 "dependencies.",
+        ),
+        make_option(
+            '--parallel',
+            dest='parallel',
+            type='int',
+            default=0,
+            help="Run the independent plugins, or the days of a backfill, "
+                 "in that many processes.",
+        ),
+        make_option(
+            '--start',
+            dest='start',
+            default=None,
+            help="Synchronise all the days from this date to --end.",
+        ),
+        make_option(
+            '--end',
+            dest='end',
+            default=None,
+            help="The last date to synchronise, defaults to the end of "
+                 "an unfinished run from --start, or today.",
         ),
     )
 
-    def handle(self, today, run_only, *args, **options):
-        from ralph_pricing import plugins  # noqa
-        if today:
-            today = datetime.datetime.strptime(today, '%Y-%m-%d').date()
-        else:
-            today = datetime.date.today()
-        print('Synchronizing for {0}.'.format(today.isoformat()))
-        if run_only:
-            print('Running only {0}...'.format(run_only))
-            success, message, context = plugin.run(
-                'pricing',
-                run_only,
-                today=today,
+    def run_plugin(self, name, today):
+        """Run the plugin and print its result and the rows it wrote."""
+
+        sync.reset_counts()
+        success, message, context = plugin.run('pricing', name, today=today)
+        self.print_result({
+            'success': success,
+            'message': message,
+            'counts': sync.counts,
+        })
+        return success
+
+    def print_result(self, result):
+        print('{1}: {0}'.format(
+            result['message'],
+            'Done' if result['success'] else 'Failed',
+        ))
+        if result['counts']:
+            print('{0} rows written, {1} unchanged rows skipped.'.format(
+                result['counts'].get('written', 0),
+                result['counts'].get('skipped', 0),
+            ))
+
+    def print_timeline(self, results, started):
+        """Print when every plugin ran, relative to the start of the sync."""
+
+        total = max(result['finished'] for result in results) - started
+        scale = TIMELINE_WIDTH / (total or 1)
+        print('Timeline:')
+        for result in sorted(results, key=lambda result: result['started']):
+            begin = result['started'] - started
+            end = result['finished'] - started
+            bar = ' ' * int(begin * scale) + '#' * max(
+                1,
+                int(end * scale) - int(begin * scale),
             )
-            print('{1}: {0}'.format(message, 'Done' if success else 'Failed'))
-            return
+            print('{0:<16} {1:8.1f}s {2:8.1f}s {3:<{4}} {5}'.format(
+                result['name'],
+                begin,
+                end,
+                bar,
+                TIMELINE_WIDTH,
+                'Done' if result['success'] else 'Failed',
+            ))
+
+    def run_sequential(self, today):
+        """Run the plugins one at a time, in the order of their priority."""
+
         done = set()
         tried = set()
         while True:
@@ -59,9 +220,109 @@ class Command(BaseCommand):
             name = plugin.highest_priority('pricing', to_run)
             tried.add(name)
             print('Running {0}...'.format(name))
-            success, message, context = plugin.run(
-                'pricing', name, today=today,
-            )
-            print('{1}: {0}'.format(message, 'Done' if success else 'Failed'))
-            if success:
+            if self.run_plugin(name, today):
                 done.add(name)
+
+    def run_parallel(self, processes, today):
+        """Run the plugins in a pool of processes, as soon as they can."""
+
+        # The forked workers open their own database connections.
+        close_connection()
+        started_plugins = SimpleQueue()
+        pool = multiprocessing.Pool(
+            processes,
+            sync.init_worker,
+            (started_plugins, multiprocessing.RLock()),
+        )
+        started = time.time()
+        results = []
+        try:
+            for result in sync.run_plugins(
+                'pricing',
+                today,
+                pool,
+                started_plugins,
+            ):
+                print('Finished {0}...'.format(result['name']))
+                self.print_result(result)
+                results.append(result)
+        finally:
+            pool.terminate()
+            pool.join()
+        requirements = sync.get_requirements('pricing')
+        ran = set(result['name'] for result in results)
+        done = set(result['name'] for result in results if result['success'])
+        for name in sorted(set(requirements) - ran):
+            # The plugins that never run on their own aren't mentioned.
+            failed = requirements[name] & (set(requirements) - done)
+            if failed:
+                print('Skipped {0}, it requires {1}.'.format(
+                    name,
+                    ', '.join(sorted(failed)),
+                ))
+        if results:
+            self.print_timeline(results, started)
+
+    def backfill(self, start, end, processes):
+        """Synchronise all the days of the range, or resume doing it."""
+
+        backfill = get_backfill(start, end)
+        print('Synchronizing from {0} to {1}.'.format(
+            backfill.start.isoformat(),
+            backfill.end.isoformat(),
+        ))
+        for date, failed, elapsed in run_backfill(
+            'pricing',
+            backfill,
+            processes,
+        ):
+            if failed:
+                print('{0}: failed {1} in {2:.1f}s'.format(
+                    date.isoformat(),
+                    ', '.join(failed),
+                    elapsed,
+                ))
+            else:
+                print('{0}: done in {1:.1f}s'.format(
+                    date.isoformat(),
+                    elapsed,
+                ))
+
+    def handle(self, today, run_only, parallel, start, end, *args, **options):
+        from ralph_pricing import plugins  # noqa
+        if start or end:
+            if today or run_only:
+                raise CommandError(
+                    "--start and --end can't be used with --today "
+                    "or --run-only.",
+                )
+            if not start:
+                raise CommandError("The start date is required.")
+            start = datetime.datetime.strptime(start, '%Y-%m-%d').date()
+            if end:
+                end = datetime.datetime.strptime(end, '%Y-%m-%d').date()
+            if start > (end or datetime.date.today()):
+                raise CommandError("The start date is after the end date.")
+            self.backfill(start, end, parallel)
+            return
+        if today:
+            today = datetime.datetime.strptime(today, '%Y-%m-%d').date()
+        else:
+            today = datetime.date.today()
+        print('Synchronizing for {0}.'.format(today.isoformat()))
+        if run_only:
+            print('Running only {0}...'.format(run_only))
+            self.run_plugin(run_only, today)
+            if run_only != 'rollup':
+                print('Running rollup...')
+                self.run_plugin('rollup', today)
+            bump_data_version(today)
+            return
+        if parallel:
+            self.run_parallel(parallel, today)
+        else:
+            self.run_sequential(today)
+        print('Running rollup...')
+        self.run_plugin('rollup', today)
+        # The cached reports covering this day are computed again.
+        bump_data_version(today)
@@ -5,32 +5,33 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-from ralph_pricing.models import Venture, UsageType
+from ralph_pricing.models import UsageType, get_venture_tree
 
 from bob.menu import MenuItem
 
 
 def ventures_menu(href='', selected=None):
+    tree = get_venture_tree()
     top_items = []
     stack = [
-        (None, top_items, Venture.objects.root_nodes()),
+        (None, top_items, tree.children[None]),
     ]
     while stack:
-        parent, items, ventures = stack.pop()
-        for venture in ventures.order_by('name'):
+        parent, items, venture_ids = stack.pop()
+        for venture_id in venture_ids:
             item = MenuItem(
-                venture.name,
-                name='{}'.format(venture.id),
+                tree.names[venture_id],
+                name='{}'.format(venture_id),
                 subitems=[],
                 fugue_icon='fugue-store-medium',
                 indent=' ',
-                href='{}/{}/'.format(href, venture.id),
+                href='{}/{}/'.format(href, venture_id),
                 collapsed=True,
                 collapsible=True,
             )
             item.parent = parent
             items.append(item)
-            stack.append((item, item.subitems, venture.get_children()))
+            stack.append((item, item.subitems, tree.children[venture_id]))
             if item.name == selected:
                 while item:
                     item.kwargs['collapsed'] = False
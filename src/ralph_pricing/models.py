@@ -5,46 +5,210 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import bisect
+import collections
+import datetime
 from decimal import Decimal as D
-from dateutil import rrule
 
+from django.conf import settings
+from django.core.cache import get_cache
 from django.db import models as db
+from django.db.transaction import commit_on_success
 from django.utils.translation import ugettext_lazy as _
 
 from mptt.models import MPTTModel, TreeForeignKey
+import django_rq
+
+from ralph_pricing import sync
 
 
 PRICE_DIGITS = 16
 PRICE_PLACES = 6
+MULTIPLE_PRICES = object()
+# The venture of a device usage that keeps the venture it already has
+UNCHANGED_VENTURE = object()
+# The cache of the reports and of the data they share
+CACHE_NAME = 'reports_pricing'
+if CACHE_NAME not in settings.CACHES:
+    CACHE_NAME = 'default'
+# The queue of the jobs computing the reports and rolling up the costs
+QUEUE_NAME = 'reports_pricing'
+if QUEUE_NAME not in settings.RQ_QUEUES:
+    QUEUE_NAME = None
+VENTURE_TREE_CACHE_KEY = 'ralph_pricing_venture_tree'
+DAILY_USAGE_BATCH = 500
+
+
+def get_usages_count_price_by_type(
+    query,
+    start,
+    end,
+    calendar=None,
+    key=None,
+):
+    """
+    Return a dict of ``{type_id: (count, price)}`` for all the usage types
+    found in ``query`` between ``start`` and ``end``. If ``key`` is given,
+    e.g. ``'pricing_venture'``, the usages are also grouped by that field
+    and the dict is indexed by ``(value_of_key, type_id)`` tuples.
+
+    The usages are summed up per type and day in a single grouped query and
+    then priced with a :class:`PriceCalendar`, which is built for the range
+    if not given. The price of a type is ``None`` if it has no price (or
+    more than one price) defined on any of the days it was used.
+    """
 
-
-def get_usages_count_price(query, start, end):
     days = (end - start).days + 1
+    fields = ['type', 'type__average', 'date']
+    if key is not None:
+        fields.append(key)
+    rows = query.filter(
+        date__gte=start,
+        date__lte=end,
+    ).values(
+        *fields
+    ).annotate(
+        total=db.Sum('value'),
+    ).order_by()
+    rows = list(rows)
+    if calendar is None:
+        calendar = PriceCalendar(
+            types=set(row['type'] for row in rows),
+            start=start,
+            end=end,
+        )
+    result = {}
+    for row in rows:
+        if key is None:
+            group = row['type']
+        else:
+            group = row[key], row['type']
+        count, price = result.get(group, (0, D(0)))
+        daily_count = row['total']
+        if row['type__average']:
+            count += daily_count / days
+        else:
+            count += daily_count
+        try:
+            daily_price = calendar.price_at(row['type'], row['date'])
+        except (
+            UsagePrice.DoesNotExist,
+            UsagePrice.MultipleObjectsReturned,
+        ):
+            price = None
+        else:
+            if price is not None:
+                price += D(daily_count) * daily_price
+        result[group] = count, price
+    return result
+
+
+def get_usages_count_price(query, start, end, calendar=None):
     count = 0
     price = D(0)
-    for day in rrule.rrule(rrule.DAILY, dtstart=start, until=end):
-        daily_count = 0
-        for usage in query.filter(date=day):
-            daily_count = usage.value
-            if usage.type.average:
-                count += daily_count / days
-            else:
-                count += daily_count
-            try:
-                daily_price = usage.type.get_price_at(day)
-            except (
-                UsagePrice.DoesNotExist,
-                UsagePrice.MultipleObjectsReturned,
-            ):
-                price = None
-            else:
-                if price is not None:
-                    price += D(daily_count) * daily_price
+    usages = get_usages_count_price_by_type(query, start, end, calendar)
+    for type_count, type_price in usages.itervalues():
+        count += type_count
+        if type_price is None:
+            price = None
+        elif price is not None:
+            price += type_price
     return count, price
 
 
+def get_named_usages(usages, names=None):
+    """
+    Turn a dict of ``{type_id: (count, price)}`` into a list of dicts with
+    the ``name``, ``count`` and ``price`` of every usage type that has a
+    count or a price, ordered by the type id. The ``names`` of the types
+    are fetched if not given.
+    """
+
+    if names is None:
+        names = dict(UsageType.objects.filter(
+            id__in=usages.keys(),
+        ).values_list('id', 'name'))
+    return [
+        {
+            'name': names[type_id],
+            'count': count,
+            'price': price,
+        }
+        for type_id, (count, price) in sorted(usages.iteritems())
+        if count or price
+    ]
+
+
+def get_daily_usages_by_device(start, end, devices=None, calendar=None):
+    """
+    Return a dict of ``{device_id: [usage, ...]}`` with the usages of the
+    given ``devices`` (ids or objects, all devices if not given) between
+    ``start`` and ``end``, as returned by :func:`get_named_usages`. Only
+    the usage types actually used by the devices are priced.
+    """
+
+    query = DailyUsage.objects.all()
+    if devices is not None:
+        query = query.filter(pricing_device__in=devices)
+    usages = get_usages_count_price_by_type(
+        query,
+        start,
+        end,
+        calendar,
+        key='pricing_device',
+    )
+    names = dict(UsageType.objects.filter(
+        id__in=set(type_id for device_id, type_id in usages),
+    ).values_list('id', 'name'))
+    by_device = collections.defaultdict(dict)
+    if devices is not None:
+        for device in devices:
+            by_device[getattr(device, 'id', device)] = {}
+    for (device_id, type_id), usage in usages.iteritems():
+        by_device[device_id][type_id] = usage
+    return {
+        device_id: get_named_usages(device_usages, names)
+        for device_id, device_usages in by_device.iteritems()
+    }
+
+
+def get_deprecated_statuses_by_device(start, end, venture, devices=None):
+    """
+    Return a dict of ``{device_id: status}`` for the given ``devices`` (ids
+    or objects, all devices if not given) in ``venture`` between ``start``
+    and ``end``, where the status lists the dates on which the deprecation
+    of the device changed, e.g. ``'2013-01-01: False 2013-01-03: True'``.
+    """
+
+    query = DailyDevice.objects.filter(
+        pricing_venture=venture,
+        date__gte=start,
+        date__lte=end,
+    )
+    if devices is not None:
+        query = query.filter(pricing_device__in=devices)
+    statuses = collections.defaultdict(list)
+    last = {}
+    for device_id, date, status in query.values_list(
+        'pricing_device',
+        'date',
+        'is_deprecated',
+    ).order_by('pricing_device', 'date'):
+        if status != last.get(device_id):
+            statuses[device_id].append('%s: %s' % (date, status))
+        last[device_id] = status
+    return {
+        device_id: " ".join(device_statuses)
+        for device_id, device_statuses in statuses.iteritems()
+    }
+
+
 class Device(db.Model):
-    name = db.CharField(verbose_name=_("name"), max_length=255)
+    name = db.CharField(
+        verbose_name=_("name"),
+        max_length=255,
+        db_index=True,
+    )
     sn = db.CharField(max_length=200, null=True, blank=True)
     barcode = db.CharField(max_length=200, null=True, blank=True, default=None)
     device_id = db.IntegerField(
@@ -70,55 +234,23 @@ class Device(db.Model):
         return '{} - {}'.format(self.name, self.device_id)
 
     def get_deprecated_status(self, start, end, venture):
-        query = self.dailydevice_set.filter(
-            pricing_venture=venture,
-            date__gte=start,
-            date__lte=end,
-        )
-        statuses = []
-        last = None
-        for daily_device in query:
-            status = daily_device.is_deprecated
-            if status != last:
-                data = '%s: %s' % (daily_device.date, status)
-                statuses.append(data)
-            last = status
-        return " ".join(statuses)
-
-    def get_daily_usages(self, start, end):
-        query = DailyUsage.objects.filter(pricing_device=self)
-        for type_ in UsageType.objects.all():
-            count, price = get_usages_count_price(
-                query.filter(type=type_),
-                start,
-                end,
-            )
-            if count or price:
-                yield {
-                    'name': type_.name,
-                    'count': count,
-                    'price': price,
-                }
+        return get_deprecated_statuses_by_device(
+            start,
+            end,
+            venture,
+            [self.id],
+        ).get(self.id, '')
+
+    def get_daily_usages(self, start, end, calendar=None):
+        return get_daily_usages_by_device(
+            start,
+            end,
+            [self.id],
+            calendar,
+        )[self.id]
 
     def get_daily_parts(self, start, end):
-        ids = self.dailypart_set.filter(
-            pricing_device=self.id,
-            date__gte=start,
-            date__lte=end,
-        ).values_list('asset_id', flat=True)
-        parts = []
-        for asset_id in set(ids):
-            price, cost = get_daily_price_cost(asset_id, self, start, end)
-            parts.append(
-                {
-                    'name': self.dailypart_set.filter(
-                        asset_id=asset_id
-                    )[0].name,
-                    'price': price,
-                    'cost': cost,
-                }
-            )
-        return parts
+        return get_daily_parts_by_device(start, end, [self.id])[self.id]
 
 
 class ParentDevice(Device):
@@ -176,7 +308,9 @@ class Venture(MPTTModel):
 
     def _by_venture(self, query, descendants):
         if descendants:
-            ventures = self.get_descendants(include_self=True)
+            ventures = get_venture_tree().descendants.get(self.id)
+            if ventures is None:
+                ventures = self.get_descendants(include_self=True)
             return query.filter(pricing_venture__in=ventures)
         return query.filter(pricing_venture=self)
 
@@ -215,23 +349,20 @@ class Venture(MPTTModel):
         return total_count / days, total_price / days, total_cost
 
     def get_usages_count_price(
-        self, start, end, type_, descendants=False, query=None
+        self, start, end, type_, descendants=False, query=None, calendar=None,
     ):
         if query is None:
             query = DailyUsage.objects
         query = query.filter(type=type_)
         query = self._by_venture(query, descendants)
         query = query.filter(date__gte=start, date__lte=end)
-        return get_usages_count_price(query, start, end)
+        return get_usages_count_price(query, start, end, calendar)
 
     def get_extra_costs(self, start, end, type_, descendants=False):
-        price = D('0')
         query = ExtraCost.objects.filter(type=type_)
         query = self._by_venture(query, descendants)
-        for day in rrule.rrule(rrule.DAILY, dtstart=start, until=end):
-            extras = query.filter(start__lte=day, end__gte=day)
-            price += extras.aggregate(db.Sum('price'))['price__sum'] or 0
-        return price
+        extra_costs = get_extra_costs_by_venture(start, end, query)
+        return sum(extra_costs.itervalues(), D('0'))
 
     def get_extracost_details(self, start, end):
         extracost = ExtraCost.objects.filter(
@@ -241,21 +372,124 @@ class Venture(MPTTModel):
         )
         return extracost
 
-    def get_daily_usages(self, start, end):
+    def get_daily_usages(self, start, end, calendar=None):
         query = DailyUsage.objects.filter(pricing_device=None)
         query = self._by_venture(query, descendants=False)
-        for type_ in UsageType.objects.all():
-            count, price = get_usages_count_price(
-                query.filter(type=type_),
-                start,
-                end,
-            )
-            if count or price:
-                yield {
-                    'name': type_.name,
-                    'count': count,
-                    'price': price,
-                }
+        usages = get_usages_count_price_by_type(query, start, end, calendar)
+        return get_named_usages(usages)
+
+
+class VentureTree(object):
+    """
+    An index of the whole venture tree, built from a single query in one
+    pass over the ventures in tree order. For every venture id it holds the
+    ``names``, the full ``paths`` (e.g. ``'a/b/c'``), the ``depths``, the
+    ids of the ``descendants`` (including the venture itself) and the ids
+    of the ``children`` ordered by name, with the roots under ``None``.
+
+    Use :func:`get_venture_tree` to get the cached instance.
+    """
+
+    def __init__(self):
+        self.names = {}
+        self.paths = {}
+        self.depths = {}
+        self.descendants = {}
+        self.children = {None: []}
+        ancestors = {}
+        for venture_id, parent_id, name in Venture.objects.order_by(
+            'tree_id',
+            'lft',
+        ).values_list('id', 'parent_id', 'name'):
+            self.names[venture_id] = name
+            if parent_id in self.paths:
+                self.paths[venture_id] = '{}/{}'.format(
+                    self.paths[parent_id],
+                    name,
+                )
+                self.depths[venture_id] = self.depths[parent_id] + 1
+                ancestors[venture_id] = ancestors[parent_id] + (venture_id,)
+            else:
+                parent_id = None
+                self.paths[venture_id] = name
+                self.depths[venture_id] = 0
+                ancestors[venture_id] = (venture_id,)
+            self.descendants[venture_id] = set()
+            for ancestor_id in ancestors[venture_id]:
+                self.descendants[ancestor_id].add(venture_id)
+            self.children.setdefault(parent_id, []).append(venture_id)
+            self.children.setdefault(venture_id, [])
+        for children in self.children.itervalues():
+            children.sort(key=lambda venture_id: self.names[venture_id])
+
+
+def get_venture_tree():
+    """Return the cached :class:`VentureTree`, building it if needed."""
+
+    cache = get_cache(CACHE_NAME)
+    tree = cache.get(VENTURE_TREE_CACHE_KEY)
+    if tree is None:
+        tree = VentureTree()
+        cache.set(VENTURE_TREE_CACHE_KEY, tree)
+    return tree
+
+
+def invalidate_venture_tree(**kwargs):
+    """Drop the cached :class:`VentureTree` after the ventures changed."""
+
+    get_cache(CACHE_NAME).delete(VENTURE_TREE_CACHE_KEY)
+
+
+db.signals.post_save.connect(
+    invalidate_venture_tree,
+    sender=Venture,
+    dispatch_uid='ralph_pricing.venture_tree.save',
+)
+db.signals.post_delete.connect(
+    invalidate_venture_tree,
+    sender=Venture,
+    dispatch_uid='ralph_pricing.venture_tree.delete',
+)
+
+
+def get_subtree_totals(ventures, values):
+    """
+    Return a dict of ``{venture_id: totals}``, where the totals of every
+    venture are the sums of the ``values`` of that venture and all of its
+    descendants. ``values`` is a dict of ``{venture_id: {key: number}}``,
+    a ``None`` number makes the total of that key ``None`` as well.
+
+    The ventures must include whole trees. The descendants are found from
+    their MPTT fields in a single bottom-up pass, without any queries.
+    """
+
+    totals = {}
+    stack = []
+
+    def close():
+        venture = stack.pop()
+        if not stack:
+            return
+        parent_totals = totals[stack[-1].id]
+        for key, value in totals[venture.id].iteritems():
+            if key not in parent_totals:
+                parent_totals[key] = value
+            elif value is None or parent_totals[key] is None:
+                parent_totals[key] = None
+            else:
+                parent_totals[key] += value
+
+    for venture in sorted(ventures, key=lambda v: (v.tree_id, v.lft)):
+        while stack and (
+            stack[-1].tree_id != venture.tree_id or
+            stack[-1].rght < venture.lft
+        ):
+            close()
+        stack.append(venture)
+        totals[venture.id] = dict(values.get(venture.id, {}))
+    while stack:
+        close()
+    return totals
 
 
 class DailyPart(db.Model):
@@ -283,6 +517,7 @@ class DailyPart(db.Model):
     class Meta:
         verbose_name = _("daily part")
         verbose_name_plural = _("daily parts")
+        # Also indexed on (pricing_device, date) by migration 0010.
         unique_together = ('date', 'asset_id')
         ordering = ('asset_id', 'pricing_device', 'date')
 
@@ -312,6 +547,64 @@ def get_daily_price_cost(asset_id, device, start, end):
     return total_price / days, total_cost
 
 
+def get_daily_parts_by_device(start, end, devices=None, zero_deprecated=True):
+    """
+    Return a dict of ``{device_id: [part, ...]}`` for the parts of the
+    given ``devices`` (ids or objects, all devices if not given) between
+    ``start`` and ``end``, where each part is a dict with the ``asset_id``,
+    the latest ``name``, the average ``price`` and the summed ``cost``.
+
+    The parts are fetched with a single query grouped by device, asset,
+    name and the daily price fields, which rarely change, so that every
+    group only has to be priced once.
+    """
+
+    days = (end - start).days + 1
+    query = DailyPart.objects.filter(date__gte=start, date__lte=end)
+    if devices is not None:
+        query = query.filter(pricing_device__in=devices)
+    rows = query.values(
+        'pricing_device',
+        'asset_id',
+        'name',
+        'price',
+        'deprecation_rate',
+        'is_deprecated',
+    ).annotate(
+        days=db.Count('id'),
+        last=db.Max('date'),
+    ).order_by()
+    parts = {}
+    for row in rows:
+        key = row['pricing_device'], row['asset_id']
+        part = parts.get(key)
+        if part is None:
+            part = parts[key] = {
+                'asset_id': row['asset_id'],
+                'name': row['name'],
+                'last': row['last'],
+                'price': D(0),
+                'cost': D(0),
+            }
+        elif row['last'] > part['last']:
+            part['name'] = row['name']
+            part['last'] = row['last']
+        if zero_deprecated and row['is_deprecated']:
+            continue
+        price = row['price'] * row['days']
+        part['price'] += price
+        part['cost'] += price * row['deprecation_rate'] / 36500
+    result = collections.defaultdict(list)
+    if devices is not None:
+        for device in devices:
+            result[getattr(device, 'id', device)] = []
+    for (device_id, asset_id), part in sorted(parts.iteritems()):
+        del part['last']
+        part['price'] /= days
+        result[device_id].append(part)
+    return dict(result)
+
+
 class DailyDevice(db.Model):
     date = db.DateField()
     name = db.CharField(verbose_name=_("name"), max_length=255)
@@ -357,24 +650,29 @@ class DailyDevice(db.Model):
     class Meta:
         verbose_name = _("daily device")
         verbose_name_plural = _("daily devices")
+        # Also indexed on (pricing_venture, date) by migration 0010.
         unique_together = ('date', 'pricing_device')
 
     def __unicode__(self):
         return '{} ({})'.format(self.name, self.date)
 
-    def get_price_cost(self, zero_deprecated=True):
+    def get_price_cost(self, zero_deprecated=True, daily_parts=None):
         """
         Return the price and daily cost of the device on that day.
         This only includes the price of the asset itself, not the
         prices of its parents (in case of blade systems).
+
+        Pass ``daily_parts`` to use already fetched parts of the device.
         """
 
         total_price = D('0')
         total_cost = D('0')
-        # If the device has parts, sum them up
-        for daily_part in self.pricing_device.dailypart_set.filter(
+        if daily_parts is None:
+            daily_parts = self.pricing_device.dailypart_set.filter(
                 date=self.date,
-        ):
+            )
+        # If the device has parts, sum them up
+        for daily_part in daily_parts:
             price, cost = daily_part.get_price_cost()
             total_price += price
             total_cost += cost
@@ -390,23 +688,30 @@ class DailyDevice(db.Model):
         self,
         zero_deprecated=True,
         daily_parent=None,
+        daily_parts=None,
     ):
         """
         Return the fraction of the price and cost of the blade system
         containing this device.
+
+        Pass ``daily_parts`` to use already fetched parts of the blade
+        system.
         """
 
         total_price = D('0')
         total_cost = D('0')
         if (
             not self.pricing_device.is_blade or
-            not self.parent or
+            not self.parent_id or
             not self.pricing_device.slots
         ):
             return total_price, total_cost
         if not daily_parent:
             try:
-                daily_parent = self.parent.dailydevice_set.filter(
+                daily_parent = DailyDevice.objects.select_related(
+                    'pricing_device',
+                ).get(
+                    pricing_device=self.parent_id,
                     date=self.date,
                 )
             except DailyDevice.DoesNotExist:
@@ -414,6 +719,7 @@ class DailyDevice(db.Model):
         if daily_parent and daily_parent.pricing_device.slots:
             system_price, system_cost = daily_parent.get_price_cost(
                 zero_deprecated,
+                daily_parts,
             )
             system_fraction = (
                 D(self.pricing_device.slots) /
@@ -423,28 +729,145 @@ class DailyDevice(db.Model):
             total_price += system_price * system_fraction
         return total_price, total_cost
 
-    def get_blades_price_cost(self, zero_deprecated=True):
+    def get_blades_price_cost(
+        self,
+        zero_deprecated=True,
+        daily_blades=None,
+        daily_parts=None,
+    ):
         """
         Return the prices and costs that the blades contained in a blade
         system subtract from that blade system.
+
+        Pass ``daily_blades`` and ``daily_parts`` to use already fetched
+        blades and parts of the blade system.
         """
 
         total_price = D('0')
         total_cost = D('0')
         if self.pricing_device.slots and not self.pricing_device.is_blade:
-            for blade in self.pricing_device.children_set.filter(
+            if daily_blades is None:
+                daily_blades = DailyDevice.objects.filter(
+                    parent=self.pricing_device_id,
                     date=self.date,
                     pricing_device__is_blade=True,
-            ):
+                ).select_related('pricing_device')
+            for blade in daily_blades:
                 price, cost = blade.get_bladesystem_price_cost(
                     zero_deprecated,
                     self,
+                    daily_parts,
                 )
                 total_price += price
                 total_cost += cost
         return total_price, total_cost
 
 
+def get_assets_count_price_cost_by_venture(
+    start,
+    end,
+    query=None,
+    zero_deprecated=True,
+    key='pricing_venture_id',
+):
+    """
+    Return a dict of ``{venture_id: (count, price, cost)}`` for all the
+    ventures of the daily devices in ``query`` between ``start`` and ``end``,
+    with the same values as :meth:`Venture.get_assets_count_price_cost`.
+
+    The daily devices, their parts, blade systems and blades are fetched for
+    the whole range in a few queries and indexed by device and date, instead
+    of being queried for every daily device. Use ``key`` to group the
+    results by another attribute of the daily devices, e.g.
+    ``'pricing_device_id'``.
+    """
+
+    days = (end - start).days + 1
+    if query is None:
+        query = DailyDevice.objects
+    query = query.filter(
+        pricing_device__is_virtual=False,
+        date__gte=start,
+        date__lte=end,
+    ).select_related('pricing_device')
+    daily_devices = list(query)
+    device_ids = set()
+    parent_ids = set()
+    system_ids = set()
+    for daily_device in daily_devices:
+        device = daily_device.pricing_device
+        device_ids.add(device.id)
+        if device.is_blade and daily_device.parent_id and device.slots:
+            parent_ids.add(daily_device.parent_id)
+        if device.slots and not device.is_blade:
+            system_ids.add(device.id)
+    daily_parents = {}
+    if parent_ids:
+        for daily_parent in DailyDevice.objects.filter(
+            pricing_device__in=parent_ids,
+            date__gte=start,
+            date__lte=end,
+        ).select_related('pricing_device'):
+            daily_parents[
+                daily_parent.pricing_device_id,
+                daily_parent.date,
+            ] = daily_parent
+    daily_blades = collections.defaultdict(list)
+    if system_ids:
+        for daily_blade in DailyDevice.objects.filter(
+            parent__in=system_ids,
+            date__gte=start,
+            date__lte=end,
+            pricing_device__is_blade=True,
+        ).select_related('pricing_device'):
+            daily_blades[
+                daily_blade.parent_id,
+                daily_blade.date,
+            ].append(daily_blade)
+    daily_parts = collections.defaultdict(list)
+    if device_ids:
+        for daily_part in DailyPart.objects.filter(
+            pricing_device__in=device_ids | parent_ids,
+            date__gte=start,
+            date__lte=end,
+        ):
+            daily_parts[
+                daily_part.pricing_device_id,
+                daily_part.date,
+            ].append(daily_part)
+    totals = {}
+    for daily_device in daily_devices:
+        index = daily_device.pricing_device_id, daily_device.date
+        asset_price, asset_cost = daily_device.get_price_cost(
+            zero_deprecated,
+            daily_parts[index],
+        )
+        parent_index = daily_device.parent_id, daily_device.date
+        daily_parent = daily_parents.get(parent_index)
+        if daily_parent is None:
+            system_price, system_cost = D('0'), D('0')
+        else:
+            system_price, system_cost = daily_device.get_bladesystem_price_cost(  # noqa
+                zero_deprecated,
+                daily_parent,
+                daily_parts[parent_index],
+            )
+        blades_price, blades_cost = daily_device.get_blades_price_cost(
+            zero_deprecated,
+            daily_blades[index],
+            daily_parts[index],
+        )
+        group = getattr(daily_device, key)
+        count, price, cost = totals.get(group, (0, D('0'), D('0')))
+        price += asset_price + system_price - blades_price
+        cost += asset_cost + system_cost - blades_cost
+        totals[group] = count + 1, price, cost
+    return dict(
+        (group, (count / days, price / days, cost))
+        for group, (count, price, cost) in totals.iteritems()
+    )
+
+
 class UsageType(db.Model):
     name = db.CharField(verbose_name=_("name"), max_length=255, unique=True)
     average = db.BooleanField(
@@ -467,7 +890,9 @@ class UsageType(db.Model):
     def __unicode__(self):
         return self.name
 
-    def get_price_at(self, date):
+    def get_price_at(self, date, calendar=None):
+        if calendar is not None:
+            return calendar.price_at(self, date)
         return self.usageprice_set.get(start__lte=date, end__gte=date).price
 
 
@@ -494,6 +919,126 @@ class UsagePrice(db.Model):
         return '{} ({}-{})'.format(self.type, self.start, self.end)
 
 
+class PriceCalendar(object):
+    """
+    The usage prices of all (or only the selected) usage types, loaded with
+    a single query and split into sorted, non-overlapping segments, so that
+    the price on any day can be found with a bisect instead of a query.
+
+    Build one calendar per report and pass it down to the pricing methods.
+    It is not updated when the usage prices change.
+    """
+
+    def __init__(self, types=None, start=None, end=None):
+        query = UsagePrice.objects.order_by('type', 'start')
+        if types is not None:
+            query = query.filter(type__in=types)
+        if start is not None:
+            query = query.filter(end__gte=start)
+        if end is not None:
+            query = query.filter(start__lte=end)
+        intervals = collections.defaultdict(list)
+        for type_id, price_start, price_end, price in query.values_list(
+            'type', 'start', 'end', 'price',
+        ):
+            intervals[type_id].append((price_start, price_end, price))
+        self._segments = {}
+        self._starts = {}
+        for type_id, type_intervals in intervals.iteritems():
+            segments = self._split(type_intervals)
+            self._segments[type_id] = segments
+            self._starts[type_id] = [segment[0] for segment in segments]
+
+    @staticmethod
+    def _split(intervals):
+        """
+        Split possibly overlapping ``(start, end, price)`` intervals into
+        segments that don't overlap. Segments covered by more than one
+        interval get the ``MULTIPLE_PRICES`` marker instead of a price.
+        """
+
+        bounds = set()
+        for start, end, price in intervals:
+            bounds.add(start)
+            bounds.add(end + datetime.timedelta(days=1))
+        bounds = sorted(bounds)
+        segments = []
+        for start, next_start in zip(bounds, bounds[1:]):
+            end = next_start - datetime.timedelta(days=1)
+            prices = [
+                price for interval_start, interval_end, price in intervals
+                if interval_start <= start and end <= interval_end
+            ]
+            if not prices:
+                continue
+            if len(prices) > 1:
+                segments.append((start, end, MULTIPLE_PRICES))
+            else:
+                segments.append((start, end, prices[0]))
+        return segments
+
+    def _find(self, type_id, date):
+        starts = self._starts.get(type_id, [])
+        index = bisect.bisect_right(starts, date) - 1
+        if index < 0:
+            return None
+        start, end, price = self._segments[type_id][index]
+        if end < date:
+            return None
+        return price
+
+    def price_at(self, type_, date):
+        """
+        Return the price of the usage type on the given day. Like
+        ``usageprice_set.get`` it raises ``UsagePrice.DoesNotExist`` if there
+        is no price and ``UsagePrice.MultipleObjectsReturned`` if there are
+        overlapping prices defined for that day.
+        """
+
+        price = self._find(getattr(type_, 'id', type_), date)
+        if price is None:
+            raise UsagePrice.DoesNotExist(
+                "No price for {} at {}.".format(type_, date),
+            )
+        if price is MULTIPLE_PRICES:
+            raise UsagePrice.MultipleObjectsReturned(
+                "Multiple prices for {} at {}.".format(type_, date),
+            )
+        return price
+
+    def price_segments(self, type_, start, end):
+        """
+        Return a list of ``(start, end, price)`` tuples covering every day
+        between ``start`` and ``end``. The price is ``None`` for the days
+        with no price and ``MULTIPLE_PRICES`` for the days with overlapping
+        prices.
+        """
+
+        type_id = getattr(type_, 'id', type_)
+        starts = self._starts.get(type_id, [])
+        segments = self._segments.get(type_id, [])
+        result = []
+        day = start
+        index = max(bisect.bisect_right(starts, start) - 1, 0)
+        for segment_start, segment_end, price in segments[index:]:
+            if day > end:
+                break
+            if segment_end < day:
+                continue
+            if segment_start > day:
+                gap_end = min(end, segment_start - datetime.timedelta(days=1))
+                result.append((day, gap_end, None))
+                day = gap_end + datetime.timedelta(days=1)
+                if day > end:
+                    break
+            segment_end = min(end, segment_end)
+            result.append((day, segment_end, price))
+            day = segment_end + datetime.timedelta(days=1)
+        if day <= end:
+            result.append((day, end, None))
+        return result
+
+
 class DailyUsage(db.Model):
     date = db.DateField()
     pricing_venture = db.ForeignKey(
@@ -518,6 +1063,8 @@ class DailyUsage(db.Model):
     class Meta:
         verbose_name = _("daily usage")
         verbose_name_plural = _("daily usages")
+        # Also indexed on (pricing_venture, type, date) and
+        # (pricing_device, type, date) by migration 0010.
         unique_together = ('date', 'pricing_device', 'type')
         ordering = ('pricing_device', 'type', 'date')
 
@@ -530,6 +1077,161 @@ class DailyUsage(db.Model):
         )
 
 
+def _get_pk(value):
+    return value.pk if isinstance(value, db.Model) else value
+
+
+def _get_ids_by_ralph_id(model, field, ralph_ids):
+    ralph_ids = list(set(ralph_ids))
+    ids = {}
+    for index in xrange(0, len(ralph_ids), DAILY_USAGE_BATCH):
+        ids.update(model.objects.filter(**{
+            '{}__in'.format(field): ralph_ids[index:index + DAILY_USAGE_BATCH],
+        }).values_list(field, 'id'))
+    missing = [ralph_id for ralph_id in ralph_ids if ralph_id not in ids]
+    if missing:
+        with sync.shared_lock():
+            for ralph_id in missing:
+                ids[ralph_id] = model.objects.get_or_create(
+                    **{field: ralph_id}
+                )[0].id
+    return ids
+
+
+def get_device_ids(device_ids):
+    """
+    Return a dict of ``{device_id: id}`` of the devices with the given
+    Ralph ids, creating the missing ones.
+    """
+
+    return _get_ids_by_ralph_id(Device, 'device_id', device_ids)
+
+
+def get_venture_ids(venture_ids):
+    """
+    Return a dict of ``{venture_id: id}`` of the ventures with the given
+    Ralph ids, creating the missing ones.
+    """
+
+    return _get_ids_by_ralph_id(Venture, 'venture_id', venture_ids)
+
+
+@commit_on_success
+def _create_daily_usages(usages):
+    DailyUsage.objects.bulk_create(usages)
+
+
+@commit_on_success
+def _update_daily_usages(changes):
+    for (venture_id, value), ids in changes.iteritems():
+        DailyUsage.objects.filter(id__in=ids).update(
+            pricing_venture=venture_id,
+            value=value,
+        )
+
+
+@commit_on_success
+def _delete_daily_usages(ids):
+    DailyUsage.objects.filter(id__in=ids).delete()
+
+
+def update_daily_usages(usages, batch_size=DAILY_USAGE_BATCH):
+    """
+    Save the usages given as ``(date, type, device, venture, value)``
+    tuples, where the type, device and venture are objects or their ids and
+    the device or the venture can be ``None``. There is a single usage of a
+    type on a day for every device, or for every venture if the device is
+    ``None``, the later of the same usages given wins. The usages of the
+    devices given with the venture ``UNCHANGED_VENTURE`` keep the venture
+    they already have, or get none if they are new.
+
+    The existing usages of the given days and types are read with a query
+    per day, the missing ones are bulk created and only the changed ones
+    are updated, in transactions of ``batch_size`` rows. Returns the numbers
+    of the created and updated usages.
+    """
+
+    days = collections.defaultdict(dict)
+    for date, type_, device, venture, value in usages:
+        if isinstance(date, datetime.datetime):
+            date = date.date()
+        device_id = _get_pk(device)
+        if venture is UNCHANGED_VENTURE:
+            venture_id = None if device_id is None else venture
+        else:
+            venture_id = _get_pk(venture)
+        if device_id is None:
+            key = _get_pk(type_), None, venture_id
+        else:
+            key = _get_pk(type_), device_id, None
+        days[date][key] = venture_id, value
+    created = updated = 0
+    for date, values in days.iteritems():
+        existing = {}
+        duplicates = []
+        rows = DailyUsage.objects.filter(
+            date=date,
+            type__in=set(key[0] for key in values),
+        ).values_list(
+            'id',
+            'type',
+            'pricing_device',
+            'pricing_venture',
+            'value',
+        ).order_by('id')
+        for id_, type_id, device_id, venture_id, value in rows:
+            if device_id is None:
+                key = type_id, None, venture_id
+            else:
+                key = type_id, device_id, None
+            if key not in values:
+                continue
+            if key in existing:
+                # Left by the plugins saving the same usage more than once.
+                duplicates.append(id_)
+                continue
+            existing[key] = id_, (venture_id, value)
+        new_usages = []
+        changes = collections.defaultdict(list)
+        for key, (venture_id, value) in values.iteritems():
+            if venture_id is UNCHANGED_VENTURE:
+                venture_id = existing[key][1][0] if key in existing else None
+            if key not in existing:
+                new_usages.append(DailyUsage(
+                    date=date,
+                    type_id=key[0],
+                    pricing_device_id=key[1],
+                    pricing_venture_id=venture_id,
+                    value=value,
+                ))
+            elif existing[key][1] != (venture_id, value):
+                changes[venture_id, value].append(existing[key][0])
+        for index in xrange(0, len(new_usages), batch_size):
+            _create_daily_usages(new_usages[index:index + batch_size])
+        batch = {}
+        batch_rows = 0
+        for change, ids in changes.iteritems():
+            for index in xrange(0, len(ids), batch_size):
+                batch[change] = ids[index:index + batch_size]
+                batch_rows += len(batch[change])
+                if batch_rows >= batch_size:
+                    _update_daily_usages(batch)
+                    batch = {}
+                    batch_rows = 0
+        if batch:
+            _update_daily_usages(batch)
+        for index in xrange(0, len(duplicates), batch_size):
+            _delete_daily_usages(duplicates[index:index + batch_size])
+        date_updated = sum(len(ids) for ids in changes.itervalues())
+        sync.counts.update(
+            written=len(new_usages) + date_updated,
+            skipped=len(values) - len(new_usages) - date_updated,
+        )
+        created += len(new_usages)
+        updated += date_updated
+    return created, updated
+
+
 class ExtraCostType(db.Model):
     name = db.CharField(verbose_name=_("name"), max_length=255, unique=True)
 
@@ -572,6 +1274,311 @@ class ExtraCost(db.Model):
         )
 
 
+def get_extra_costs_by_venture(start, end, query=None):
+    """
+    Return a dict of ``{(venture_id, type_id): price}`` with the total extra
+    costs of the ventures between ``start`` and ``end``.
+
+    The daily price of every extra cost overlapping the range is multiplied
+    by the number of days it overlaps, so a single query is enough for all
+    the ventures and types.
+    """
+
+    if query is None:
+        query = ExtraCost.objects
+    query = query.filter(start__lte=end, end__gte=start)
+    totals = collections.defaultdict(D)
+    for venture_id, type_id, cost_start, cost_end, price in query.values_list(
+        'pricing_venture', 'type', 'start', 'end', 'price',
+    ):
+        days = (min(end, cost_end) - max(start, cost_start)).days + 1
+        totals[venture_id, type_id] += price * days
+    return dict(totals)
+
+
+class DailyVentureCost(db.Model):
+    """
+    The costs of a venture on a single day, rolled up from the other daily
+    tables by the ``rollup`` plugin. The row with neither a usage type nor
+    an extra cost type holds the assets, every other row holds the usages
+    of a single usage type or the extra costs of a single extra cost type.
+
+    There is no unique constraint, as the type columns are nullable, the
+    rows of a day are always deleted and created again together. The rows
+    of a type are rolled up again when its prices or extra costs change.
+    """
+
+    date = db.DateField(db_index=True)
+    pricing_venture = db.ForeignKey(Venture, verbose_name=_("venture"))
+    usage_type = db.ForeignKey(
+        UsageType,
+        verbose_name=_("usage type"),
+        null=True,
+        blank=True,
+        default=None,
+    )
+    extra_cost_type = db.ForeignKey(
+        ExtraCostType,
+        verbose_name=_("extra cost type"),
+        null=True,
+        blank=True,
+        default=None,
+    )
+    count = db.FloatField(verbose_name=_("count"), default=0)
+    price = db.DecimalField(
+        max_digits=PRICE_DIGITS,
+        decimal_places=PRICE_PLACES,
+        verbose_name=_("price"),
+        null=True,
+        blank=True,
+        default=0,
+    )
+    cost = db.DecimalField(
+        max_digits=PRICE_DIGITS,
+        decimal_places=PRICE_PLACES,
+        verbose_name=_("cost"),
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = _("daily venture cost")
+        verbose_name_plural = _("daily venture costs")
+
+    def __unicode__(self):
+        return '{} ({})'.format(self.pricing_venture, self.date)
+
+
+def get_daily_venture_costs(start, end, query=None):
+    """
+    Return the ``(assets, usages, extra_costs)`` dicts, indexed like the
+    results of :func:`get_assets_count_price_cost_by_venture`,
+    :func:`get_usages_count_price_by_type` (grouped by venture) and
+    :func:`get_extra_costs_by_venture`, summed up from the rolled up
+    :class:`DailyVentureCost` rows in a single query.
+    """
+
+    days = (end - start).days + 1
+    if query is None:
+        query = DailyVentureCost.objects
+    rows = query.filter(
+        date__gte=start,
+        date__lte=end,
+    ).values(
+        'pricing_venture',
+        'usage_type',
+        'usage_type__average',
+        'extra_cost_type',
+    ).annotate(
+        total_count=db.Sum('count'),
+        total_price=db.Sum('price'),
+        total_cost=db.Sum('cost'),
+        prices=db.Count('price'),
+        rows=db.Count('id'),
+    ).order_by()
+    assets = {}
+    usages = {}
+    extra_costs = {}
+    for row in rows:
+        venture_id = row['pricing_venture']
+        if row['usage_type'] is not None:
+            count = row['total_count']
+            if row['usage_type__average']:
+                count /= days
+            if row['prices'] < row['rows']:
+                price = None
+            else:
+                price = row['total_price']
+            usages[venture_id, row['usage_type']] = count, price
+        elif row['extra_cost_type'] is not None:
+            extra_costs[venture_id, row['extra_cost_type']] = (
+                row['total_price']
+            )
+        else:
+            assets[venture_id] = (
+                row['total_count'] / days,
+                row['total_price'] / days,
+                row['total_cost'],
+            )
+    return assets, usages, extra_costs
+
+
+def _get_rolled_up_dates(start, end):
+    return set(DailyVentureCost.objects.filter(
+        date__gte=start,
+        date__lte=end,
+    ).values_list('date', flat=True).distinct())
+
+
+@commit_on_success
+def update_daily_usage_costs(type_id, start, end):
+    """
+    Roll up the usages of a single usage type again on the days between
+    ``start`` and ``end`` that are already rolled up, e.g. after its prices
+    changed, and bump their data versions. Returns the number of saved
+    rows.
+    """
+
+    dates = _get_rolled_up_dates(start, end)
+    if not dates:
+        return 0
+    DailyVentureCost.objects.filter(
+        date__gte=start,
+        date__lte=end,
+        usage_type=type_id,
+    ).delete()
+    rows = DailyUsage.objects.filter(
+        type=type_id,
+        date__gte=start,
+        date__lte=end,
+    ).exclude(
+        pricing_venture=None,
+    ).values(
+        'pricing_venture',
+        'date',
+    ).annotate(
+        total=db.Sum('value'),
+    ).order_by()
+    calendar = PriceCalendar(types=[type_id], start=start, end=end)
+    costs = []
+    for row in rows:
+        if row['date'] not in dates:
+            continue
+        try:
+            price = D(row['total']) * calendar.price_at(type_id, row['date'])
+        except (
+            UsagePrice.DoesNotExist,
+            UsagePrice.MultipleObjectsReturned,
+        ):
+            price = None
+        costs.append(DailyVentureCost(
+            date=row['date'],
+            pricing_venture_id=row['pricing_venture'],
+            usage_type_id=type_id,
+            count=row['total'],
+            price=price,
+        ))
+    DailyVentureCost.objects.bulk_create(costs)
+    bump_data_version(min(dates), max(dates))
+    return len(costs)
+
+
+@commit_on_success
+def update_daily_extra_costs(venture_id, type_id, start, end):
+    """
+    Roll up the extra costs of a single type and venture again on the days
+    between ``start`` and ``end`` that are already rolled up, and bump their
+    data versions. Returns the number of saved rows.
+    """
+
+    dates = _get_rolled_up_dates(start, end)
+    if not dates:
+        return 0
+    DailyVentureCost.objects.filter(
+        date__gte=start,
+        date__lte=end,
+        pricing_venture=venture_id,
+        extra_cost_type=type_id,
+    ).delete()
+    extra_costs = list(ExtraCost.objects.filter(
+        pricing_venture=venture_id,
+        type=type_id,
+        start__lte=end,
+        end__gte=start,
+    ).values_list('start', 'end', 'price'))
+    costs = []
+    for date in sorted(dates):
+        prices = [
+            price for cost_start, cost_end, price in extra_costs
+            if cost_start <= date <= cost_end
+        ]
+        if prices:
+            costs.append(DailyVentureCost(
+                date=date,
+                pricing_venture_id=venture_id,
+                extra_cost_type_id=type_id,
+                price=sum(prices, D(0)),
+            ))
+    DailyVentureCost.objects.bulk_create(costs)
+    bump_data_version(min(dates), max(dates))
+    return len(costs)
+
+
+def run_rollup(func, *args):
+    """
+    Run the function rolling up the costs in a job of the reports queue,
+    or right away if there is no queue configured.
+    """
+
+    if QUEUE_NAME is None:
+        return func(*args)
+    django_rq.get_queue(QUEUE_NAME).enqueue(func, *args)
+
+
+def _roll_up_price(instance):
+    if isinstance(instance, UsagePrice):
+        run_rollup(
+            update_daily_usage_costs,
+            instance.type_id,
+            instance.start,
+            instance.end,
+        )
+    else:
+        run_rollup(
+            update_daily_extra_costs,
+            instance.pricing_venture_id,
+            instance.type_id,
+            instance.start,
+            instance.end,
+        )
+
+
+def _get_rollup_fields(instance):
+    return (
+        instance.type_id,
+        getattr(instance, 'pricing_venture_id', None),
+        instance.start,
+        instance.end,
+    )
+
+
+def remember_rolled_up_price(sender, instance, **kwargs):
+    """Remember the saved usage price or extra cost before it changes."""
+
+    instance._rolled_up = None
+    if instance.pk is not None:
+        old = list(sender.objects.filter(pk=instance.pk)[:1])
+        if old and _get_rollup_fields(old[0]) != _get_rollup_fields(instance):
+            instance._rolled_up = old[0]
+
+
+def roll_up_price(sender, instance, **kwargs):
+    """Roll up the costs of the days a usage price or extra cost changed."""
+
+    old = getattr(instance, '_rolled_up', None)
+    if old is not None:
+        _roll_up_price(old)
+    _roll_up_price(instance)
+
+
+for sender in (UsagePrice, ExtraCost):
+    db.signals.pre_save.connect(
+        remember_rolled_up_price,
+        sender=sender,
+        dispatch_uid='ralph_pricing.rollup.{}.pre_save'.format(
+            sender.__name__,
+        ),
+    )
+    for signal in (db.signals.post_save, db.signals.post_delete):
+        signal.connect(
+            roll_up_price,
+            sender=sender,
+            dispatch_uid='ralph_pricing.rollup.{}.{}'.format(
+                sender.__name__,
+                'save' if signal is db.signals.post_save else 'delete',
+            ),
+        )
+
+
 class SplunkName(db.Model):
     splunk_name = db.CharField(
         verbose_name=_("Splunk name"),
@@ -590,3 +1597,164 @@ class SplunkName(db.Model):
 
     class Meta:
         unique_together = ("splunk_name", "pricing_device")
+
+
+class DataVersion(db.Model):
+    """
+    A change of the pricing data between ``start`` and ``end``. The version
+    of a date is the highest id of the changes covering it, so recording a
+    change bumps the versions of all the dates in its range at once. The
+    older changes within the range of a new one are deleted, as they no
+    longer decide the version of any date.
+    """
+
+    start = db.DateField()
+    end = db.DateField(db_index=True)
+
+    class Meta:
+        verbose_name = _("data version")
+        verbose_name_plural = _("data versions")
+
+    def __unicode__(self):
+        return '{} ({} - {})'.format(self.id, self.start, self.end)
+
+
+def bump_data_version(start=datetime.date.min, end=None):
+    """
+    Record a change of the data between ``start`` and ``end``, of a single
+    day if ``end`` is not given, or of all the days if neither is given.
+    """
+
+    if end is None:
+        end = datetime.date.max if start == datetime.date.min else start
+    version = DataVersion.objects.create(start=start, end=end)
+    DataVersion.objects.filter(
+        id__lt=version.id,
+        start__gte=start,
+        end__lte=end,
+    ).delete()
+
+
+def get_data_version(start=datetime.date.min, end=datetime.date.max):
+    """Return the version of the data between ``start`` and ``end``."""
+
+    return DataVersion.objects.filter(
+        start__lte=end,
+        end__gte=start,
+    ).aggregate(version=db.Max('id'))['version'] or 0
+
+
+def get_daily_data_versions(start, end):
+    """
+    Return a dict of ``{date: version}`` with the versions of the data of
+    every day between ``start`` and ``end``, loaded with a single query.
+    """
+
+    days = (end - start).days + 1
+    versions = dict(
+        (start + datetime.timedelta(days=day), 0) for day in xrange(days)
+    )
+    changes = DataVersion.objects.filter(
+        start__lte=end,
+        end__gte=start,
+    ).values_list('id', 'start', 'end')
+    for version, change_start, change_end in changes:
+        first = max(change_start, start)
+        last = min(change_end, end)
+        for day in xrange((last - first).days + 1):
+            date = first + datetime.timedelta(days=day)
+            versions[date] = max(versions[date], version)
+    return versions
+
+
+def bump_price_data_version(sender, instance, **kwargs):
+    """Bump the versions of the days covered by a usage price or extra cost."""
+
+    bump_data_version(instance.start, instance.end)
+
+
+def bump_old_price_data_version(sender, instance, **kwargs):
+    """Bump the versions of the days a usage price or extra cost covered."""
+
+    if instance.pk is None:
+        return
+    for start, end in sender.objects.filter(
+        pk=instance.pk,
+    ).values_list('start', 'end'):
+        if (start, end) != (instance.start, instance.end):
+            bump_data_version(start, end)
+
+
+def bump_all_data_version(sender, **kwargs):
+    """Bump the versions of all the days after a change of a type."""
+
+    bump_data_version()
+
+
+for sender in (UsagePrice, ExtraCost):
+    db.signals.pre_save.connect(
+        bump_old_price_data_version,
+        sender=sender,
+        dispatch_uid='ralph_pricing.data_version.{}.pre_save'.format(
+            sender.__name__,
+        ),
+    )
+    for signal in (db.signals.post_save, db.signals.post_delete):
+        signal.connect(
+            bump_price_data_version,
+            sender=sender,
+            dispatch_uid='ralph_pricing.data_version.{}.{}'.format(
+                sender.__name__,
+                'save' if signal is db.signals.post_save else 'delete',
+            ),
+        )
+for sender in (UsageType, ExtraCostType):
+    for signal in (db.signals.post_save, db.signals.post_delete):
+        signal.connect(
+            bump_all_data_version,
+            sender=sender,
+            dispatch_uid='ralph_pricing.data_version.{}.{}'.format(
+                sender.__name__,
+                'save' if signal is db.signals.post_save else 'delete',
+            ),
+        )
+
+
+class Backfill(db.Model):
+    """A run of ``pricing_sync`` for all the days between two dates."""
+
+    start = db.DateField()
+    end = db.DateField()
+    started = db.DateTimeField(auto_now_add=True)
+    finished = db.DateTimeField(null=True, blank=True, default=None)
+
+    class Meta:
+        verbose_name = _("backfill")
+        verbose_name_plural = _("backfills")
+
+    def __unicode__(self):
+        return '{} - {}'.format(self.start, self.end)
+
+
+class BackfillDay(db.Model):
+    """
+    A day synchronised by a :class:`Backfill`, with the plugins that failed.
+    The days with failed plugins are synchronised again when it resumes.
+    """
+
+    backfill = db.ForeignKey(Backfill, related_name='days')
+    date = db.DateField()
+    finished = db.DateTimeField(auto_now_add=True)
+    failed = db.TextField(
+        verbose_name=_("failed plugins"),
+        blank=True,
+        default='',
+    )
+
+    class Meta:
+        verbose_name = _("backfill day")
+        verbose_name_plural = _("backfill days")
+        unique_together = ('backfill', 'date')
+
+    def __unicode__(self):
+        return '{} ({})'.format(self.date, self.backfill)
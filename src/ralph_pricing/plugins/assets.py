@@ -9,12 +9,12 @@ from django.db.transaction import commit_on_success
 
 from ralph.util import plugin
 from ralph_assets.api_pricing import get_assets
+from ralph_pricing import sync
 from ralph_pricing.models import Device, DailyDevice
 
 
 @commit_on_success
 def update_assets(data, date):
-    created = False
     if not data['ralph_id']:
         return False
     try:
@@ -26,27 +26,27 @@ def update_assets(data, date):
     except Device.DoesNotExist:
         pass
     else:
-        old_device.asset_id = None
-        old_device.save()
-    try:
-        device = Device.objects.get(device_id=data['ralph_id'])
-    except Device.DoesNotExist:
-        created = True
-        device = Device()
-        device.device_id = data['ralph_id']
-    device.asset_id = data['asset_id']
-    device.slots = data['slots']
-    device.sn = data['sn']
-    device.barcode = data['barcode']
-    device.save()
-    daily, daily_created = DailyDevice.objects.get_or_create(
+        sync.update_changed(old_device, {'asset_id': None})
+    device, created = sync.update_or_create(
+        Device,
+        {
+            'asset_id': data['asset_id'],
+            'slots': data['slots'],
+            'sn': data['sn'],
+            'barcode': data['barcode'],
+        },
+        device_id=data['ralph_id'],
+    )
+    sync.update_or_create(
+        DailyDevice,
+        {
+            'price': data['price'],
+            'deprecation_rate': data['deprecation_rate'],
+            'is_deprecated': data['is_deprecated'],
+        },
         date=date,
         pricing_device=device,
     )
-    daily.price = data['price']
-    daily.deprecation_rate = data['deprecation_rate']
-    daily.is_deprecated = data['is_deprecated']
-    daily.save()
     return created
 
 
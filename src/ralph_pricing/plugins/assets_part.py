@@ -7,15 +7,17 @@ from __future__ import unicode_literals
 
 from ralph.util import plugin
 from ralph_assets.api_pricing import get_asset_parts
+from ralph_pricing import sync
 from ralph_pricing.models import Device, DailyPart
 
 
 def update_assets_parts(data, date):
     if data['asset_id'] is None and date['ralph_id'] is None:
         return False
-    device, created_device = Device.objects.get_or_create(
-        device_id=data['ralph_id'],
-    )
+    with sync.shared_lock():
+        device, created_device = Device.objects.get_or_create(
+            device_id=data['ralph_id'],
+        )
     daily, created = DailyPart.objects.get_or_create(
         date=date,
         asset_id=data['asset_id'],
@@ -6,29 +6,42 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 from ralph.util import plugin, api_pricing
-from ralph_pricing.models import UsageType, DailyUsage, Device, Venture
+from ralph_pricing.models import (
+    UNCHANGED_VENTURE,
+    UsageType,
+    get_device_ids,
+    get_venture_ids,
+    update_daily_usages,
+)
 
 
-def update_cores(data, usage_type, date):
-    if data.get('device_id') is not None:
-        device, created = Device.objects.get_or_create(
-            device_id=data['device_id'],
-        )
-    else:
-        return
-    usage, created = DailyUsage.objects.get_or_create(
-        date=date,
-        type=usage_type,
-        pricing_device=device,
+def update_cores_usages(records, usage_type, date):
+    """
+    Save the physical cores of the devices, return their total. The usages
+    of the devices without a venture keep the venture they already have.
+    """
+
+    records = [data for data in records if data.get('device_id') is not None]
+    devices = get_device_ids(data['device_id'] for data in records)
+    ventures = get_venture_ids(
+        data['venture_id'] for data in records
+        if data.get('venture_id') is not None
     )
-    if data.get('venture_id') is not None:
-        venture, created = Venture.objects.get_or_create(
-            venture_id=data['venture_id'],
+    update_daily_usages(
+        (
+            date,
+            usage_type,
+            devices[data['device_id']],
+            ventures.get(data.get('venture_id'), UNCHANGED_VENTURE),
+            data['physical_cores'],
         )
-        usage.pricing_venture = venture
-    usage.value = data['physical_cores']
-    usage.save()
-    return usage.value
+        for data in records
+    )
+    return sum(data['physical_cores'] for data in records)
+
+
+def update_cores(data, usage_type, date):
+    return update_cores_usages([data], usage_type, date)
 
 
 def get_usage():
@@ -46,8 +59,9 @@ def physical_cores(**kwargs):
 
     date = kwargs['today']
     usage = get_usage()
-    count = sum(
-        update_cores(data, usage, date)
-        for data in api_pricing.get_physical_cores()
+    count = update_cores_usages(
+        api_pricing.get_physical_cores(),
+        usage,
+        date,
     )
     return True, '%d total physical cores' % count, kwargs
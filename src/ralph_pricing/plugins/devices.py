@@ -5,48 +5,197 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import itertools
+
+from django.db.transaction import commit_on_success
+
 from ralph.util import plugin, api_pricing
+from ralph_pricing import sync
 from ralph_pricing.models import Device, ParentDevice, Venture, DailyDevice
 
 
+# Every device can take two ids in the queries of a chunk, its own and its
+# parent's, which keeps them under the parameter limit of SQLite.
+CHUNK_SIZE = 400
+DEVICE_FIELDS = 'name', 'sn', 'barcode', 'is_virtual', 'is_blade'
+DAILY_FIELDS = 'name', 'parent_id', 'pricing_venture_id'
+
+
 def update_device(data, date):
-    device, created = Device.objects.get_or_create(
+    device, created = sync.update_or_create(
+        Device,
+        _get_fields(data, DEVICE_FIELDS),
         device_id=data['id'],
     )
-    device.name = data['name']
-    device.sn = data['sn']
-    device.barcode = data['barcode']
-    device.is_virtual = data['is_virtual']
-    device.is_blade = data['is_blade']
-    device.save()
-
-    daily, daily_created = DailyDevice.objects.get_or_create(
-        date=date,
-        pricing_device=device,
-    )
+    fields = {'name': data['name']}
     if data.get('parent_id'):
         parent, parent_created = ParentDevice.objects.get_or_create(
             device_id=data['parent_id'],
         )
-        daily.parent = parent
+        fields['parent_id'] = parent.id
     else:
         parent_created = False
     if data.get('venture_id') is not None:
         venture, venture_created = Venture.objects.get_or_create(
             venture_id=data['venture_id'],
         )
-        daily.pricing_venture = venture
-    daily.name = data['name']
-    daily.save()
+        fields['pricing_venture_id'] = venture.id
+    sync.update_or_create(
+        DailyDevice,
+        fields,
+        date=date,
+        pricing_device=device,
+    )
     return created + parent_created
 
 
+def _get_fields(data, names):
+    return dict((name, data[name]) for name in names if name in data)
+
+
+def _get_changed(row, fields):
+    """Return the ``fields`` that differ from the dict ``row``."""
+
+    return dict(
+        (name, value)
+        for name, value in fields.iteritems()
+        if row[name] != value
+    )
+
+
+@commit_on_success
+def _update_devices_chunk(chunk, date, devices, dailies, ventures):
+    """
+    Save a chunk of the devices from Ralph and their daily devices on
+    ``date``. The dicts of the existing ``devices`` and ``ventures``, by
+    their Ralph ids, and of the ``dailies``, by the device, are updated
+    with the saved rows. Returns the numbers of the created and updated
+    devices.
+    """
+
+    chunk = dict((data['id'], data) for data in chunk)
+    new_ids = set(chunk)
+    new_ids.update(
+        data['parent_id'] for data in chunk.itervalues()
+        if data.get('parent_id')
+    )
+    new_ids.difference_update(devices)
+    if new_ids:
+        Device.objects.bulk_create([
+            Device(device_id=device_id, **_get_fields(
+                chunk.get(device_id, {}),
+                DEVICE_FIELDS,
+            ))
+            for device_id in new_ids
+        ])
+        devices.update(
+            (row['device_id'], row)
+            for row in Device.objects.filter(
+                device_id__in=new_ids,
+            ).values('id', 'device_id', *DEVICE_FIELDS)
+        )
+    for venture_id in set(
+        data['venture_id'] for data in chunk.itervalues()
+        if data.get('venture_id') is not None
+    ).difference(ventures):
+        # The ventures are kept in a tree, they can't be bulk created.
+        ventures[venture_id] = Venture.objects.create(
+            venture_id=venture_id,
+        ).id
+    updated = set()
+    written = skipped = 0
+    new_dailies = []
+    for device_id, data in chunk.iteritems():
+        device = devices[device_id]
+        changed = _get_changed(device, _get_fields(data, DEVICE_FIELDS))
+        if changed:
+            Device.objects.filter(id=device['id']).update(**changed)
+            device.update(changed)
+            updated.add(device_id)
+            written += 1
+        elif device_id not in new_ids:
+            skipped += 1
+        fields = {'name': data['name']}
+        if data.get('parent_id'):
+            fields['parent_id'] = devices[data['parent_id']]['id']
+        if data.get('venture_id') is not None:
+            fields['pricing_venture_id'] = ventures[data['venture_id']]
+        daily = dailies.get(device['id'])
+        if daily is None:
+            new_dailies.append(DailyDevice(
+                date=date,
+                pricing_device_id=device['id'],
+                **fields
+            ))
+            continue
+        changed = _get_changed(daily, fields)
+        if changed:
+            DailyDevice.objects.filter(id=daily['id']).update(**changed)
+            daily.update(changed)
+            updated.add(device_id)
+            written += 1
+        else:
+            skipped += 1
+    if new_dailies:
+        DailyDevice.objects.bulk_create(new_dailies)
+        dailies.update(
+            (row['pricing_device_id'], row)
+            for row in DailyDevice.objects.filter(
+                date=date,
+                pricing_device_id__in=[
+                    daily.pricing_device_id for daily in new_dailies
+                ],
+            ).values('id', 'pricing_device_id', *DAILY_FIELDS)
+        )
+    sync.counts.update(
+        written=written + len(new_ids) + len(new_dailies),
+        skipped=skipped,
+    )
+    return len(new_ids), len(updated - new_ids)
+
+
+def update_devices(records, date, chunk_size=CHUNK_SIZE):
+    """
+    Save all the devices from Ralph and their daily devices on ``date``,
+    like :func:`update_device` does for a single one. The existing rows are
+    read at once, the missing ones are bulk created and only the changed
+    ones are updated, in a transaction per chunk of ``chunk_size`` records.
+    Returns the numbers of the created and updated devices.
+    """
+
+    devices = dict(
+        (row['device_id'], row)
+        for row in Device.objects.values('id', 'device_id', *DEVICE_FIELDS)
+    )
+    dailies = dict(
+        (row['pricing_device_id'], row)
+        for row in DailyDevice.objects.filter(
+            date=date,
+        ).values('id', 'pricing_device_id', *DAILY_FIELDS)
+    )
+    ventures = dict(Venture.objects.values_list('venture_id', 'id'))
+    created = updated = 0
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            break
+        chunk_created, chunk_updated = _update_devices_chunk(
+            chunk,
+            date,
+            devices,
+            dailies,
+            ventures,
+        )
+        created += chunk_created
+        updated += chunk_updated
+    return created, updated
+
+
 @plugin.register(chain='pricing', requires=['ventures'])
 def devices(**kwargs):
     """Updates the devices from Ralph."""
 
     date = kwargs['today']
-    count = sum(
-        update_device(data, date) for data in api_pricing.get_devices()
-    )
-    return True, '%d new devices' % count, kwargs
+    created, updated = update_devices(api_pricing.get_devices(), date)
+    return True, '%d new devices, %d updated' % (created, updated), kwargs
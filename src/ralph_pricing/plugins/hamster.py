@@ -13,13 +13,15 @@ from django.conf import settings
 from restkit import Resource, ResourceNotFound
 
 from ralph.util import plugin
-from ralph_pricing.models import UsageType, Venture, DailyUsage
+from ralph_pricing.models import UsageType, Venture, update_daily_usages
 
 
 logger = logging.getLogger(__name__)
 
 
-def update_hamster_usage(venture, usage_type, date, url):
+def get_hamster_usage(venture, usage_type, date, url):
+    """Return the usage of the venture's capacity, or ``None``."""
+
     venture_symbol = venture.symbol
     try:
         capacity = get_venture_capacity(venture_symbol, url)
@@ -28,7 +30,8 @@ def update_hamster_usage(venture, usage_type, date, url):
         logger.error('Hamster data for %r not found' % venture_symbol)
     else:
         if capacity > 0:
-            return set_hamster_usage(venture, capacity, usage_type, date)
+            value = capacity / (1024 * 1024)  # in MB
+            return date, usage_type, None, venture, value
 
 
 def get_venture_capacity(venture_symbol, url):
@@ -38,17 +41,6 @@ def get_venture_capacity(venture_symbol, url):
     return json_data.get('capacity')
 
 
-def set_hamster_usage(venture, capacity, usage_type, date):
-    usage, created = DailyUsage.objects.get_or_create(
-        date=date,
-        type=usage_type,
-        pricing_venture=venture,
-    )
-    usage.value = capacity / (1024 * 1024)  # in MB
-    usage.save()
-    return created
-
-
 @plugin.register(chain='pricing', requires=['ventures'])
 def hamster(**kwargs):
     """Updates Hamster usage per Venture"""
@@ -60,8 +52,11 @@ def hamster(**kwargs):
     )
     date = kwargs['today']
     ventures = Venture.objects.all()
-    count = sum(
-        update_hamster_usage(venture, usage_type, date, url) or 0
+    usages = (
+        get_hamster_usage(venture, usage_type, date, url)
         for venture in ventures
     )
+    count, updated = update_daily_usages(
+        usage for usage in usages if usage is not None
+    )
     return True, '%d new Hamster usage added in Ventures' % count, kwargs
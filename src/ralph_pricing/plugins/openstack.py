@@ -13,62 +13,41 @@ import logging
 from django.conf import settings
 
 from ralph.util import plugin
-from ralph_pricing.models import UsageType, Venture, DailyUsage
+from ralph_pricing.models import UsageType, Venture, update_daily_usages
 from ralph_pricing.openstack import OpenStack
 
 
 logger = logging.getLogger(__name__)
 
 
-def set_usages(venture_symbol, data, date):
-    try:
-        venture = Venture.objects.get(symbol=venture_symbol)
-    except Venture.DoesNotExist:
+USAGES = [
+    ('OpenStack 10000 Memory GiB Hours', 'total_memory_mb_usage', 1024),
+    ('OpenStack 10000 CPU Hours', 'total_vcpus_usage', 1),
+    ('OpenStack 10000 Disk GiB Hours', 'total_local_gb_usage', 1),
+    ('OpenStack 10000 Volume GiB Hours', 'total_volume_gb_usage', 1),
+    ('OpenStack 10000 Images GiB Hours', 'total_images_gb_usage', 1),
+]
+
+
+def get_usages(venture_symbol, data, date, ventures, usage_types):
+    """
+    Yield the usages of the venture found in the tenant's ``data``, with
+    the ids of the ``ventures`` by symbol and a dict of the ``usage_types``
+    by name, which is filled as the types are needed.
+    """
+
+    venture_id = ventures.get(venture_symbol)
+    if venture_id is None:
         logger.error('Venture: %s does not exist' % venture_symbol)
         return
-
-    def set_usage(name, key, venture, multiplier):
+    for name, key, multiplier in USAGES:
         if key not in data:
-            return
-        usage_type, created = UsageType.objects.get_or_create(name=name)
-        usage, created = DailyUsage.objects.get_or_create(
-            date=date,
-            type=usage_type,
-            pricing_venture=venture,
-        )
-        usage.value = data[key] / multiplier
-        usage.save()
-    if venture:
-        set_usage(
-            'OpenStack 10000 Memory GiB Hours',
-            'total_memory_mb_usage',
-            venture,
-            1024,
-        )
-        set_usage(
-            'OpenStack 10000 CPU Hours',
-            'total_vcpus_usage',
-            venture,
-            1,
-        )
-        set_usage(
-            'OpenStack 10000 Disk GiB Hours',
-            'total_local_gb_usage',
-            venture,
-            1,
-        )
-        set_usage(
-            'OpenStack 10000 Volume GiB Hours',
-            'total_volume_gb_usage',
-            venture,
-            1,
-        )
-        set_usage(
-            'OpenStack 10000 Images GiB Hours',
-            'total_images_gb_usage',
-            venture,
-            1,
-        )
+            continue
+        if name not in usage_types:
+            usage_types[name], created = UsageType.objects.get_or_create(
+                name=name,
+            )
+        yield date, usage_types[name], None, venture_id, data[key] / multiplier
 
 
 @plugin.register(chain='pricing', requires=['ventures'])
@@ -99,9 +78,21 @@ def openstack(**kwargs):
             end=end.strftime('%Y-%m-%dT%H:%M:%S'),
         ):
             tenants[data['tenant_id']][url].update(data)
+    venture_ids = dict(Venture.objects.filter(
+        symbol__in=ventures.values(),
+    ).values_list('symbol', 'id'))
+    usage_types = {}
+    usages = []
     for tenant_id, regions in tenants.iteritems():
         for region, data in regions.iteritems():
             venture_symbol = ventures.get(data['tenant_id'])
             if venture_symbol:
-                set_usages(venture_symbol, data, date)
+                usages.extend(get_usages(
+                    venture_symbol,
+                    data,
+                    date,
+                    venture_ids,
+                    usage_types,
+                ))
+    update_daily_usages(usages)
     return True, 'Openstack usages were saved', kwargs
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from django.db.transaction import commit_on_success
+
+from ralph.util import plugin
+from ralph_pricing.models import (
+    DailyUsage,
+    DailyVentureCost,
+    bump_data_version,
+    get_assets_count_price_cost_by_venture,
+    get_extra_costs_by_venture,
+    get_usages_count_price_by_type,
+)
+
+
+@commit_on_success
+def update_daily_venture_costs(date):
+    """
+    Replace the rolled up costs of all the ventures on the given day.
+    Returns the number of saved rows.
+    """
+
+    DailyVentureCost.objects.filter(date=date).delete()
+    costs = []
+    assets = get_assets_count_price_cost_by_venture(date, date)
+    for venture_id, (count, price, cost) in assets.iteritems():
+        if venture_id is None:
+            continue
+        costs.append(DailyVentureCost(
+            date=date,
+            pricing_venture_id=venture_id,
+            count=count,
+            price=price,
+            cost=cost,
+        ))
+    usages = get_usages_count_price_by_type(
+        DailyUsage.objects.exclude(pricing_venture=None),
+        date,
+        date,
+        key='pricing_venture',
+    )
+    for (venture_id, type_id), (count, price) in usages.iteritems():
+        costs.append(DailyVentureCost(
+            date=date,
+            pricing_venture_id=venture_id,
+            usage_type_id=type_id,
+            count=count,
+            price=price,
+        ))
+    extra_costs = get_extra_costs_by_venture(date, date)
+    for (venture_id, type_id), price in extra_costs.iteritems():
+        costs.append(DailyVentureCost(
+            date=date,
+            pricing_venture_id=venture_id,
+            extra_cost_type_id=type_id,
+            price=price,
+        ))
+    DailyVentureCost.objects.bulk_create(costs)
+    return len(costs)
+
+
+def roll_up_day(date):
+    """
+    Roll up the costs of the ventures on the given day again after its
+    daily data changed, and bump its data version.
+    """
+
+    update_daily_venture_costs(date)
+    bump_data_version(date)
+
+
+@plugin.register(chain='pricing', requires=['never run'])
+def rollup(**kwargs):
+    """
+    Rolls up the daily costs of the ventures. Run by ``pricing_sync`` after
+    all the other plugins.
+    """
+
+    date = kwargs['today']
+    count = update_daily_venture_costs(date)
+    return True, '%d venture costs rolled up' % count, kwargs
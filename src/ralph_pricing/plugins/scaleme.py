@@ -14,7 +14,7 @@ from django.conf import settings
 from restkit import Resource, ResourceNotFound
 
 from ralph.util import plugin
-from ralph_pricing.models import DailyUsage, UsageType, Venture
+from ralph_pricing.models import UsageType, Venture, update_daily_usages
 
 
 logger = logging.getLogger(__name__)
@@ -36,27 +36,25 @@ def update_scaleme_usage(usage_types, date, url):
         logger.error(message)
     else:
         if ventures_capacity:
-            counts = {'new': 0, 'updated': 0}
+            ventures = dict(Venture.objects.filter(
+                symbol__in=ventures_capacity.keys(),
+            ).values_list('symbol', 'id'))
+            usages = []
             for venture_symbol, venture_usages in ventures_capacity.iteritems():  # noqa
-                try:
-                    venture = Venture.objects.get(symbol=venture_symbol)
-                except Venture.DoesNotExist:
+                if venture_symbol not in ventures:
                     logger.error('Venture %r does not exist from Scaleme data')
-                else:
-                    for usage_name, usage_type in usage_types.iteritems():
-                        usage, created = DailyUsage.objects.get_or_create(
-                            date=date,
-                            type=usage_type,
-                            pricing_venture=venture,
-                        )
-                        usage.value = venture_usages[usage_name]
-                        usage.save()
-                        if created:
-                            counts['new'] += 1
-                        else:
-                            counts['updated'] += 1
+                    continue
+                for usage_name, usage_type in usage_types.iteritems():
+                    usages.append((
+                        date,
+                        usage_type,
+                        None,
+                        ventures[venture_symbol],
+                        venture_usages[usage_name],
+                    ))
+            new, updated = update_daily_usages(usages)
             message = 'Scaleme ussages in Ventures: {} new, {} updated'.format(
-                counts['new'], counts['updated']
+                new, updated,
             )
         else:
             message = 'Scaleme data for %r not found' % date.strftime(
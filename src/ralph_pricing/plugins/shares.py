@@ -6,42 +6,55 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 from ralph.util import plugin, api_pricing
-from ralph_pricing.models import UsageType, DailyUsage, Device, DailyDevice
+from ralph_pricing.models import (
+    DailyDevice,
+    UsageType,
+    get_device_ids,
+    update_daily_usages,
+)
 
 
-def update_usage(device, venture, usage_name, date, value):
-    if not value:
-        return
+def get_usage_type(usage_name):
     usage_type, created = UsageType.objects.get_or_create(
         name=usage_name
     )
-    usage_type.average = True
-    usage_type.save()
-    usage, created = DailyUsage.objects.get_or_create(
+    if not usage_type.average:
+        usage_type.average = True
+        usage_type.save()
+    return usage_type
+
+
+def update_shares_usages(records, date):
+    """
+    Save the sizes of the disk shares mounted on the devices, charged to
+    the ventures of the devices on that day.
+    """
+
+    records = [
+        data for data in records if data.get('mount_device_id') is not None
+    ]
+    devices = get_device_ids(data['mount_device_id'] for data in records)
+    ventures = dict(DailyDevice.objects.filter(
         date=date,
-        type=usage_type,
-        pricing_device=device,
-    )
-    usage.pricing_venture = venture
-    usage.value = value
-    usage.save()
-
-
-def update(data, date):
-    if data.get('mount_device_id') is not None:
-        device, created = Device.objects.get_or_create(
-            device_id=data['mount_device_id'],
-        )
-    else:
-        return
-    try:
-        daily_device = device.dailydevice_set.get(date=date)
-        venture = daily_device.pricing_venture
-    except DailyDevice.DoesNotExist:
-        venture = None
-    size = data['size'] / data['share_mount_count']
-    usage_name = 'Disk Share {0} MB'.format(data['model'])
-    update_usage(device, venture, usage_name, date, size)
+    ).values_list('pricing_device', 'pricing_venture'))
+    usage_types = {}
+    usages = []
+    for data in records:
+        size = data['size'] / data['share_mount_count']
+        if not size:
+            continue
+        usage_name = 'Disk Share {0} MB'.format(data['model'])
+        if usage_name not in usage_types:
+            usage_types[usage_name] = get_usage_type(usage_name)
+        device_id = devices[data['mount_device_id']]
+        usages.append((
+            date,
+            usage_types[usage_name],
+            device_id,
+            ventures.get(device_id),
+            size,
+        ))
+    return update_daily_usages(usages)
 
 
 @plugin.register(chain='pricing', requires=['devices'])
@@ -49,6 +62,8 @@ def shares(**kwargs):
     """Updates the disk share usages from Ralph."""
 
     date = kwargs['today']
-    for data in api_pricing.get_shares():
-        update(data, date)
-    return True, 'disk share usages updated', kwargs
+    created, updated = update_shares_usages(api_pricing.get_shares(), date)
+    return True, 'disk share usages: {} new, {} updated'.format(
+        created,
+        updated,
+    ), kwargs
@@ -14,44 +14,20 @@ from ralph.util import plugin
 from ralph_pricing.splunk import Splunk
 from ralph_pricing.models import (
     DailyDevice,
-    DailyUsage,
     Device,
     SplunkName,
     UsageType,
     Venture,
+    update_daily_usages,
 )
 
 
-def set_device_usage(date, usage, usage_type, device):
-    try:
-        daily_device = DailyDevice.objects.get(
-            pricing_device=device,
-            date=date,
-        )
-    except DailyDevice.DoesNotExist:
-        venture = None
-    else:
-        venture = daily_device.pricing_venture
-    daily_usage, created = DailyUsage.objects.get_or_create(
-        date=date,
-        type=usage_type,
-        pricing_device=device,
-        pricing_venture=venture,
-    )
-    daily_usage.value = usage
-    daily_usage.save()
-
-
-def set_unknown_usage(date, usage, usage_type, splunk_venture):
-    daily_usage, created = DailyUsage.objects.get_or_create(
-        date=date,
-        type=usage_type,
-        pricing_venture=splunk_venture,
-        value=usage,
-    )
+def get_device_id(host):
+    """
+    Return the id of the device of the Splunk host, or ``None`` if it is
+    unknown, remembering the pairs of the hosts and the devices found.
+    """
 
-
-def set_usages(date, usage, usage_type, host, splunk_venture):
     try:
         splunk_pair = SplunkName.objects.get(
             splunk_name=host,
@@ -71,16 +47,40 @@ def set_usages(date, usage, usage_type, host, splunk_venture):
                     pricing_device=device[0],
                 )
                 splunk_pair.save()
-                set_device_usage(date, usage, usage_type, device[0])
+                return device[0].id
             else:
                 SplunkName.objects.get_or_create(splunk_name=host)
-                set_unknown_usage(date, usage, usage_type, splunk_venture)
+                return None
+    return splunk_pair.pricing_device_id
+
+
+def get_usages(date, hosts, usage_type, splunk_venture):
+    """
+    Return the usages of the devices of the Splunk ``hosts``, charged to
+    the ventures of the devices on that day, and the total usage of the
+    unknown hosts charged to the ``splunk_venture``.
+    """
+
+    ventures = dict(DailyDevice.objects.filter(
+        date=date,
+    ).values_list('pricing_device', 'pricing_venture'))
+    usages = []
+    unknown_usage = 0
+    for host, usage in hosts.iteritems():
+        device_id = get_device_id(host)
+        if device_id is None:
+            unknown_usage += usage
         else:
-            set_device_usage(
-                date, usage, usage_type, splunk_pair.pricing_device,
-            )
-    else:
-        set_device_usage(date, usage, usage_type, splunk_pair.pricing_device)
+            usages.append((
+                date,
+                usage_type,
+                device_id,
+                ventures.get(device_id),
+                usage,
+            ))
+    if unknown_usage:
+        usages.append((date, usage_type, None, splunk_venture, unknown_usage))
+    return usages
 
 
 @plugin.register(chain='pricing', requires=['ventures', 'devices'])
@@ -114,6 +114,5 @@ def splunk(**kwargs):
             hosts[host] += mb
         else:
             hosts[host] = mb
-    for host, usage in hosts.iteritems():
-        set_usages(date, usage, usage_type, host, splunk_venture)
+    update_daily_usages(get_usages(date, hosts, usage_type, splunk_venture))
     return True, 'done.', kwargs
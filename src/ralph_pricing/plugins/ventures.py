@@ -6,26 +6,30 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 from ralph.util import plugin, api_pricing
-from ralph_pricing.models import Venture
+from ralph_pricing import sync
+from ralph_pricing.models import Venture, invalidate_venture_tree
 
 
 def update_venture(data):
-    venture, created = Venture.objects.get_or_create(
-        venture_id=data['id'],
-    )
-    venture.name = data['name']
-    venture.department = data['department']
-    venture.symbol = data['symbol']
-    venture.business_segment = data['business_segment']
-    venture.profit_center = data['profit_center']
+    fields = {
+        'name': data['name'],
+        'department': data['department'],
+        'symbol': data['symbol'],
+        'business_segment': data['business_segment'],
+        'profit_center': data['profit_center'],
+    }
     if data.get('parent_id'):
         parent, parent_created = Venture.objects.get_or_create(
             venture_id=data['parent_id'],
         )
-        venture.parent = parent
+        fields['parent'] = parent
     else:
         parent_created = False
-    venture.save()
+    venture, created = sync.update_or_create(
+        Venture,
+        fields,
+        venture_id=data['id'],
+    )
     return created + parent_created
 
 
@@ -34,4 +38,5 @@ def ventures(**kwargs):
     """Updates the ventures from Ralph."""
 
     count = sum(update_venture(data) for data in api_pricing.get_ventures())
+    invalidate_venture_tree()
     return True, '%d new ventures' % count, kwargs
@@ -6,37 +6,39 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 from ralph.util import plugin, api_pricing
-from ralph_pricing.models import UsageType, DailyUsage, Device, Venture
+from ralph_pricing.models import (
+    UsageType,
+    get_device_ids,
+    get_venture_ids,
+    update_daily_usages,
+)
 
 
-def update_usage(device, venture, usage_type, date, value):
-    if not value:
-        return
-    usage, created = DailyUsage.objects.get_or_create(
-        date=date,
-        type=usage_type,
-        pricing_device=device,
+def update_virtual_usages(records, usages, date):
+    """Save the non-zero virtual usages of the devices."""
+
+    records = [data for data in records if data.get('device_id') is not None]
+    devices = get_device_ids(data['device_id'] for data in records)
+    ventures = get_venture_ids(
+        data['venture_id'] for data in records
+        if data.get('venture_id') is not None
+    )
+    return update_daily_usages(
+        (
+            date,
+            usage,
+            devices[data['device_id']],
+            ventures.get(data.get('venture_id')),
+            data[key],
+        )
+        for data in records
+        for key, usage in usages.iteritems()
+        if data.get(key)
     )
-    usage.pricing_venture = venture
-    usage.value = value
-    usage.save()
 
 
 def update(data, usages, date):
-    if data.get('device_id') is not None:
-        device, created = Device.objects.get_or_create(
-            device_id=data['device_id'],
-        )
-    else:
-        return
-    if data.get('venture_id') is not None:
-        venture, created = Venture.objects.get_or_create(
-            venture_id=data['venture_id'],
-        )
-    else:
-        venture = None
-    for key, usage in usages.iteritems():
-        update_usage(device, venture, usage, date, data.get(key))
+    update_virtual_usages([data], usages, date)
 
 
 def get_usages():
@@ -69,6 +71,12 @@ def virtual_usages(**kwargs):
 
     date = kwargs['today']
     usages = get_usages()
-    for data in api_pricing.get_virtual_usages():
-        update(data, usages, date)
-    return True, 'virtual usages updated', kwargs
+    created, updated = update_virtual_usages(
+        api_pricing.get_virtual_usages(),
+        usages,
+        date,
+    )
+    return True, 'virtual usages: {} new, {} updated'.format(
+        created,
+        updated,
+    ), kwargs
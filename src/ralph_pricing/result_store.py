@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+"""
+A store of the finished reports in a local directory, used by the reports
+when the ``PRICING_REPORTS_STORE`` setting points to a directory shared by
+the web and the worker processes. Every report is kept in a directory named
+after the hash of its key, with its rows in compressed, numbered chunks and
+a small metadata file for quick status checks. The least recently used
+reports are removed when the store grows over ``PRICING_REPORTS_STORE_SIZE``
+bytes, except for the ones used in the last ``KEEP_USED`` seconds, which can
+still be being read.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import cPickle as pickle
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+
+
+# The number of the rows stored together, in the cache or in the store
+CHUNK_ROWS = 1000
+META_NAME = 'meta'
+# The reports used in the last that many seconds are not evicted
+KEEP_USED = 10 * 60
+
+
+def _get_chunk_name(index):
+    return 'chunk-{}.gz'.format(index)
+
+
+def _read(path):
+    with gzip.open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _write(path, value):
+    with gzip.open(path, 'wb') as f:
+        pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+
+
+def _iter_chunks(path, chunks):
+    for index in xrange(chunks):
+        for row in _read(os.path.join(path, _get_chunk_name(index))):
+            yield row
+
+
+class ResultStore(object):
+    """The reports stored in ``path``, up to ``max_size`` bytes in total."""
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def _get_path(self, key):
+        return os.path.join(self.path, hashlib.sha1(key).hexdigest())
+
+    def get_meta(self, key):
+        """
+        Return the metadata of the report stored under ``key``, a dict
+        with its ``key``, ``header``, number of ``rows`` and ``chunks`` and
+        the ``size`` of its files, or ``None`` if it is not stored.
+        """
+
+        path = os.path.join(self._get_path(key), META_NAME)
+        try:
+            meta = _read(path)
+            # The modification time of the metadata marks the last use.
+            os.utime(path, None)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if meta['key'] != key:
+            return None
+        return meta
+
+    def iter_rows(self, key, meta=None):
+        """
+        Return an iterator over the rows of the report stored under ``key``,
+        or ``None`` if it is not stored. Only the metadata is read at once,
+        the chunks are read one by one while iterating.
+        """
+
+        if meta is None:
+            meta = self.get_meta(key)
+            if meta is None:
+                return None
+        return _iter_chunks(self._get_path(key), meta['chunks'])
+
+    def write(self, key, header, rows):
+        """
+        Store the report with the ``header`` and ``rows`` under ``key``,
+        replacing the previous one, and evict the old reports if needed.
+        The rows can be any iterable, they are written chunk by chunk.
+        """
+
+        tmp = tempfile.mkdtemp(dir=self.path, prefix='.tmp-')
+        try:
+            count = 0
+            chunks = 0
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                count += 1
+                if len(chunk) >= CHUNK_ROWS:
+                    _write(os.path.join(tmp, _get_chunk_name(chunks)), chunk)
+                    chunks += 1
+                    chunk = []
+            if chunk:
+                _write(os.path.join(tmp, _get_chunk_name(chunks)), chunk)
+                chunks += 1
+            size = sum(
+                os.path.getsize(os.path.join(tmp, name))
+                for name in os.listdir(tmp)
+            )
+            meta = {
+                'key': key,
+                'header': header,
+                'rows': count,
+                'chunks': chunks,
+                'size': size,
+            }
+            _write(os.path.join(tmp, META_NAME), meta)
+            path = self._get_path(key)
+            shutil.rmtree(path, ignore_errors=True)
+            os.rename(tmp, path)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        self.evict()
+        return meta
+
+    def delete(self, key):
+        shutil.rmtree(self._get_path(key), ignore_errors=True)
+
+    def evict(self):
+        """Remove the least recently used reports over the size limit."""
+
+        reports = []
+        total = 0
+        keep_used = time.time() - KEEP_USED
+        for name in os.listdir(self.path):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                used = os.path.getmtime(os.path.join(path, META_NAME))
+                size = sum(
+                    os.path.getsize(os.path.join(path, file_name))
+                    for file_name in os.listdir(path)
+                )
+            except OSError:
+                continue
+            reports.append((used, size, path))
+            total += size
+        for used, size, path in sorted(reports):
+            if total <= self.max_size or used > keep_used:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def get_result_store():
+    """Return the configured :class:`ResultStore` or ``None``."""
+
+    path = getattr(settings, 'PRICING_REPORTS_STORE', None)
+    if not path:
+        return None
+    return ResultStore(
+        path,
+        getattr(settings, 'PRICING_REPORTS_STORE_SIZE', 1024 ** 3),
+    )
@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+
+"""
+Helpers for the sync plugins that write only the rows whose values actually
+changed since the last synchronisation, and count the written and skipped
+rows for ``pricing_sync``, and the scheduling of the plugins that lets the
+independent ones run in parallel.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import contextlib
+import logging
+import os
+import time
+from decimal import Decimal as D
+
+from django.db import IntegrityError, transaction
+from django.db import models as db
+from django.db.models.fields import FieldDoesNotExist
+from mptt.models import MPTTModel
+
+from ralph.util import plugin
+
+
+logger = logging.getLogger(__name__)
+# The numbers of the ``written`` and ``skipped`` rows since the last reset.
+counts = collections.Counter()
+# How often to check the plugins running in the worker processes, in seconds
+POLL_INTERVAL = 0.1
+# How long a plugin can wait to be started while there are idle worker
+# processes before it is considered lost, in seconds
+START_TIMEOUT = 10
+# The plugins writing the venture tree and the devices shared by all the
+# days, they hold the shared lock while they run
+SHARED_PLUGINS = frozenset(['ventures', 'devices'])
+# The queue of a worker process for the names of the plugins it starts
+_started = None
+# The lock of the worker processes for writing the shared rows
+_shared_lock = None
+
+
+@contextlib.contextmanager
+def shared_lock():
+    """
+    Hold the lock for writing the ventures and the devices, shared by the
+    worker processes of the parallel sync, if there is one. The venture
+    tree can't be changed by two processes at once, and the devices are
+    created by several plugins.
+    """
+
+    if _shared_lock is None:
+        yield
+    else:
+        with _shared_lock:
+            yield
+
+
+def reset_counts():
+    counts.clear()
+
+
+def _get_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        # A foreign key given by its ``_id`` attribute.
+        return None
+
+
+def _get_value(obj, name):
+    """Return the value of the attribute, foreign keys by their ids."""
+
+    field = _get_field(type(obj), name)
+    if isinstance(field, db.ForeignKey):
+        return getattr(obj, field.attname)
+    return getattr(obj, name)
+
+
+def _normalize(model, name, value):
+    """Convert the value to the type it has when read from the database."""
+
+    field = _get_field(model, name)
+    if field is None or value is None:
+        return value
+    if isinstance(field, db.ForeignKey):
+        return value.pk if isinstance(value, db.Model) else value
+    value = field.to_python(value)
+    if isinstance(field, db.DecimalField):
+        value = D(value).quantize(D(10) ** -field.decimal_places)
+    return value
+
+
+def update_changed(obj, values):
+    """
+    Set the ``values`` dict of the attributes of the saved ``obj`` and
+    write only the changed ones to the database. Returns whether anything
+    was written.
+    """
+
+    model = type(obj)
+    changed = dict(
+        (name, value)
+        for name, value in values.iteritems()
+        if _normalize(model, name, _get_value(obj, name)) !=
+        _normalize(model, name, value)
+    )
+    if not changed:
+        counts['skipped'] += 1
+        return False
+    for name, value in changed.iteritems():
+        setattr(obj, name, value)
+    if isinstance(obj, MPTTModel):
+        # The tree fields have to be updated too, the tree changes need the
+        # objects of the foreign keys, not just their ids.
+        obj.save()
+    else:
+        model._default_manager.filter(pk=obj.pk).update(**changed)
+    counts['written'] += 1
+    return True
+
+
+def update_or_create(model, values, **lookup):
+    """
+    Like ``get_or_create``, but also set the ``values`` dict of the
+    attributes of the object, writing only the changed ones. An object
+    created at the same time by another process is updated instead.
+    """
+
+    manager = model._default_manager
+    try:
+        obj = manager.get(**lookup)
+    except model.DoesNotExist:
+        params = dict(lookup)
+        params.update(values)
+        obj = model(**params)
+        sid = transaction.savepoint(using=manager.db)
+        try:
+            with shared_lock():
+                obj.save(force_insert=True, using=manager.db)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid, using=manager.db)
+            obj = manager.get(**lookup)
+        else:
+            transaction.savepoint_commit(sid, using=manager.db)
+            counts['written'] += 1
+            return obj, True
+    update_changed(obj, values)
+    return obj, False
+
+
+class SerialResult(object):
+    """The result of a task run by :class:`SerialPool`."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def ready(self):
+        return True
+
+    def get(self, timeout=None):
+        return self.value
+
+
+class SerialPool(object):
+    """A pool of workers that runs the tasks at once, in this process."""
+
+    def apply_async(self, func, args=(), kwds=None, callback=None):
+        result = func(*args, **(kwds or {}))
+        if callback is not None:
+            callback(result)
+        return SerialResult(result)
+
+
+def get_requirements(chain):
+    """Return a dict of the sets of the plugins required by every plugin."""
+
+    requirements = {}
+    for requires, names in plugin.BY_REQUIREMENTS.get(chain, {}).iteritems():
+        for name in names:
+            requirements[name] = requires
+    return requirements
+
+
+def run_plugin(chain, name, today):
+    """
+    Run the plugin, possibly in a worker process, and return a dict with
+    its ``name``, ``success``, ``message``, the ``counts`` of the rows it
+    wrote and the times it ``started`` and ``finished``. The exceptions
+    are reported as failures.
+    """
+
+    reset_counts()
+    started = time.time()
+    if _started is not None:
+        _started.put((name, os.getpid()))
+    try:
+        if name in SHARED_PLUGINS:
+            with shared_lock():
+                success, message, context = plugin.run(
+                    chain,
+                    name,
+                    today=today,
+                )
+        else:
+            success, message, context = plugin.run(chain, name, today=today)
+    except Exception as e:
+        logger.exception('The %s plugin failed.', name)
+        success = False
+        message = '{0}: {1}'.format(e.__class__.__name__, e)
+    return {
+        'name': name,
+        'success': success,
+        'message': message,
+        'counts': dict(counts),
+        'started': started,
+        'finished': time.time(),
+    }
+
+
+def init_worker(started=None, lock=None):
+    """
+    Initialize a worker process of the pool passed to :func:`run_plugins`,
+    ``started`` is the ``multiprocessing.queues.SimpleQueue`` passed to it
+    as well. Its messages are sent at once, so they aren't lost when the
+    process is killed. The ``lock``, a ``multiprocessing.RLock`` shared by
+    all the workers, is held by :func:`shared_lock`.
+    """
+
+    global _started, _shared_lock
+    _started = started
+    _shared_lock = lock
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def _get_failure(name, message, started):
+    return {
+        'name': name,
+        'success': False,
+        'message': message,
+        'counts': {},
+        'started': started,
+        'finished': time.time(),
+    }
+
+
+def _count_alive(pool):
+    # The dead processes are replaced by the pool, which doesn't tell.
+    return len([
+        process for process in getattr(pool, '_pool', [])
+        if process.is_alive()
+    ])
+
+
+def _wait(running, pool, started=None, pids=None, waiting=None):
+    """
+    Wait for any of the ``running`` plugins, a dict of ``{name: (result,
+    time)}`` of their ``AsyncResult`` objects and the times they were
+    queued, to finish and return its result. The ``pids`` dict of the
+    worker processes of the plugins is updated from the ``started`` queue,
+    and the ``waiting`` dict with the times the plugins not started yet
+    began to wait while some of the workers of the ``pool`` were idle.
+    The plugins whose worker process died, or whose result can't be
+    received, fail. So do the plugins waiting for ``START_TIMEOUT``, as
+    their worker process died before it reported them.
+    """
+
+    while True:
+        for name, (result, queued) in running.iteritems():
+            if result.ready():
+                try:
+                    return result.get()
+                except Exception as e:
+                    return _get_failure(
+                        name,
+                        '{0}: {1}'.format(e.__class__.__name__, e),
+                        queued,
+                    )
+        if started is not None:
+            while not started.empty():
+                name, pid = started.get()
+                pids[name] = pid
+            for name, (result, queued) in running.iteritems():
+                if (
+                    name in pids and
+                    not _is_alive(pids[name]) and
+                    not result.ready()
+                ):
+                    return _get_failure(
+                        name,
+                        'The worker process was lost.',
+                        queued,
+                    )
+            idle = _count_alive(pool) - len([
+                name for name in running if name in pids
+            ])
+            now = time.time()
+            for name, (result, queued) in running.iteritems():
+                if name in pids or idle <= 0:
+                    waiting.pop(name, None)
+                elif now - waiting.setdefault(name, now) > START_TIMEOUT:
+                    return _get_failure(
+                        name,
+                        'The worker process was lost.',
+                        queued,
+                    )
+        time.sleep(POLL_INTERVAL)
+
+
+def run_plugins(chain, today, pool, started=None):
+    """
+    Run all the plugins of the ``chain`` on the ``pool`` of workers, each
+    as soon as all the plugins it requires succeeded, so the independent
+    ones run at the same time. The results of :func:`run_plugin` are
+    yielded as the plugins finish. The plugins requiring a failed one are
+    not run.
+
+    For a pool of processes, pass the ``started`` queue given to
+    :func:`init_worker` in all of them, to find the plugins whose worker
+    process died.
+    """
+
+    requirements = get_requirements(chain)
+    pending = set(requirements)
+    running = {}
+    pids = {}
+    waiting = {}
+    done = set()
+    while True:
+        ready = [name for name in pending if requirements[name] <= done]
+        for name in plugin.prioritize(chain, ready):
+            pending.remove(name)
+            running[name] = (
+                pool.apply_async(run_plugin, (chain, name, today)),
+                time.time(),
+            )
+        if not running:
+            break
+        result = _wait(running, pool, started, pids, waiting)
+        del running[result['name']]
+        if result['success']:
+            done.add(result['name'])
+        yield result
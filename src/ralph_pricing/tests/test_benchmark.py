@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import sys
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.test import TransactionTestCase
+
+from ralph_pricing import models
+
+
+class TestBenchmark(TransactionTestCase):
+    def test_benchmark(self):
+        models.bump_data_version()
+        version = models.get_data_version()
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            call_command('pricing_benchmark', ventures=2, devices=4, days=2)
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertIn('usages of a venture', output)
+        self.assertIn('device by name', output)
+        for model in (
+            models.DailyUsage,
+            models.DailyPart,
+            models.DailyDevice,
+            models.Device,
+            models.Venture,
+            models.UsageType,
+        ):
+            self.assertFalse(model.objects.exists())
+        self.assertEqual(models.get_data_version(), version)
+        # The data versions are bumped again after the benchmark.
+        models.UsageType.objects.create(name='waciki')
+        self.assertGreater(models.get_data_version(), version)
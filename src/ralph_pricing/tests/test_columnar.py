@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+import unittest
+
+from django.test import TestCase
+
+from ralph_pricing import columnar, models
+
+
+@unittest.skipIf(columnar.numpy is None, "NumPy is not installed.")
+class TestUsageColumns(TestCase):
+    def setUp(self):
+        self.start = datetime.date(2013, 4, 24)
+        self.end = datetime.date(2013, 4, 27)
+        venture = models.Venture(venture_id=3, name='a')
+        venture.save()
+        other_venture = models.Venture(venture_id=4, name='b')
+        other_venture.save()
+        average_type = models.UsageType(name='waciki', average=True)
+        average_type.save()
+        other_type = models.UsageType(name='ziew')
+        other_type.save()
+        models.UsagePrice(
+            type=average_type,
+            start=self.start,
+            end=self.end,
+            price=3,
+        ).save()
+        models.UsagePrice(
+            type=other_type,
+            start=self.start,
+            end=datetime.date(2013, 4, 25),
+            price=2,
+        ).save()
+        for day in range(4):
+            date = self.start + datetime.timedelta(days=day)
+            for usage_venture in (venture, other_venture, None):
+                models.DailyUsage(
+                    date=date,
+                    pricing_venture=usage_venture,
+                    type=average_type,
+                    value=day + 1,
+                ).save()
+            # the last two days of this type have no price
+            models.DailyUsage(
+                date=date,
+                pricing_venture=venture,
+                type=other_type,
+                value=10,
+            ).save()
+            if day < 2:
+                models.DailyUsage(
+                    date=date,
+                    pricing_venture=other_venture,
+                    type=other_type,
+                    value=5,
+                ).save()
+
+    def test_get_usages(self):
+        usages = columnar.UsageColumns(self.start, self.end).get_usages()
+        expected = models.get_usages_count_price_by_type(
+            models.DailyUsage.objects,
+            self.start,
+            self.end,
+            key='pricing_venture',
+        )
+        self.assertEqual(sorted(usages), sorted(expected))
+        for key, (count, price) in expected.iteritems():
+            self.assertAlmostEqual(usages[key][0], count)
+            if price is None:
+                self.assertIsNone(usages[key][1])
+            else:
+                self.assertEqual(usages[key][1], price)
+
+    def test_get_usages_empty(self):
+        models.DailyUsage.objects.all().delete()
+        usages = columnar.UsageColumns(self.start, self.end).get_usages()
+        self.assertEqual(usages, {})
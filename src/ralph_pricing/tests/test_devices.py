@@ -7,9 +7,18 @@ from __future__ import unicode_literals
 
 import datetime
 
+import mock
 from django.test import TestCase
 
-from ralph_pricing.models import Device, Venture, DailyDevice
+from ralph_pricing.models import (
+    DailyDevice,
+    DailyPart,
+    DailyUsage,
+    Device,
+    UsageType,
+    Venture,
+)
+from ralph_pricing.views import reports
 from ralph_pricing.views.devices import Devices
 
 
@@ -264,3 +273,71 @@ class TestDevices(TestCase):
         for device in devices_list:
             self.assertEqual(devices_list[i], data[i])
             i += 1
+
+    def add_devices(self, venture, usage_type, count, start, end):
+        first = Device.objects.count() + 100
+        for i in range(first, first + count):
+            device = Device(device_id=i, asset_id=i, name='host{}'.format(i))
+            device.save()
+            for date in (start, end):
+                DailyDevice(
+                    date=date,
+                    pricing_device=device,
+                    pricing_venture=venture,
+                    price=100,
+                    deprecation_rate=25,
+                ).save()
+                DailyPart(
+                    date=date,
+                    pricing_device=device,
+                    asset_id=i + 1000,
+                    name='part',
+                    price=10,
+                ).save()
+                DailyUsage(
+                    date=date,
+                    pricing_device=device,
+                    type=usage_type,
+                    value=5,
+                ).save()
+
+    def test_query_budget(self):
+        venture = self.ventures.get(name='Infra')
+        usage_type = UsageType.objects.create(name='budget')
+        start = datetime.date(2013, 2, 1)
+        end = datetime.date(2013, 2, 2)
+        self.add_devices(venture, usage_type, 2, start, end)
+        with self.assertNumQueries(11):
+            devices_list = self.get_data(start, end, venture)
+        self.assertEqual(len(devices_list), 6)
+        self.add_devices(venture, usage_type, 10, start, end)
+        with self.assertNumQueries(11):
+            devices_list = self.get_data(start, end, venture)
+        self.assertEqual(len(devices_list), 36)
+
+    def test_csv(self):
+        venture = self.ventures.get(name='Infra')
+        start = datetime.date(2013, 01, 01)
+        end = datetime.date(2013, 01, 04)
+        devices_list = self.get_data(start, end, venture)
+        report = Devices()
+        with mock.patch('ralph_pricing.views.reports.CHUNK_ROWS', 5):
+            progress, header, data = report._get_cached(
+                start=start,
+                end=end,
+                venture=venture,
+            )
+            key = reports._get_cache_key(
+                'devices',
+                start=start,
+                end=end,
+                venture=venture,
+            )
+            cache = reports.get_cache(reports.CACHE_NAME)
+            self.assertEqual(cache.get(key)[3], 3)
+            response = reports.make_csv_response(data, 'devices.csv')
+            self.assertEqual(
+                ''.join(response),
+                ''.join(reports.iter_csv(devices_list)),
+            )
+        report._clear_cache(start=start, end=end, venture=venture)
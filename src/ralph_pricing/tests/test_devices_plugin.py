@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+
+from django.test import TestCase
+
+from ralph_pricing.models import DailyDevice, Device, Venture
+from ralph_pricing.plugins.devices import update_device, update_devices
+
+
+class TestDevicesPlugin(TestCase):
+    def setUp(self):
+        self.today = datetime.date(2013, 4, 25)
+        Venture(venture_id=5, name='a').save()
+
+    def get_devices(self, name='host', count=5):
+        """Simulated api result"""
+        for i in range(count):
+            yield {
+                'id': i + 1,
+                'name': '{0}{1}'.format(name, i),
+                'sn': 'sn{0}'.format(i),
+                'barcode': 'bc{0}'.format(i),
+                'is_virtual': i > 0,
+                'is_blade': False,
+                'parent_id': 1 if i > 0 else None,
+                'venture_id': 5 if i < 3 else 6,
+            }
+
+    def test_update_devices(self):
+        self.assertEqual(
+            update_devices(self.get_devices(), self.today, chunk_size=2),
+            (5, 0),
+        )
+        self.assertEqual(Device.objects.count(), 5)
+        self.assertEqual(Venture.objects.count(), 2)
+        daily = DailyDevice.objects.get(
+            date=self.today,
+            pricing_device__device_id=4,
+        )
+        self.assertEqual(daily.name, 'host3')
+        self.assertEqual(daily.parent.device_id, 1)
+        self.assertEqual(daily.pricing_venture.venture_id, 6)
+        self.assertEqual(
+            update_devices(self.get_devices(), self.today),
+            (0, 0),
+        )
+        devices = list(self.get_devices(count=2))
+        devices[1]['sn'] = 'changed'
+        self.assertEqual(update_devices(devices, self.today), (0, 1))
+        self.assertEqual(Device.objects.get(device_id=2).sn, 'changed')
+
+    def test_same_as_update_device(self):
+        update_devices(self.get_devices(), self.today)
+        bulk = list(DailyDevice.objects.values_list(
+            'pricing_device__device_id',
+            'name',
+            'parent__device_id',
+            'pricing_venture__venture_id',
+        ).order_by('pricing_device__device_id'))
+        next_day = self.today + datetime.timedelta(days=1)
+        for data in self.get_devices():
+            update_device(data, next_day)
+        single = list(DailyDevice.objects.filter(date=next_day).values_list(
+            'pricing_device__device_id',
+            'name',
+            'parent__device_id',
+            'pricing_venture__venture_id',
+        ).order_by('pricing_device__device_id'))
+        self.assertEqual(bulk, single)
+        self.assertEqual(DailyDevice.objects.count(), 10)
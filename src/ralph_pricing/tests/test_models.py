@@ -8,9 +8,11 @@ from __future__ import unicode_literals
 import datetime
 import decimal
 
+from django.core.cache import get_cache
 from django.test import TestCase
 
 from ralph_pricing import models
+from ralph_pricing.plugins.cores import update_cores_usages
 
 
 class TestModels(TestCase):
@@ -201,3 +203,629 @@ class TestPrices(TestCase):
             extra_cost_type,
         )
         self.assertEqual(price, decimal.Decimal('0'))
+
+    def test_extra_costs_by_venture(self):
+        venture = models.Venture(venture_id=3)
+        venture.save()
+        other_venture = models.Venture(venture_id=2)
+        other_venture.save()
+        extra_cost_type = models.ExtraCostType(name='waciki')
+        extra_cost_type.save()
+        models.ExtraCost(
+            pricing_venture=venture,
+            start=datetime.date(2013, 4, 20),
+            end=datetime.date(2013, 4, 26),
+            type=extra_cost_type,
+            price='10',
+        ).save()
+        models.ExtraCost(
+            pricing_venture=venture,
+            start=datetime.date(2013, 4, 28),
+            end=datetime.date(2013, 5, 26),
+            type=extra_cost_type,
+            price='1',
+        ).save()
+        models.ExtraCost(
+            pricing_venture=other_venture,
+            start=datetime.date(2013, 1, 1),
+            end=datetime.date(2013, 12, 31),
+            type=extra_cost_type,
+            price='100',
+        ).save()
+        start = datetime.date(2013, 4, 25)
+        end = datetime.date(2013, 4, 30)
+        self.assertEqual(
+            models.get_extra_costs_by_venture(start, end),
+            {
+                (venture.id, extra_cost_type.id): decimal.Decimal('23'),
+                (other_venture.id, extra_cost_type.id): decimal.Decimal('600'),
+            },
+        )
+        self.assertEqual(
+            venture.get_extra_costs(start, end, extra_cost_type),
+            decimal.Decimal('23'),
+        )
+
+    def test_daily_parts_by_device(self):
+        start = datetime.date(2013, 4, 24)
+        end = datetime.date(2013, 4, 27)
+        device = models.Device(device_id=2)
+        device.save()
+        other_device = models.Device(device_id=3)
+        other_device.save()
+        for day in range(4):
+            date = start + datetime.timedelta(days=day)
+            models.DailyPart(
+                asset_id=4,
+                pricing_device=device,
+                date=date,
+                name='ziew' if day < 2 else 'waciki',
+                price=100 + day,
+                deprecation_rate=25,
+                is_deprecated=day == 3,
+            ).save()
+            models.DailyPart(
+                asset_id=5,
+                pricing_device=other_device,
+                date=date,
+                name='ziew',
+                price=10,
+                deprecation_rate=50,
+            ).save()
+        with self.assertNumQueries(1):
+            parts = models.get_daily_parts_by_device(
+                start,
+                end,
+                [device, other_device.id],
+            )
+        self.assertEqual(sorted(parts), [device.id, other_device.id])
+        (part,) = parts[device.id]
+        self.assertEqual(part['asset_id'], 4)
+        self.assertEqual(part['name'], 'waciki')
+        price, cost = models.get_daily_price_cost(4, device, start, end)
+        self.assertEqual(part['price'], price)
+        self.assertEqual(part['cost'], cost)
+        self.assertEqual(device.get_daily_parts(start, end), [part])
+        self.assertEqual(
+            models.get_daily_parts_by_device(start, end, [device.id + 10]),
+            {device.id + 10: []},
+        )
+
+    def test_daily_usages_by_device(self):
+        start = datetime.date(2013, 4, 24)
+        end = datetime.date(2013, 4, 25)
+        device = models.Device(device_id=2)
+        device.save()
+        other_device = models.Device(device_id=3)
+        other_device.save()
+        usage_type = models.UsageType(name='waciki', average=True)
+        usage_type.save()
+        other_type = models.UsageType(name='ziew')
+        other_type.save()
+        models.UsageType(name='unused').save()
+        models.UsagePrice(
+            type=usage_type,
+            start=start,
+            end=end,
+            price=2,
+        ).save()
+        for date in (start, end):
+            models.DailyUsage(
+                date=date,
+                pricing_device=device,
+                type=usage_type,
+                value=3,
+            ).save()
+        models.DailyUsage(
+            date=start,
+            pricing_device=other_device,
+            type=other_type,
+            value=5,
+        ).save()
+        with self.assertNumQueries(3):
+            usages = models.get_daily_usages_by_device(
+                start,
+                end,
+                [device, other_device.id],
+            )
+        self.assertEqual(usages, {
+            device.id: [
+                {'name': 'waciki', 'count': 3, 'price': decimal.Decimal(12)},
+            ],
+            other_device.id: [
+                {'name': 'ziew', 'count': 5, 'price': None},
+            ],
+        })
+        self.assertEqual(
+            list(device.get_daily_usages(start, end)),
+            usages[device.id],
+        )
+
+    def test_usages_count_price_by_type(self):
+        start = datetime.date(2013, 4, 24)
+        end = datetime.date(2013, 4, 25)
+        venture = models.Venture(venture_id=3)
+        venture.save()
+        average_type = models.UsageType(name='waciki', average=True)
+        average_type.save()
+        other_type = models.UsageType(name='ziew')
+        other_type.save()
+        for day in (start, end):
+            models.DailyUsage(
+                type=average_type,
+                value=10,
+                date=day,
+                pricing_venture=venture,
+            ).save()
+            models.DailyUsage(
+                type=other_type,
+                value=3,
+                date=day,
+                pricing_venture=venture,
+            ).save()
+        models.UsagePrice(
+            start=start,
+            end=end,
+            price=2,
+            type=average_type,
+        ).save()
+        models.UsagePrice(
+            start=end,
+            end=end,
+            price=5,
+            type=other_type,
+        ).save()
+        usages = models.get_usages_count_price_by_type(
+            models.DailyUsage.objects.all(),
+            start,
+            end,
+        )
+        self.assertEquals(usages, {
+            average_type.id: (10, decimal.Decimal('40')),
+            other_type.id: (6, None),
+        })
+        usages = models.get_usages_count_price_by_type(
+            models.DailyUsage.objects.all(),
+            end,
+            end,
+        )
+        self.assertEquals(usages, {
+            average_type.id: (10, decimal.Decimal('20')),
+            other_type.id: (3, decimal.Decimal('15')),
+        })
+        count, price = models.get_usages_count_price(
+            models.DailyUsage.objects.all(),
+            end,
+            end,
+        )
+        self.assertEquals(count, 13)
+        self.assertEquals(price, decimal.Decimal('35'))
+
+
+class TestSubtreeTotals(TestCase):
+    def test_subtree_totals(self):
+        root = models.Venture(venture_id=1, name='a')
+        root.save()
+        child = models.Venture(venture_id=2, name='b', parent=root)
+        child.save()
+        other_child = models.Venture(venture_id=3, name='c', parent=root)
+        other_child.save()
+        grandchild = models.Venture(venture_id=4, name='d', parent=child)
+        grandchild.save()
+        other_root = models.Venture(venture_id=5, name='e')
+        other_root.save()
+        values = {
+            root.id: {'count': 1},
+            child.id: {'count': 2, 'price': 5},
+            other_child.id: {'price': None},
+            grandchild.id: {'count': 4, 'price': 6},
+            other_root.id: {'count': 8},
+        }
+        with self.assertNumQueries(1):
+            totals = models.get_subtree_totals(
+                models.Venture.objects.all(),
+                values,
+            )
+        self.assertEquals(totals, {
+            root.id: {'count': 7, 'price': None},
+            child.id: {'count': 6, 'price': 11},
+            other_child.id: {'price': None},
+            grandchild.id: {'count': 4, 'price': 6},
+            other_root.id: {'count': 8},
+        })
+
+
+class TestVentureTree(TestCase):
+    def setUp(self):
+        models.invalidate_venture_tree()
+        self.root = models.Venture(venture_id=1, name='a')
+        self.root.save()
+        self.other_child = models.Venture(
+            venture_id=3,
+            name='b',
+            parent=self.root,
+        )
+        self.other_child.save()
+        self.child = models.Venture(venture_id=2, name='c', parent=self.root)
+        self.child.save()
+        self.grandchild = models.Venture(
+            venture_id=4,
+            name='d',
+            parent=self.child,
+        )
+        self.grandchild.save()
+
+    def test_venture_tree(self):
+        with self.assertNumQueries(1):
+            tree = models.get_venture_tree()
+        self.assertEqual(tree.paths[self.grandchild.id], 'a/c/d')
+        self.assertEqual(tree.depths[self.grandchild.id], 2)
+        self.assertEqual(tree.descendants[self.root.id], set([
+            self.root.id,
+            self.child.id,
+            self.other_child.id,
+            self.grandchild.id,
+        ]))
+        self.assertEqual(
+            tree.descendants[self.child.id],
+            set([self.child.id, self.grandchild.id]),
+        )
+        self.assertEqual(tree.children[None], [self.root.id])
+        self.assertEqual(
+            tree.children[self.root.id],
+            [self.other_child.id, self.child.id],
+        )
+        with self.assertNumQueries(0):
+            models.get_venture_tree()
+        cache = get_cache(models.CACHE_NAME)
+        self.assertIsNotNone(cache.get(models.VENTURE_TREE_CACHE_KEY))
+
+    def test_invalidate(self):
+        models.get_venture_tree()
+        self.grandchild.name = 'e'
+        self.grandchild.save()
+        tree = models.get_venture_tree()
+        self.assertEqual(tree.paths[self.grandchild.id], 'a/c/e')
+
+
+class TestAssetsPriceCost(TestCase):
+    def setUp(self):
+        self.start = datetime.date(2013, 4, 24)
+        self.end = datetime.date(2013, 4, 26)
+        self.venture = models.Venture(venture_id=3, name='a')
+        self.venture.save()
+        self.other_venture = models.Venture(venture_id=2, name='b')
+        self.other_venture.save()
+        system = models.Device(device_id=1, name='system', slots=16)
+        system.save()
+        blade = models.Device(
+            device_id=2,
+            name='blade',
+            slots=4,
+            is_blade=True,
+        )
+        blade.save()
+        deprecated = models.Device(device_id=3, name='deprecated')
+        deprecated.save()
+        server = models.Device(device_id=4, name='server')
+        server.save()
+        virtual = models.Device(device_id=5, name='virtual', is_virtual=True)
+        virtual.save()
+        for day in (self.start, self.end):
+            self._add_daily(system, day, self.venture, 1600, 25)
+            self._add_daily(
+                blade, day, self.other_venture, 100, 50, parent=system,
+            )
+            self._add_daily(server, day, self.venture, 300, 20)
+            self._add_daily(virtual, day, self.venture, 1000, 10)
+        self._add_daily(
+            deprecated, self.start, self.other_venture, 500, 10,
+            is_deprecated=True,
+        )
+        for asset_id, device, price, is_deprecated in [
+            (10, system, 400, False),
+            (11, server, 150, False),
+            (12, server, 120, True),
+        ]:
+            models.DailyPart(
+                asset_id=asset_id,
+                pricing_device=device,
+                date=self.start,
+                name='part',
+                price=price,
+                deprecation_rate=10,
+                is_deprecated=is_deprecated,
+            ).save()
+
+    def _add_daily(
+        self, device, day, venture, price, rate, parent=None,
+        is_deprecated=False,
+    ):
+        models.DailyDevice(
+            pricing_device=device,
+            date=day,
+            name=device.name,
+            price=price,
+            deprecation_rate=rate,
+            pricing_venture=venture,
+            parent_id=parent.id if parent else None,
+            is_deprecated=is_deprecated,
+        ).save()
+
+    def test_matches_venture_methods(self):
+        assets = models.get_assets_count_price_cost_by_venture(
+            self.start,
+            self.end,
+        )
+        self.assertEquals(
+            set(assets),
+            set([self.venture.id, self.other_venture.id]),
+        )
+        for venture in (self.venture, self.other_venture):
+            self.assertEquals(
+                assets[venture.id],
+                venture.get_assets_count_price_cost(self.start, self.end),
+            )
+        count, price, cost = assets[self.venture.id]
+        self.assertEquals(count, 4 / 3)
+        # system: 400 (parts) + 1600, minus 1/4 of that for the blade
+        # server: 150 (parts, one deprecated) + 300
+        self.assertEquals(
+            price,
+            (400 + 1600 - 100 - 400 + 150 + 300) / decimal.Decimal(3),
+        )
+
+    def test_group_by_device(self):
+        assets = models.get_assets_count_price_cost_by_venture(
+            self.start,
+            self.end,
+            key='pricing_device_id',
+            zero_deprecated=False,
+        )
+        for device in models.Device.objects.filter(is_virtual=False):
+            self.assertEquals(
+                assets[device.id],
+                self.venture.get_assets_count_price_cost(
+                    self.start,
+                    self.end,
+                    zero_deprecated=False,
+                    device_id=device.id,
+                ),
+            )
+
+
+class TestPriceCalendar(TestCase):
+    def setUp(self):
+        self.usage_type = models.UsageType(name='waciki')
+        self.usage_type.save()
+        for start, end, price in [
+            (datetime.date(2013, 4, 1), datetime.date(2013, 4, 10), 1),
+            (datetime.date(2013, 4, 11), datetime.date(2013, 4, 20), 2),
+            (datetime.date(2013, 4, 25), datetime.date(2013, 4, 30), 3),
+        ]:
+            models.UsagePrice(
+                type=self.usage_type,
+                start=start,
+                end=end,
+                price=price,
+            ).save()
+
+    def test_price_at(self):
+        calendar = models.PriceCalendar()
+        for day, price in [
+            (datetime.date(2013, 4, 1), 1),
+            (datetime.date(2013, 4, 10), 1),
+            (datetime.date(2013, 4, 11), 2),
+            (datetime.date(2013, 4, 30), 3),
+        ]:
+            self.assertEquals(
+                calendar.price_at(self.usage_type, day),
+                self.usage_type.get_price_at(day),
+            )
+            self.assertEquals(calendar.price_at(self.usage_type, day), price)
+        for day in [
+            datetime.date(2013, 3, 31),
+            datetime.date(2013, 4, 22),
+            datetime.date(2013, 5, 1),
+        ]:
+            with self.assertRaises(models.UsagePrice.DoesNotExist):
+                calendar.price_at(self.usage_type, day)
+
+    def test_multiple_prices(self):
+        models.UsagePrice(
+            type=self.usage_type,
+            start=datetime.date(2013, 4, 5),
+            end=datetime.date(2013, 4, 6),
+            price=4,
+        ).save()
+        calendar = models.PriceCalendar()
+        with self.assertRaises(models.UsagePrice.MultipleObjectsReturned):
+            calendar.price_at(self.usage_type, datetime.date(2013, 4, 5))
+        self.assertEquals(
+            calendar.price_at(self.usage_type, datetime.date(2013, 4, 7)),
+            1,
+        )
+
+    def test_price_segments(self):
+        calendar = models.PriceCalendar()
+        self.assertEquals(
+            calendar.price_segments(
+                self.usage_type,
+                datetime.date(2013, 4, 15),
+                datetime.date(2013, 5, 2),
+            ),
+            [
+                (datetime.date(2013, 4, 15), datetime.date(2013, 4, 20), 2),
+                (datetime.date(2013, 4, 21), datetime.date(2013, 4, 24), None),
+                (datetime.date(2013, 4, 25), datetime.date(2013, 4, 30), 3),
+                (datetime.date(2013, 5, 1), datetime.date(2013, 5, 2), None),
+            ],
+        )
+
+
+class TestDataVersion(TestCase):
+    def setUp(self):
+        self.day = datetime.date(2013, 4, 24)
+        self.next_day = datetime.date(2013, 4, 25)
+        self.usage_type = models.UsageType(name='waciki')
+        self.usage_type.save()
+
+    def test_daily_versions(self):
+        version = models.get_data_version()
+        models.bump_data_version(self.next_day)
+        versions = models.get_daily_data_versions(self.day, self.next_day)
+        self.assertEqual(versions[self.day], version)
+        self.assertGreater(versions[self.next_day], version)
+        self.assertEqual(
+            models.get_data_version(self.day, self.next_day),
+            versions[self.next_day],
+        )
+        self.assertEqual(models.get_data_version(self.day, self.day), version)
+
+    def test_superseded(self):
+        models.bump_data_version(self.day)
+        models.bump_data_version(self.day, self.next_day)
+        versions = models.get_daily_data_versions(self.day, self.next_day)
+        models.bump_data_version(self.next_day)
+        models.bump_data_version(self.next_day)
+        # Only the last bump of a single day is kept.
+        self.assertEqual(models.DataVersion.objects.filter(
+            start=self.next_day,
+        ).count(), 1)
+        self.assertEqual(
+            models.get_daily_data_versions(self.day, self.day),
+            {self.day: versions[self.day]},
+        )
+        models.bump_data_version()
+        self.assertEqual(models.DataVersion.objects.count(), 1)
+
+    def test_price_changes(self):
+        price = models.UsagePrice(
+            type=self.usage_type,
+            start=self.day,
+            end=self.day,
+            price=1,
+        )
+        price.save()
+        versions = models.get_daily_data_versions(self.day, self.next_day)
+        self.assertGreater(versions[self.day], versions[self.next_day])
+        price.start = price.end = self.next_day
+        price.save()
+        new_versions = models.get_daily_data_versions(self.day, self.next_day)
+        # Both the old and the new dates of the price changed.
+        self.assertGreater(new_versions[self.day], versions[self.day])
+        self.assertGreater(new_versions[self.next_day], versions[self.day])
+
+
+class TestUpdateDailyUsages(TestCase):
+    def setUp(self):
+        self.day = datetime.date(2013, 4, 24)
+        self.usage_type = models.UsageType(name='waciki')
+        self.usage_type.save()
+        self.venture = models.Venture(venture_id=1, name='a')
+        self.venture.save()
+        self.devices = []
+        for i in range(5):
+            device = models.Device(device_id=i + 1, name='d{0}'.format(i))
+            device.save()
+            self.devices.append(device)
+
+    def get_usages(self, value):
+        for device in self.devices:
+            yield self.day, self.usage_type, device, self.venture, value
+        yield self.day, self.usage_type.id, None, self.venture.id, value
+
+    def test_upsert(self):
+        self.assertEqual(
+            models.update_daily_usages(self.get_usages(1), batch_size=2),
+            (6, 0),
+        )
+        self.assertEqual(
+            models.update_daily_usages(self.get_usages(1)),
+            (0, 0),
+        )
+        usages = list(self.get_usages(2))[1:3]
+        self.assertEqual(
+            models.update_daily_usages(usages, batch_size=1),
+            (0, 2),
+        )
+        self.assertEqual(
+            sorted(models.DailyUsage.objects.values_list('value', flat=True)),
+            [1, 1, 1, 1, 2, 2],
+        )
+
+    def test_duplicates(self):
+        for value in (3, 4):
+            models.DailyUsage(
+                date=self.day,
+                type=self.usage_type,
+                pricing_venture=self.venture,
+                value=value,
+            ).save()
+        models.update_daily_usages([
+            (self.day, self.usage_type, None, self.venture, 7),
+        ])
+        self.assertEqual(
+            list(models.DailyUsage.objects.values_list('value', flat=True)),
+            [7],
+        )
+
+    def test_duplicates_of_other_usages(self):
+        other_venture = models.Venture(venture_id=2, name='b')
+        other_venture.save()
+        for device, venture in (
+            (None, self.venture),
+            (None, self.venture),
+            (None, other_venture),
+            (self.devices[0], self.venture),
+        ):
+            models.DailyUsage(
+                date=self.day,
+                type=self.usage_type,
+                pricing_device=device,
+                pricing_venture=venture,
+                value=3,
+            ).save()
+        models.update_daily_usages([
+            (self.day, self.usage_type, None, self.venture, 7),
+        ])
+        # Only the other usages of the same venture without a device go.
+        self.assertEqual(
+            sorted(models.DailyUsage.objects.values_list(
+                'pricing_device',
+                'pricing_venture',
+                'value',
+            )),
+            [
+                (None, self.venture.id, 7),
+                (None, other_venture.id, 3),
+                (self.devices[0].id, self.venture.id, 3),
+            ],
+        )
+
+    def test_unchanged_venture(self):
+        models.update_daily_usages([
+            (self.day, self.usage_type, self.devices[0], self.venture, 1),
+        ])
+        self.assertEqual(
+            update_cores_usages(
+                [
+                    {'device_id': 1, 'physical_cores': 2},
+                    {'device_id': 2, 'physical_cores': 4},
+                ],
+                self.usage_type,
+                self.day,
+            ),
+            6,
+        )
+        self.assertEqual(
+            sorted(models.DailyUsage.objects.values_list(
+                'pricing_device',
+                'pricing_venture',
+                'value',
+            )),
+            [
+                (self.devices[0].id, self.venture.id, 2),
+                (self.devices[1].id, None, 4),
+            ],
+        )
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+
+import mock
+import redis
+from django.test import TestCase
+
+from ralph_pricing.models import Venture, bump_data_version
+from ralph_pricing.views import reports
+
+
+class TestCsv(TestCase):
+    def test_iter_csv(self):
+        rows = [['a', 'ź'], [1, 2.5], ['x;y', '']]
+        self.assertEqual(
+            b''.join(reports.iter_csv(rows, chunk_size=1)),
+            b'a;\xc5\xba\r\n1;2.5\r\n"x;y";\r\n',
+        )
+
+    def test_streaming_response(self):
+        produced = []
+
+        def rows():
+            for i in xrange(100000):
+                produced.append(i)
+                yield ['row', i]
+
+        response = reports.make_csv_response(rows(), 'test.csv')
+        self.assertEqual(
+            response['Content-Disposition'],
+            'attachment; filename=test.csv',
+        )
+        self.assertEqual(produced, [])
+        chunks = iter(response)
+        first = next(chunks)
+        self.assertTrue(first.startswith(b'row;0\r\n'))
+        # Only the rows of the first chunk have been generated so far,
+        # the rest of the report is not held in memory.
+        self.assertLess(len(produced), 10000)
+        size = len(first) + sum(len(chunk) for chunk in chunks)
+        self.assertEqual(len(produced), 100000)
+        self.assertGreater(size, 100000 * len(b'row;0\r\n'))
+
+
+class TestCacheKey(TestCase):
+    def test_data_version(self):
+        start = datetime.date(2013, 4, 24)
+        end = datetime.date(2013, 4, 25)
+        key = reports._get_cache_key('test', start=start, end=end)
+        bump_data_version(end + datetime.timedelta(days=1))
+        self.assertEqual(
+            reports._get_cache_key('test', start=start, end=end),
+            key,
+        )
+        bump_data_version(end)
+        self.assertNotEqual(
+            reports._get_cache_key('test', start=start, end=end),
+            key,
+        )
+
+    def test_canonical(self):
+        venture = Venture(venture_id=1, name='a')
+        venture.save()
+        other = Venture(venture_id=2, name='a')
+        other.save()
+        key = reports._get_cache_key('test', venture=venture, name='ź')
+        self.assertEqual(
+            reports._get_cache_key('test', name='ź', venture=venture.id),
+            key,
+        )
+        self.assertNotEqual(
+            reports._get_cache_key('test', venture=other, name='ź'),
+            key,
+        )
+
+
+class ChunkedReport(reports.Report):
+    section = 'test-chunked'
+
+    @staticmethod
+    def get_header(**kwargs):
+        return ['row']
+
+    @staticmethod
+    def get_data(count=0, **kwargs):
+        data = []
+        for i in range(count):
+            data.append([i])
+            yield 100 * i // count, data
+        for row in data:
+            row.append('done')
+        yield 100, data
+
+
+class FinalReport(ChunkedReport):
+    section = 'test-final'
+    final_rows = True
+    # The first chunks found in the cache while the report was computed
+    stored = []
+
+    @staticmethod
+    def get_data(count=0, **kwargs):
+        key = reports._get_cache_key('test-final', count=count)
+        cache = reports.get_cache(reports.CACHE_NAME)
+        data = []
+        for i in range(count):
+            data.append([i])
+            yield 100 * i // count, data
+            if i == reports.CHUNK_ROWS:
+                FinalReport.stored.append(
+                    cache.get(reports._get_chunk_key(key, 0)),
+                )
+        yield 100, data
+
+
+class TestChunkedStorage(TestCase):
+    def setUp(self):
+        self.cache = reports.get_cache(reports.CACHE_NAME)
+        self.count = 2 * reports.CHUNK_ROWS + 10
+        self.key = reports._get_cache_key('test-chunked', count=self.count)
+        self.cache.delete(self.key)
+
+    def test_store_report(self):
+        ChunkedReport._store_report(self.key, count=self.count)
+        self.assertEqual(self.cache.get(self.key), (100, None, ['row'], 3))
+        self.assertEqual(
+            self.cache.get(reports._get_chunk_key(self.key, 2)),
+            [[i, 'done'] for i in range(2 * reports.CHUNK_ROWS, self.count)],
+        )
+
+    def test_get_cached(self):
+        report = ChunkedReport()
+        progress, header, data = report._get_cached(count=self.count)
+        self.assertEqual(progress, 100)
+        self.assertEqual(header, ['row'])
+        self.assertEqual(list(data), [[i, 'done'] for i in range(self.count)])
+        report._clear_cache(count=self.count)
+        self.assertIsNone(self.cache.get(self.key))
+        self.assertIsNone(self.cache.get(reports._get_chunk_key(self.key, 0)))
+
+    def test_evicted_chunk(self):
+        report = ChunkedReport()
+        report._get_cached(count=self.count)
+        self.cache.delete(reports._get_chunk_key(self.key, 0))
+        self.assertEqual(
+            report._get_cached(count=self.count),
+            (0, [], []),
+        )
+        self.assertIsNone(self.cache.get(reports._get_chunk_key(self.key, 1)))
+        progress, header, data = report._get_cached(count=self.count)
+        self.assertEqual(progress, 100)
+        self.assertEqual(len(list(data)), self.count)
+        # The chunks after the first one are fetched while iterating.
+        progress, header, data = report._get_cached(count=self.count)
+        self.cache.delete(reports._get_chunk_key(self.key, 1))
+        with self.assertRaises(ValueError):
+            list(data)
+        self.assertIsNone(self.cache.get(self.key))
+
+    def test_in_progress(self):
+        self.cache.set(self.key, (50, None, ['row'], 1))
+        progress, header, data = ChunkedReport()._get_cached(count=self.count)
+        self.assertEqual((progress, header, data), (50, ['row'], []))
+
+    def test_final_rows(self):
+        FinalReport.stored = []
+        progress, header, data = FinalReport()._get_cached(count=self.count)
+        self.assertEqual(list(data), [[i] for i in range(self.count)])
+        # The first chunk was stored before the report was finished.
+        self.assertEqual(
+            FinalReport.stored,
+            [[[i] for i in range(reports.CHUNK_ROWS)]],
+        )
+        FinalReport()._clear_cache(count=self.count)
+
+
+class ShardedReport(ChunkedReport):
+    section = 'test-sharded'
+
+    @staticmethod
+    def merge_shards(results, **kwargs):
+        data = [[value] for result in results for value in result]
+        yield 100, data
+
+
+class TestShards(TestCase):
+    def test_default_shards(self):
+        results = [
+            ChunkedReport.get_shard_data(shard, count=2)
+            for shard in range(2)
+        ]
+        self.assertEqual(results, [[[0, 'done'], [1, 'done']]] * 2)
+        self.assertEqual(
+            list(ChunkedReport.merge_shards(results[:1], count=2)),
+            [(100, [[0, 'done'], [1, 'done']])],
+        )
+
+    def test_merge_shards(self):
+        cache = reports.get_cache(reports.CACHE_NAME)
+        key = reports._get_cache_key('test-sharded', count=3)
+        cache.set(reports._get_shard_key(key, 0), [1, 2])
+        cache.set(reports._get_shard_key(key, 1), [3])
+        cache.set(reports._get_shard_key(key, 'remaining'), 0)
+        ShardedReport._merge_shards(key, 2, count=3)
+        self.assertEqual(cache.get(key), (100, None, ['row'], 1))
+        self.assertEqual(
+            list(reports._get_chunks(cache, key, 1)),
+            [[1], [2], [3]],
+        )
+        self.assertIsNone(cache.get(reports._get_shard_key(key, 0)))
+
+    def test_missing_shard(self):
+        cache = reports.get_cache(reports.CACHE_NAME)
+        key = reports._get_cache_key('test-sharded', count=4)
+        cache.set(reports._get_shard_key(key, 0), [1, 2])
+        with self.assertRaises(ValueError):
+            ShardedReport._merge_shards(key, 2, count=4)
+
+
+class FakeQueue(object):
+    def __init__(self):
+        # The jobs are only created, nothing is sent to this connection.
+        self.connection = redis.StrictRedis()
+        self.jobs = []
+
+    def enqueue_job(self, job):
+        self.jobs.append(job)
+        return job
+
+
+class QueuedReport(ChunkedReport):
+    section = 'test-queued'
+
+    def _is_failed(self, key, job_id):
+        return False
+
+
+class TestSingleFlight(TestCase):
+    def setUp(self):
+        self.queue = FakeQueue()
+        patches = [
+            mock.patch('ralph_pricing.views.reports.QUEUE_NAME', 'test'),
+            mock.patch('django_rq.get_queue', return_value=self.queue),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        QueuedReport()._clear_cache(count=5)
+
+    def test_one_job(self):
+        for i in range(3):
+            progress, header, data = QueuedReport()._get_cached(count=5)
+            self.assertEqual((progress, data), (0, []))
+        self.assertEqual(len(self.queue.jobs), 1)
+        job = self.queue.jobs[0]
+        key = reports._get_cache_key('test-queued', count=5)
+        self.assertEqual(job.args, (key,))
+        self.assertEqual(
+            reports.get_cache(reports.CACHE_NAME).get(key),
+            (0, job.id, None, 0),
+        )
+
+    def test_claimed(self):
+        key = reports._get_cache_key('test-queued', count=5)
+        cache = reports.get_cache(reports.CACHE_NAME)
+        cache.add(key, (0, None, None, 0))
+        progress, header, data = QueuedReport()._get_cached(count=5)
+        self.assertEqual((progress, data), (0, []))
+        self.assertEqual(self.queue.jobs, [])
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from ralph_pricing import result_store
+from ralph_pricing.tests.test_reports import ChunkedReport
+from ralph_pricing.views import reports
+
+
+class TestResultStore(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = result_store.ResultStore(self.path, 1024 ** 2)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_write(self):
+        rows = [[i, 'ziew'] for i in range(2 * result_store.CHUNK_ROWS + 1)]
+        self.store.write(b'a?b=1', ['x', 'y'], iter(rows))
+        meta = self.store.get_meta(b'a?b=1')
+        self.assertEqual(meta['header'], ['x', 'y'])
+        self.assertEqual(meta['rows'], len(rows))
+        self.assertEqual(meta['chunks'], 3)
+        self.assertEqual(list(self.store.iter_rows(b'a?b=1')), rows)
+        self.assertIsNone(self.store.get_meta(b'a?b=2'))
+        self.assertIsNone(self.store.iter_rows(b'a?b=2'))
+        # The chunks are read while iterating.
+        opened = self.store.iter_rows(b'a?b=1')
+        os.remove(os.path.join(self.store._get_path(b'a?b=1'), 'chunk-2.gz'))
+        self.assertEqual(next(opened), rows[0])
+        with self.assertRaises(IOError):
+            list(opened)
+        self.store.delete(b'a?b=1')
+        self.assertIsNone(self.store.get_meta(b'a?b=1'))
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_evict(self):
+        rows = [[os.urandom(64).encode('hex')] for i in range(100)]
+        size = self.store.write(b'first', [], rows)['size']
+        self.store.max_size = 2 * size + size // 2
+        self.store.write(b'second', [], rows)
+        os.utime(
+            os.path.join(self.store._get_path(b'first'), 'meta'),
+            (0, 0),
+        )
+        self.store.get_meta(b'second')
+        self.store.write(b'third', [], rows)
+        self.assertIsNone(self.store.get_meta(b'first'))
+        self.assertIsNotNone(self.store.get_meta(b'second'))
+        self.assertIsNotNone(self.store.get_meta(b'third'))
+        # The recently used reports can still be being read.
+        self.store.max_size = 0
+        self.store.evict()
+        self.assertIsNotNone(self.store.get_meta(b'second'))
+        self.assertIsNotNone(self.store.get_meta(b'third'))
+
+    def test_report(self):
+        count = reports.CHUNK_ROWS + 1
+        with override_settings(PRICING_REPORTS_STORE=self.path):
+            report = ChunkedReport()
+            progress, header, data = report._get_cached(count=count)
+            self.assertEqual(progress, 100)
+            self.assertEqual(list(data), [[i, 'done'] for i in range(count)])
+            key = reports._get_cache_key('test-chunked', count=count)
+            cache = reports.get_cache(reports.CACHE_NAME)
+            self.assertEqual(cache.get(key), (100, None, ['row'], None))
+            cache.delete(key)
+            progress, header, data = report._get_cached(count=count)
+            self.assertEqual(header, ['row'])
+            self.assertEqual(len(list(data)), count)
+            # A report evicted from the store is computed again.
+            self.store.delete(key)
+            cache.set(key, (100, None, ['row'], None))
+            self.assertEqual(report._get_cached(count=count), (0, [], []))
+            progress, header, data = report._get_cached(count=count)
+            self.assertEqual(len(list(data)), count)
+            report._clear_cache(count=count)
+            self.assertIsNone(self.store.get_meta(key))
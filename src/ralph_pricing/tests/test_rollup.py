@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+import decimal
+
+import mock
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from ralph_pricing import models
+from ralph_pricing.plugins.rollup import update_daily_venture_costs
+from ralph_pricing.views import ventures
+from ralph_pricing.views.ventures import get_costs
+
+
+class TestRollup(TestCase):
+    def setUp(self):
+        self.start = datetime.date(2013, 4, 24)
+        self.end = datetime.date(2013, 4, 25)
+        self.venture = models.Venture(venture_id=3, name='a')
+        self.venture.save()
+        device = models.Device(device_id=3, asset_id=5)
+        device.save()
+        self.usage_type = models.UsageType(name='waciki', average=True)
+        self.usage_type.save()
+        self.other_type = models.UsageType(name='ziew')
+        self.other_type.save()
+        self.extra_cost_type = models.ExtraCostType(name='waciki')
+        self.extra_cost_type.save()
+        models.UsagePrice(
+            type=self.usage_type,
+            start=self.start,
+            end=self.end,
+            price=2,
+        ).save()
+        models.ExtraCost(
+            pricing_venture=self.venture,
+            type=self.extra_cost_type,
+            start=self.start,
+            end=self.end,
+            price=7,
+        ).save()
+        for day, value in [(self.start, 10), (self.end, 30)]:
+            models.DailyDevice(
+                pricing_device=device,
+                pricing_venture=self.venture,
+                date=day,
+                name='ziew',
+                price=1337,
+                deprecation_rate=25,
+            ).save()
+            models.DailyUsage(
+                type=self.usage_type,
+                date=day,
+                value=value,
+                pricing_venture=self.venture,
+            ).save()
+        models.DailyUsage(
+            type=self.other_type,
+            date=self.end,
+            value=3,
+            pricing_venture=self.venture,
+        ).save()
+
+    def test_rollup(self):
+        self.assertEqual(update_daily_venture_costs(self.start), 3)
+        self.assertEqual(update_daily_venture_costs(self.end), 4)
+        # Rolling up the same day again replaces its rows
+        self.assertEqual(update_daily_venture_costs(self.end), 4)
+        self.assertEqual(models.DailyVentureCost.objects.count(), 7)
+        assets, usages, extra_costs = models.get_daily_venture_costs(
+            self.start,
+            self.end,
+        )
+        self.assertEqual(assets, {
+            self.venture.id: (
+                1,
+                decimal.Decimal('1337'),
+                decimal.Decimal('1.831506'),  # stored with 6 decimal places
+            ),
+        })
+        self.assertEqual(usages, {
+            (self.venture.id, self.usage_type.id): (20, 80),
+            (self.venture.id, self.other_type.id): (3, None),
+        })
+        self.assertEqual(extra_costs, {
+            (self.venture.id, self.extra_cost_type.id): 14,
+        })
+        orm_assets, orm_usages, orm_extra_costs = get_costs(
+            self.start,
+            self.end,
+        )
+        self.assertEqual(orm_usages, usages)
+        self.assertEqual(orm_extra_costs, extra_costs)
+        for orm_value, value in zip(
+            orm_assets[self.venture.id],
+            assets[self.venture.id],
+        ):
+            self.assertAlmostEqual(orm_value, value, places=5)
+        with override_settings(PRICING_REPORTS_BACKEND='rollup'):
+            self.assertEqual(
+                get_costs(self.start, self.end),
+                (assets, usages, extra_costs),
+            )
+
+    def test_price_changes(self):
+        update_daily_venture_costs(self.start)
+        update_daily_venture_costs(self.end)
+        usage_price = models.UsagePrice.objects.get(type=self.usage_type)
+        usage_price.price = 3
+        usage_price.save()
+        extra_cost = models.ExtraCost.objects.get(type=self.extra_cost_type)
+        extra_cost.end = self.start
+        extra_cost.save()
+        assets, usages, extra_costs = models.get_daily_venture_costs(
+            self.start,
+            self.end,
+        )
+        self.assertEqual(
+            usages[self.venture.id, self.usage_type.id],
+            (20, 120),
+        )
+        self.assertEqual(extra_costs, {
+            (self.venture.id, self.extra_cost_type.id): 7,
+        })
+        usage_price.end = self.start
+        usage_price.save()
+        extra_cost.delete()
+        assets, usages, extra_costs = models.get_daily_venture_costs(
+            self.start,
+            self.end,
+        )
+        self.assertEqual(
+            usages[self.venture.id, self.usage_type.id],
+            (20, None),
+        )
+        self.assertEqual(extra_costs, {})
+        # The days that are not rolled up are left alone.
+        self.assertEqual(
+            models.update_daily_usage_costs(
+                self.usage_type.id,
+                datetime.date(2013, 5, 1),
+                datetime.date(2013, 5, 2),
+            ),
+            0,
+        )
+
+    def test_queued_price_changes(self):
+        update_daily_venture_costs(self.start)
+        usage_price = models.UsagePrice.objects.get(type=self.usage_type)
+        usage_price.price = 3
+        with mock.patch('ralph_pricing.models.QUEUE_NAME', 'test'), \
+                mock.patch('django_rq.get_queue') as get_queue:
+            usage_price.save()
+        get_queue.assert_called_once_with('test')
+        get_queue.return_value.enqueue.assert_called_once_with(
+            models.update_daily_usage_costs,
+            self.usage_type.id,
+            self.start,
+            self.end,
+        )
+        assets, usages, extra_costs = models.get_daily_venture_costs(
+            self.start,
+            self.start,
+        )
+        self.assertEqual(
+            usages[self.venture.id, self.usage_type.id],
+            (10, 20),
+        )
+        version = models.get_data_version(self.start, self.start)
+        models.update_daily_usage_costs(
+            self.usage_type.id,
+            self.start,
+            self.end,
+        )
+        self.assertGreater(
+            models.get_data_version(self.start, self.start),
+            version,
+        )
+
+    def test_incremental(self):
+        cache = ventures.get_cache(ventures.CACHE_NAME)
+        versions = models.get_daily_data_versions(self.start, self.end)
+        cache.delete_many([
+            key
+            for date, version in versions.iteritems()
+            for key in ventures._get_day_keys(date, version)
+        ])
+        compute_costs = ventures.compute_costs
+        with mock.patch(
+            'ralph_pricing.views.ventures.compute_costs',
+            wraps=compute_costs,
+        ) as counting_compute_costs:
+            self.assertEqual(
+                ventures.get_incremental_costs(self.end, self.end),
+                compute_costs(self.end, self.end),
+            )
+            self.assertEqual(counting_compute_costs.call_count, 1)
+            assets, usages, extra_costs = ventures.get_incremental_costs(
+                self.start,
+                self.end,
+                models.Venture.objects.values('id'),
+            )
+            # Only the missing day is computed.
+            counting_compute_costs.assert_called_with(self.start, self.start)
+            self.assertEqual(counting_compute_costs.call_count, 2)
+            # Only the changed day is computed again.
+            models.bump_data_version(self.start)
+            ventures.get_incremental_costs(self.start, self.end)
+            counting_compute_costs.assert_called_with(self.start, self.start)
+            self.assertEqual(counting_compute_costs.call_count, 3)
+        orm_assets, orm_usages, orm_extra_costs = compute_costs(
+            self.start,
+            self.end,
+        )
+        self.assertEqual(usages, orm_usages)
+        self.assertEqual(extra_costs, orm_extra_costs)
+        for orm_value, value in zip(
+            orm_assets[self.venture.id],
+            assets[self.venture.id],
+        ):
+            self.assertAlmostEqual(orm_value, value, places=5)
+        self.assertEqual(
+            ventures.get_incremental_costs(self.start, self.end, []),
+            ({}, {}, {}),
+        )
+
+    def test_incremental_cold(self):
+        start = datetime.date(2013, 4, 1)
+        dates = [
+            start + datetime.timedelta(days=day)
+            for day in xrange((self.end - start).days + 1)
+        ]
+        versions = models.get_daily_data_versions(start, self.end)
+        cache = ventures.get_cache(ventures.CACHE_NAME)
+        cache.delete_many([
+            key
+            for date, version in versions.iteritems()
+            for key in ventures._get_day_keys(date, version)
+        ])
+        with mock.patch(
+            'ralph_pricing.views.ventures.compute_costs',
+            wraps=ventures.compute_costs,
+        ) as compute_costs, \
+                mock.patch('ralph_pricing.views.ventures.QUEUE_NAME', 'q'), \
+                mock.patch('ralph_pricing.views.ventures.DAY_PARTS', 2), \
+                mock.patch('django_rq.get_queue') as get_queue:
+            costs = ventures.get_incremental_costs(start, self.end)
+            # Most of the days are missing, so they are computed at once.
+            compute_costs.assert_called_once_with(start, self.end, None)
+            # And cached by a job of the queue.
+            get_queue.return_value.enqueue.assert_called_once_with(
+                ventures.cache_day_costs,
+                dates,
+            )
+            ventures.cache_day_costs(dates)
+            compute_costs.reset_mock()
+            self.assertEqual(
+                ventures.get_incremental_costs(start, self.end),
+                costs,
+            )
+            self.assertFalse(compute_costs.called)
+            parts = cache.get_many(ventures._get_day_keys(
+                self.start,
+                versions[self.start],
+            ))
+        self.assertEqual(len(parts), 2)
+        # The costs of a venture are all in one of the parts of a day.
+        self.assertEqual(
+            len([part for part in parts.itervalues() if part[0]]),
+            1,
+        )
+        self.assertEqual(
+            ventures._join_day_costs(parts.itervalues()),
+            ventures.compute_costs(self.start, self.start),
+        )
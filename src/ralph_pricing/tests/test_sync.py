@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+import itertools
+import multiprocessing
+import multiprocessing.dummy
+import os
+from multiprocessing.queues import SimpleQueue
+
+import mock
+from django.test import TestCase
+
+from ralph.util import plugin
+from ralph_pricing import sync
+from ralph_pricing.management.commands.pricing_sync import (
+    get_backfill,
+    run_backfill,
+)
+from ralph_pricing.models import (
+    Backfill,
+    BackfillDay,
+    DailyDevice,
+    Device,
+    Venture,
+)
+from ralph_pricing.plugins.assets import update_assets
+from ralph_pricing.plugins.ventures import update_venture
+
+
+class TestSync(TestCase):
+    def setUp(self):
+        sync.reset_counts()
+
+    def test_update_changed(self):
+        device = Device(device_id=1, name='a')
+        device.save()
+        daily = DailyDevice(date=datetime.date.today(), pricing_device=device)
+        daily.save()
+        daily = DailyDevice.objects.get(id=daily.id)
+        self.assertFalse(sync.update_changed(daily, {
+            'price': 0.0,
+            'name': '',
+            'pricing_venture_id': None,
+        }))
+        self.assertTrue(sync.update_changed(daily, {'price': 12.5}))
+        self.assertEqual(DailyDevice.objects.get(id=daily.id).price, 12.5)
+        self.assertEqual(sync.counts, {'written': 1, 'skipped': 1})
+
+    def test_update_assets(self):
+        data = {
+            'asset_id': 1123,
+            'ralph_id': 13342,
+            'slots': 10.0,
+            'price': 100,
+            'is_deprecated': True,
+            'sn': '1234-1234-1234-1234',
+            'barcode': '4321-4321-4321-4321',
+            'deprecation_rate': 0,
+        }
+        today = datetime.date.today()
+        self.assertTrue(update_assets(data, today))
+        self.assertEqual(sync.counts, {'written': 2})
+        sync.reset_counts()
+        self.assertFalse(update_assets(data, today))
+        self.assertEqual(sync.counts, {'skipped': 2})
+
+    def test_update_or_create_race(self):
+        device = Device(device_id=1, name='a')
+        device.save()
+        get = Device.objects.get
+        lookups = []
+
+        def get_later(**kwargs):
+            # The device is created by another process after the first
+            # lookup.
+            lookups.append(kwargs)
+            if len(lookups) == 1:
+                raise Device.DoesNotExist()
+            return get(**kwargs)
+
+        with mock.patch.object(Device.objects, 'get', get_later):
+            obj, created = sync.update_or_create(
+                Device,
+                {'name': 'b'},
+                device_id=1,
+            )
+        self.assertFalse(created)
+        self.assertEqual(obj.id, device.id)
+        self.assertEqual(Device.objects.get(device_id=1).name, 'b')
+
+    def test_update_venture_parent(self):
+        data = {
+            'id': 2,
+            'name': 'child',
+            'department': 'd',
+            'symbol': 'child',
+            'business_segment': '',
+            'profit_center': '',
+            'parent_id': None,
+        }
+        update_venture(data)
+        update_venture(dict(data, id=1, name='parent', symbol='parent'))
+        update_venture(dict(data, parent_id=1))
+        self.assertEqual(sync.counts, {'written': 3})
+        parent = Venture.objects.get(venture_id=1)
+        self.assertEqual(
+            list(parent.get_descendants().values_list('name', flat=True)),
+            ['child'],
+        )
+
+
+@plugin.register(chain='test_sync_workers', requires=[])
+def lost(**kwargs):
+    os._exit(1)
+
+
+@plugin.register(chain='test_sync_workers', requires=[])
+def unpicklable(**kwargs):
+    return True, lambda: None, kwargs
+
+
+@plugin.register(chain='test_sync', requires=[])
+def first(**kwargs):
+    return True, 'first', kwargs
+
+
+@plugin.register(chain='test_sync', requires=['first'])
+def broken(**kwargs):
+    raise ValueError('broken')
+
+
+@plugin.register(chain='test_sync', requires=['first'])
+def second(**kwargs):
+    return True, 'second', kwargs
+
+
+@plugin.register(chain='test_sync', requires=['broken'])
+def dependent(**kwargs):
+    return True, 'dependent', kwargs
+
+
+class TestRunPlugins(TestCase):
+    @mock.patch('ralph_pricing.sync.logger')
+    def test_failure_stops_dependents(self, logger):
+        pool = multiprocessing.dummy.Pool(2)
+        try:
+            results = list(sync.run_plugins(
+                'test_sync',
+                datetime.date.today(),
+                pool,
+            ))
+        finally:
+            pool.close()
+            pool.join()
+        logger.exception.assert_called_once_with(
+            'The %s plugin failed.',
+            'broken',
+        )
+        self.assertEqual(results[0]['name'], 'first')
+        self.assertEqual(
+            sorted(
+                (result['name'], result['success'], result['message'])
+                for result in results[1:]
+            ),
+            [
+                ('broken', False, 'ValueError: broken'),
+                ('second', True, 'second'),
+            ],
+        )
+
+    def test_lost_worker(self):
+        started = SimpleQueue()
+        pool = multiprocessing.Pool(2, sync.init_worker, (started,))
+        try:
+            results = list(sync.run_plugins(
+                'test_sync_workers',
+                datetime.date.today(),
+                pool,
+                started,
+            ))
+        finally:
+            pool.terminate()
+            pool.join()
+        self.assertEqual(
+            sorted(
+                (
+                    result['name'],
+                    result['success'],
+                    result['message'].split(':')[0],
+                )
+                for result in results
+            ),
+            [
+                ('lost', False, 'The worker process was lost.'),
+                ('unpicklable', False, 'MaybeEncodingError'),
+            ],
+        )
+
+    def test_lost_unreported_worker(self):
+        # The workers die before they report the plugins they started.
+        pool = multiprocessing.Pool(2, sync.init_worker)
+        try:
+            with mock.patch('ralph_pricing.sync.START_TIMEOUT', 0.5):
+                results = list(sync.run_plugins(
+                    'test_sync_workers',
+                    datetime.date.today(),
+                    pool,
+                    SimpleQueue(),
+                ))
+        finally:
+            pool.terminate()
+            pool.join()
+        self.assertEqual(
+            sorted(
+                (
+                    result['name'],
+                    result['success'],
+                    result['message'].split(':')[0],
+                )
+                for result in results
+            ),
+            [
+                ('lost', False, 'The worker process was lost.'),
+                ('unpicklable', False, 'MaybeEncodingError'),
+            ],
+        )
+
+
+@plugin.register(chain='test_backfill', requires=[])
+def ventures(**kwargs):
+    return True, 'ventures', kwargs
+
+
+@plugin.register(chain='test_backfill', requires=['ventures'])
+def usages(**kwargs):
+    return True, 'usages', kwargs
+
+
+class InlinePool(object):
+    """A pool of worker processes running the tasks in this process."""
+
+    def __init__(self, processes, initializer=None, initargs=()):
+        if initializer is not None:
+            initializer(*initargs)
+
+    def imap_unordered(self, func, iterable):
+        return itertools.imap(func, iterable)
+
+    def terminate(self):
+        sync.init_worker()
+
+    def join(self):
+        pass
+
+
+class TestBackfill(TestCase):
+    def setUp(self):
+        self.start = datetime.date(2013, 4, 1)
+        self.end = datetime.date(2013, 4, 3)
+
+    @mock.patch('ralph_pricing.sync.logger')
+    def test_failed_days(self, logger):
+        backfill = get_backfill(self.start, self.end)
+        results = list(run_backfill('test_sync', backfill))
+        self.assertEqual(
+            [(date, failed) for date, failed, elapsed in results],
+            [
+                (datetime.date(2013, 4, day), ['broken'])
+                for day in range(1, 4)
+            ],
+        )
+        self.assertIsNone(Backfill.objects.get().finished)
+        # The failed days are synchronised again.
+        self.assertEqual(get_backfill(self.start, self.end), backfill)
+        results = list(run_backfill('test_sync', backfill))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(BackfillDay.objects.count(), 3)
+
+    def test_parallel(self):
+        # The test database can't be used by other processes.
+        with mock.patch('multiprocessing.Pool', InlinePool):
+            with mock.patch('multiprocessing.RLock') as lock:
+                results = list(run_backfill(
+                    'test_backfill',
+                    get_backfill(self.start, self.end),
+                    processes=2,
+                ))
+        self.assertEqual(
+            sorted((date, failed) for date, failed, elapsed in results),
+            [(datetime.date(2013, 4, day), []) for day in range(1, 4)],
+        )
+        # Only the shared plugin held the lock.
+        self.assertEqual(lock.return_value.__enter__.call_count, 3)
+
+    def test_resume(self):
+        backfill = Backfill.objects.create(start=self.start, end=self.end)
+        BackfillDay.objects.create(backfill=backfill, date=self.start)
+        # Without the end date, the backfill is resumed up to its end.
+        self.assertEqual(get_backfill(self.start), backfill)
+        results = list(run_backfill('test_backfill', backfill))
+        self.assertEqual(
+            [date for date, failed, elapsed in results],
+            [datetime.date(2013, 4, 2), datetime.date(2013, 4, 3)],
+        )
+        self.assertIsNotNone(Backfill.objects.get().finished)
+        # A finished backfill of the same range is started again.
+        backfill = get_backfill(self.start, self.end)
+        self.assertEqual(Backfill.objects.count(), 2)
+        results = list(run_backfill('test_backfill', backfill))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(
+            get_backfill(self.start).end,
+            datetime.date.today(),
+        )
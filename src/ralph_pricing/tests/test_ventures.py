@@ -7,6 +7,7 @@ from __future__ import unicode_literals
 
 import datetime
 
+import mock
 from django.test import TestCase
 
 from ralph_pricing import models
@@ -135,3 +136,72 @@ class TestVentures(TestCase):
                 ],
             ],
         )
+
+    def test_ventures_show_in_ralph(self):
+        day = datetime.date(2013, 4, 25)
+        Venture(id=4, name='c', show_in_ralph=False).save()
+        venture = models.Venture(venture_id=3, name='a')
+        venture.save()
+        hidden_venture = models.Venture(venture_id=4, name='c')
+        hidden_venture.save()
+        usage_type = models.UsageType(name='waciki')
+        usage_type.save()
+        for usage_venture in (venture, hidden_venture):
+            models.DailyUsage(
+                type=usage_type,
+                value=32,
+                date=day,
+                pricing_venture=usage_venture,
+            ).save()
+        for view in (AllVentures(), TopVentures()):
+            for progress, data in view.get_data(day, day, show_in_ralph=True):
+                pass
+            self.assertEqual([row[:3] for row in data], [[3, 'a', True]])
+            for progress, data in view.get_data(day, day):
+                pass
+            self.assertEqual(
+                [row[:3] + [row[9]] for row in data],
+                [[3, 'a', True, 32.0], [4, 'c', False, 32.0]],
+            )
+
+    def test_ventures_shards(self):
+        day = datetime.date(2013, 4, 25)
+        venture = models.Venture(venture_id=3, name='a')
+        venture.save()
+        subventure = models.Venture(venture_id=2, parent=venture, name='b')
+        subventure.save()
+        other_venture = models.Venture(venture_id=4, name='c')
+        other_venture.save()
+        usage_type = models.UsageType(
+            name='waciki',
+            show_value_percentage=True,
+        )
+        usage_type.save()
+        for value, usage_venture in (
+            (10, venture),
+            (20, subventure),
+            (30, other_venture),
+        ):
+            models.DailyUsage(
+                type=usage_type,
+                value=value,
+                date=day,
+                pricing_venture=usage_venture,
+            ).save()
+        with mock.patch('ralph_pricing.views.ventures.SHARDS', 2):
+            for view in (AllVentures, TopVentures):
+                for progress, data in view.get_data(day, day):
+                    pass
+                shards = view.get_shards(day, day)
+                self.assertEqual(len(shards), 2)
+                for progress, merged in view.merge_shards(
+                    [view.get_shard_data(shard, day, day) for shard in shards],
+                    day,
+                    day,
+                ):
+                    pass
+                self.assertEqual(merged, data)
+        self.assertEqual(
+            [row[9:11] for row in merged],
+            [[30.0, '50.00%'], [30.0, '50.00%']],
+        )
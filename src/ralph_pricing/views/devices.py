@@ -8,7 +8,15 @@ from __future__ import unicode_literals
 from django.utils.translation import ugettext_lazy as _
 
 from ralph_pricing.forms import DateRangeVentureForm
-from ralph_pricing.models import DailyDevice, Device
+from ralph_pricing.models import (
+    DailyDevice,
+    Device,
+    PriceCalendar,
+    get_assets_count_price_cost_by_venture,
+    get_daily_parts_by_device,
+    get_daily_usages_by_device,
+    get_deprecated_statuses_by_device,
+)
 from ralph_pricing.views.reports import Report, currency
 
 
@@ -17,6 +25,7 @@ class Devices(Report):
     Form = DateRangeVentureForm
     section = 'devices'
     report_name = _('Devices Report')
+    final_rows = True
 
     @staticmethod
     def get_data(start, end, venture, **kwargs):
@@ -29,8 +38,33 @@ class Devices(Report):
         ).values_list('pricing_device_id', flat=True).distinct()
         total_count = len(devices_ids)
         devices = Device.objects.filter(id__in=devices_ids)
+        calendar = PriceCalendar(start=start, end=end)
+        # Everything about the devices is fetched for all of them at once,
+        # so that the number of queries doesn't depend on the device count.
+        assets = get_assets_count_price_cost_by_venture(
+            start,
+            end,
+            DailyDevice.objects.filter(pricing_device__in=devices_ids),
+            key='pricing_device_id',
+        )
+        statuses = get_deprecated_statuses_by_device(
+            start,
+            end,
+            venture,
+            devices_ids,
+        )
+        parts = get_daily_parts_by_device(start, end, devices_ids)
+        usages = get_daily_usages_by_device(
+            start,
+            end,
+            devices_ids,
+            calendar,
+        )
         data = []
-        for extracost in venture.get_extracost_details(start, end):
+        for extracost in venture.get_extracost_details(
+            start,
+            end,
+        ).select_related('type'):
             row = [
                 '{} (Extra Cost)'.format(extracost.type.name),
                 '',
@@ -44,7 +78,7 @@ class Devices(Report):
                 '',
             ]
             data.append(row)
-        for usage in venture.get_daily_usages(start, end):
+        for usage in venture.get_daily_usages(start, end, calendar):
             row = [
                 '',
                 '',
@@ -58,23 +92,19 @@ class Devices(Report):
             ]
             data.append(row)
         for i, device in enumerate(devices):
-            count, price, cost = venture.get_assets_count_price_cost(
-                start,
-                end,
-                device_id=device.id,
-            )
+            count, price, cost = assets.get(device.id, (0, 0, 0))
             data.append([
                 device.name,
                 '',
                 '',
                 device.sn,
                 device.barcode,
-                device.get_deprecated_status(start, end, venture),
+                statuses.get(device.id, ''),
                 currency(price),
                 currency(cost),
                 '',
             ])
-            for part in device.get_daily_parts(start, end):
+            for part in parts[device.id]:
                 data.append([
                     '',
                     part['name'],
@@ -87,7 +117,7 @@ class Devices(Report):
                     '',
                 ])
 
-            for usage in device.get_daily_usages(start, end):
+            for usage in usages.get(device.id, []):
                 data.append([
                     '',
                     '',
@@ -5,27 +5,34 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import cStringIO
+import datetime
+import hashlib
 import itertools
 import urllib
 
 from django.conf import settings
 from django.core.cache import get_cache
+from django.db.models import Model
+from django.http import HttpResponse
 
+from ralph_pricing.models import CACHE_NAME, QUEUE_NAME, get_data_version
+from ralph_pricing.result_store import CHUNK_ROWS, get_result_store
 from ralph_pricing.views.base import Base
-from bob.csvutil import make_csv_response
+from bob.csvutil import UnicodeWriter
 import django_rq
-from rq.job import Job
+from rq.exceptions import NoSuchJobError
+from rq.job import Job, Status
 from django.contrib import messages
 from django.core.cache.backends.dummy import DummyCache
 
 
-CACHE_NAME = 'reports_pricing'
-if CACHE_NAME not in settings.CACHES:
-    CACHE_NAME = 'default'
-QUEUE_NAME = 'reports_pricing'
-if QUEUE_NAME not in settings.RQ_QUEUES:
-    QUEUE_NAME = None
 TIMEOUT = getattr(settings, 'PRICING_REPORTS_TIMEOUT', 4 * 3600)  # 4 hours
+CSV_CHUNK_SIZE = 64 * 1024
+# Split the reports that support it into this many parallel jobs
+SHARDS = getattr(settings, 'PRICING_REPORTS_SHARDS', 1)
+# How long a report can be claimed by a request before its jobs are created
+CLAIM_TIMEOUT = 60
 
 
 def currency(value):
@@ -34,8 +41,111 @@ def currency(value):
     return '{:,.2f} {}'.format(value or 0, settings.CURRENCY).replace(',', ' ')
 
 
+def iter_csv(rows, chunk_size=CSV_CHUNK_SIZE):
+    """
+    Encode the rows as CSV, yielding chunks of about ``chunk_size`` bytes,
+    so that only one chunk is kept in memory at a time.
+    """
+
+    buf = cStringIO.StringIO()
+    writer = UnicodeWriter(buf)
+    for row in rows:
+        writer.writerow([unicode(item) for item in row])
+        if buf.tell() >= chunk_size:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def make_csv_response(rows, filename):
+    """
+    Create a HTTP response that streams the rows as a CSV file, consuming
+    them lazily while the response is being sent.
+    """
+
+    response = HttpResponse(iter_csv(rows), content_type='application/csv')
+    response['Content-Disposition'] = 'attachment; filename=%s' % filename
+    return response
+
+
+def _get_key_value(value):
+    """Return a primitive value identifying a report parameter."""
+
+    if isinstance(value, Model):
+        return value.pk
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
 def _get_cache_key(section, **kwargs):
-    return b'{}?{}'.format(section, urllib.urlencode(kwargs))
+    """
+    Return the cache key of a report, a hash of its primitive parameters
+    and of the version of the data of the dates it covers, so that it is
+    computed again after the data changed.
+    """
+
+    if 'start' in kwargs and 'end' in kwargs:
+        version = get_data_version(kwargs['start'], kwargs['end'])
+    else:
+        version = get_data_version()
+    params = sorted(
+        (name, _get_key_value(value)) for name, value in kwargs.iteritems()
+    )
+    params.append(('data_version', version))
+    digest = hashlib.sha1(urllib.urlencode(params)).hexdigest()
+    return b'{}:{}'.format(section, digest)
+
+
+def _get_chunk_key(key, index):
+    return b'{}#{}'.format(key, index)
+
+
+def _get_shard_key(key, index):
+    return b'{}@{}'.format(key, index)
+
+
+def _set_chunks(cache, key, chunks):
+    """
+    Store the ``chunks`` of rows under ``key``, numbered in order, and
+    return the number of the chunks stored.
+    """
+
+    index = 0
+    for chunk in chunks:
+        cache.set(_get_chunk_key(key, index), chunk)
+        index += 1
+    return index
+
+
+def _iter_chunks(cache, key, chunks, first):
+    for row in first:
+        yield row
+    for index in xrange(1, chunks):
+        chunk = cache.get(_get_chunk_key(key, index))
+        if chunk is None:
+            cache.delete(key)
+            raise ValueError("A chunk of the report was evicted.")
+        for row in chunk:
+            yield row
+
+
+def _get_chunks(cache, key, chunks):
+    """
+    Return an iterator over the rows of the ``chunks`` chunks stored under
+    ``key``, or ``None`` if the first one was evicted. The other chunks are
+    fetched one by one while iterating, an evicted one raises ValueError
+    and drops the status of the report, so that it is computed again.
+    """
+
+    first = cache.get(_get_chunk_key(key, 0)) if chunks else []
+    if first is None:
+        return None
+    return _iter_chunks(cache, key, chunks, first)
 
 
 class Report(Base):
@@ -49,6 +159,9 @@ class Report(Base):
     Form = None
     section = ''
     report_name = ''
+    # Set in the reports that never change the rows they already yielded,
+    # so that the rows are stored while the report is computed.
+    final_rows = False
 
     def __init__(self, *args, **kwargs):
         super(Report, self).__init__(*args, **kwargs)
@@ -107,7 +220,15 @@ class Report(Base):
     def _clear_cache(self, **kwargs):
         cache = get_cache(CACHE_NAME)
         key = _get_cache_key(self.section, **kwargs)
-        cache.set(key, None)
+        status = cache.get(key)
+        if status is not None and status[3]:
+            cache.delete_many([
+                _get_chunk_key(key, index) for index in xrange(status[3])
+            ])
+        cache.delete(key)
+        store = get_result_store()
+        if store is not None:
+            store.delete(key)
 
     def _get_cached(self, **kwargs):
         cache = get_cache(CACHE_NAME)
@@ -116,58 +237,256 @@ class Report(Base):
             header, data = self._get_header_and_data(**kwargs)
             return 100, header, data
         key = _get_cache_key(self.section, **kwargs)
-        cached = cache.get(key)
-        if cached is not None:
-            progress, job_id, header, data = cached
-            if progress < 100 and job_id is not None and QUEUE_NAME:
-                connection = django_rq.get_connection(QUEUE_NAME)
-                job = Job.fetch(job_id, connection)
-                if job.is_finished:
-                    header, data = job.result
-                    progress = 100
-                    cache.set(key, (progress, job_id, header, data))
-                elif job.is_failed:
-                    header, data = None, None
-                    progress = 100
+        store = get_result_store()
+        if store is not None:
+            meta = store.get_meta(key)
+            rows = meta and store.iter_rows(key, meta)
+            if rows is not None:
+                return 100, meta['header'], rows
+        status = cache.get(key)
+        if status is None:
+            # Only the request that claims the report creates its jobs, the
+            # concurrent ones wait for the same jobs.
+            if not cache.add(key, (0, None, None, 0), CLAIM_TIMEOUT):
+                status = cache.get(key) or (0, None, None, 0)
+            elif QUEUE_NAME:
+                status = self._enqueue(key, **kwargs)
+            else:
+                self._store_report(key, **kwargs)
+                status = cache.get(key) or (0, None, None, 0)
+        progress, job_id, header, chunks = status
+        if progress < 100:
+            if job_id is not None and QUEUE_NAME:
+                if self._is_failed(key, job_id):
                     cache.delete(key)
+                    return 100, [], []
+                if isinstance(job_id, list) and not progress:
+                    # The shards are running, count the finished ones.
+                    remaining = cache.get(_get_shard_key(key, 'remaining'))
+                    if remaining is not None:
+                        shards = len(job_id)
+                        progress = 90 * (shards - remaining) // shards
+            return progress, header or [], []
+        if chunks is None:
+            # The report was written to the result store.
+            meta = store and store.get_meta(key)
+            rows = meta and store.iter_rows(key, meta)
+            header = meta and meta['header']
         else:
-            if QUEUE_NAME:
-                queue = django_rq.get_queue(QUEUE_NAME)
-                job = queue.enqueue_call(
-                    func=self._get_header_and_data,
+            rows = _get_chunks(cache, key, chunks)
+        if rows is None:
+            # The report or a chunk of it was evicted from the result store
+            # or the cache, compute it again.
+            self._clear_cache(**kwargs)
+            return 0, [], []
+        return progress, header or [], rows
+
+    def _enqueue(self, key, **kwargs):
+        """
+        Enqueue the jobs computing the report and return its initial status.
+        The reports that can be split into shards get one job per shard,
+        and the last finished shard enqueues a job merging the results.
+
+        The status with the ids of the jobs is stored before they are
+        enqueued, so that it never overwrites the status of a finished job.
+        """
+
+        queue = django_rq.get_queue(QUEUE_NAME)
+        cache = get_cache(CACHE_NAME)
+        shards = self.get_shards(**kwargs) if SHARDS > 1 else None
+        if not shards:
+            jobs = [Job.create(
+                self._store_report,
+                args=(key,),
+                kwargs=kwargs,
+                connection=queue.connection,
+                status=Status.QUEUED,
+                timeout=TIMEOUT,
+            )]
+            status = 0, jobs[0].id, None, 0
+        else:
+            cache.set(_get_shard_key(key, 'remaining'), len(shards))
+            jobs = [
+                Job.create(
+                    self._store_shard,
+                    args=(key, index, shard, len(shards)),
                     kwargs=kwargs,
+                    connection=queue.connection,
+                    status=Status.QUEUED,
                     timeout=TIMEOUT,
                 )
-                progress = 0
-                header = None
-                data = None
-                cache.set(key, (progress, job.id, header, data))
-            else:
-                progress = 0
-                cache.set(key, (progress, None, None, None))
-                header, data = self._get_header_and_data(**kwargs)
-                progress = 100
-                cache.set(key, (progress, None, header, data))
-        return progress, header or [], data or []
+                for index, shard in enumerate(shards)
+            ]
+            status = 0, [job.id for job in jobs], None, 0
+        cache.set(key, status)
+        for job in jobs:
+            queue.enqueue_job(job)
+        return status
+
+    def _is_failed(self, key, job_id):
+        connection = django_rq.get_connection(QUEUE_NAME)
+        if isinstance(job_id, list):
+            job_ids = list(job_id)
+            merge_job_id = get_cache(CACHE_NAME).get(
+                _get_shard_key(key, 'merge'),
+            )
+            if merge_job_id is not None:
+                job_ids.append(merge_job_id)
+        else:
+            job_ids = [job_id]
+        for job_id in job_ids:
+            try:
+                job = Job.fetch(job_id, connection)
+            except NoSuchJobError:
+                # It is just being enqueued.
+                continue
+            if job.is_failed:
+                return True
+        return False
 
     @classmethod
     def _get_header_and_data(cls, **kwargs):
+        header = cls.get_header(**kwargs)
+        data = []
+        for progress, data in cls.get_data(**kwargs):
+            pass
+        return header, data
+
+    @classmethod
+    def _store_report(cls, key, **kwargs):
+        """
+        Compute the report and store it in the cache under ``key`` as a
+        small status record of ``(progress, job_id, header, chunks)``,
+        updated while it is computed, and numbered chunks of the rows.
+        """
+
+        cls._store_rows(key, cls.get_header(**kwargs), cls.get_data(**kwargs))
+
+    @classmethod
+    def _store_shard(cls, key, index, shard, shards, **kwargs):
+        """
+        Compute the partial results of one of the ``shards`` shards of the
+        report and enqueue the merge job if it was the last one to finish.
+        """
+
+        cache = get_cache(CACHE_NAME)
+        cache.set(
+            _get_shard_key(key, index),
+            cls.get_shard_data(shard, **kwargs),
+        )
+        if cache.decr(_get_shard_key(key, 'remaining')) == 0:
+            queue = django_rq.get_queue(QUEUE_NAME)
+            job = queue.enqueue_call(
+                func=cls._merge_shards,
+                args=(key, shards),
+                kwargs=kwargs,
+                timeout=TIMEOUT,
+            )
+            cache.set(_get_shard_key(key, 'merge'), job.id)
+
+    @classmethod
+    def _merge_shards(cls, key, shards, **kwargs):
+        """Merge the partial results of the shards and store the report."""
+
+        cache = get_cache(CACHE_NAME)
+        keys = [_get_shard_key(key, index) for index in xrange(shards)]
+        results = cache.get_many(keys)
+        if len(results) < shards:
+            raise ValueError("Partial results of the report were evicted.")
+        cls._store_rows(
+            key,
+            cls.get_header(**kwargs),
+            cls.merge_shards([results[k] for k in keys], **kwargs),
+            first_progress=90,
+        )
+        cache.delete_many(keys + [
+            _get_shard_key(key, 'remaining'),
+            _get_shard_key(key, 'merge'),
+        ])
+
+    @classmethod
+    def _iter_row_chunks(cls, key, header, job_id, rows, first_progress):
+        """
+        Yield the chunks of ``CHUNK_ROWS`` rows of the report computed by
+        ``rows`` and update its progress in the cache. The chunks of the
+        reports with ``final_rows`` are yielded as soon as they are full,
+        the others only when the report is finished, as their rows can still
+        change at the end, e.g. to compute the percentages.
+        """
+
+        cache = get_cache(CACHE_NAME)
+        last_progress = 0
+        stored = 0
+        data = []
+        for progress, data in rows:
+            if progress - last_progress > 5:
+                # Update progress in 5% increments
+                cache.set(key, (
+                    first_progress + progress * (100 - first_progress) // 100,
+                    job_id,
+                    header,
+                    0,
+                ))
+                last_progress = progress
+            while cls.final_rows and len(data) - stored >= CHUNK_ROWS:
+                yield data[stored:stored + CHUNK_ROWS]
+                stored += CHUNK_ROWS
+        while stored < len(data):
+            yield data[stored:stored + CHUNK_ROWS]
+            stored += CHUNK_ROWS
+
+    @classmethod
+    def _store_rows(cls, key, header, rows, first_progress=0):
         cache = get_cache(CACHE_NAME)
-        key = _get_cache_key(cls.section, **kwargs)
         cached = cache.get(key)
         if cached is not None:
             job_id = cached[1]
         else:
             job_id = None
-        header = cls.get_header(**kwargs)
-        last_progress = 0
+        chunks = cls._iter_row_chunks(
+            key,
+            header,
+            job_id,
+            rows,
+            first_progress,
+        )
+        store = get_result_store()
+        if store is not None:
+            store.write(key, header, itertools.chain.from_iterable(chunks))
+            cache.set(key, (100, job_id, header, None))
+            return
+        cache.set(key, (100, job_id, header, _set_chunks(cache, key, chunks)))
+
+    @classmethod
+    def get_shards(cls, **kwargs):
+        """
+        Override this method to let the report be computed in parallel
+        jobs. Return a list of picklable shard arguments, each passed to
+        ``get_shard_data``, or ``None`` to compute it in a single job.
+        """
+        return None
+
+    @classmethod
+    def get_shard_data(cls, shard, **kwargs):
+        """
+        Override this method to compute the partial results of a shard,
+        they must be picklable. By default these are the rows of the whole
+        report.
+        """
+        header, data = cls._get_header_and_data(**kwargs)
+        return data
+
+    @classmethod
+    def merge_shards(cls, results, **kwargs):
+        """
+        Override this method to merge the partial results of all shards,
+        yielding the progress and the data like ``get_data``. By default
+        the rows of the shards are joined.
+        """
         data = []
-        for progress, data in cls.get_data(**kwargs):
-            if job_id is not None and progress - last_progress > 5:
-                # Update progress in 5% increments
-                cache.set(key, (progress, job_id, header, data))
-                last_progress = progress
-        return header, data
+        for result in results:
+            data.extend(result)
+        yield 100, data
 
     @staticmethod
     def get_data(**kwargs):
@@ -5,16 +5,373 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import collections
 import datetime
+from decimal import Decimal as D
 
+from django.conf import settings
+from django.core.cache import get_cache
 from django.utils.translation import ugettext_lazy as _
+import django_rq
 
-from ralph_pricing.views.reports import Report, currency
-from ralph_pricing.models import UsageType, ExtraCostType, Venture
+from ralph_pricing.columnar import UsageColumns
+from ralph_pricing.views.reports import (
+    CACHE_NAME,
+    QUEUE_NAME,
+    SHARDS,
+    Report,
+    currency,
+)
+from ralph_pricing.models import (
+    DailyDevice,
+    DailyUsage,
+    DailyVentureCost,
+    ExtraCost,
+    ExtraCostType,
+    PriceCalendar,
+    UsageType,
+    Venture,
+    get_assets_count_price_cost_by_venture,
+    get_daily_data_versions,
+    get_daily_venture_costs,
+    get_extra_costs_by_venture,
+    get_subtree_totals,
+    get_usages_count_price_by_type,
+    get_venture_tree,
+)
 from ralph.business.models import Venture as ralph_venture
 from ralph_pricing.forms import DateRangeForm
 
 
+DAY_TIMEOUT = getattr(settings, 'PRICING_REPORTS_DAY_TIMEOUT', 24 * 3600)
+# The costs of a day are cached in that many parts, split by the ventures,
+# to keep them under the item size limit of memcached
+DAY_PARTS = getattr(settings, 'PRICING_REPORTS_DAY_PARTS', 16)
+# Compute the whole range at once when more of its days are not cached
+MAX_MISSING_DAYS = 0.5
+
+
+def get_backend():
+    """
+    Return the ``PRICING_REPORTS_BACKEND`` setting, ``'rollup'`` to compute
+    the reports from the DailyVentureCost table, ``'numpy'`` to compute the
+    usages with the columnar NumPy engine or ``'orm'``.
+    """
+
+    return getattr(settings, 'PRICING_REPORTS_BACKEND', 'orm')
+
+
+def is_incremental():
+    """Whether to reuse the costs of the past days of the earlier reports."""
+
+    return getattr(settings, 'PRICING_REPORTS_INCREMENTAL', False)
+
+
+def get_show_in_ralph():
+    """Return a dict of ``{ralph_venture_id: show_in_ralph}``."""
+
+    return dict(ralph_venture.objects.values_list('id', 'show_in_ralph'))
+
+
+def filter_shown(ventures):
+    """Filter a query of ventures to the ones shown in Ralph."""
+
+    return ventures.filter(venture_id__in=ralph_venture.objects.filter(
+        show_in_ralph=True,
+    ).values('id'))
+
+
+def get_costs(start, end, ventures=None):
+    """
+    Return the ``(assets, usages, extra_costs)`` dicts with the costs of all
+    the ventures, or only of the ``ventures`` query if given, between
+    ``start`` and ``end``, using the backend selected with the
+    ``PRICING_REPORTS_BACKEND`` setting.
+    """
+
+    if is_incremental():
+        return get_incremental_costs(start, end, ventures)
+    return compute_costs(start, end, ventures)
+
+
+def _get_day_keys(date, version):
+    return [
+        b'ralph_pricing_day_costs:{}:{}:{}:{}'.format(
+            get_backend(),
+            date.isoformat(),
+            version,
+            part,
+        )
+        for part in xrange(DAY_PARTS)
+    ]
+
+
+def _set_day_costs(cache, date, version, costs):
+    """
+    Cache the costs of a single day in ``DAY_PARTS`` parts, each with the
+    costs of the ventures whose ids give the same remainder.
+    """
+
+    parts = [({}, {}, {}) for part in xrange(DAY_PARTS)]
+    assets, usages, extra_costs = costs
+    for venture_id, value in assets.iteritems():
+        parts[(venture_id or 0) % DAY_PARTS][0][venture_id] = value
+    for key, value in usages.iteritems():
+        parts[(key[0] or 0) % DAY_PARTS][1][key] = value
+    for key, value in extra_costs.iteritems():
+        parts[(key[0] or 0) % DAY_PARTS][2][key] = value
+    cache.set_many(
+        dict(zip(_get_day_keys(date, version), parts)),
+        DAY_TIMEOUT,
+    )
+
+
+def _join_day_costs(parts):
+    assets = {}
+    usages = {}
+    extra_costs = {}
+    for part_assets, part_usages, part_extra_costs in parts:
+        assets.update(part_assets)
+        usages.update(part_usages)
+        extra_costs.update(part_extra_costs)
+    return assets, usages, extra_costs
+
+
+def cache_day_costs(dates):
+    """Compute and cache the costs of the past days among the ``dates``."""
+
+    dates = [date for date in dates if date < datetime.date.today()]
+    if not dates:
+        return
+    versions = get_daily_data_versions(min(dates), max(dates))
+    cache = get_cache(CACHE_NAME)
+    for date in dates:
+        _set_day_costs(cache, date, versions[date], compute_costs(date, date))
+
+
+def get_incremental_costs(start, end, ventures=None):
+    """
+    Return the same costs as :func:`compute_costs`, combined from the costs
+    of every single day in the range. The costs of the past days are kept
+    in the cache, so that only the days missing there are computed.
+
+    The costs of a single day are raw sums, so that the counts and prices
+    of the assets and the counts of the ``average`` usage types can be
+    divided by the length of the requested range afterwards. The days are
+    cached for all the ventures, the ``ventures`` are only filtered here.
+    The keys include the versions of the data, so only the changed days
+    are computed again after a sync or an edit. When most of the days are
+    missing and there is a reports queue, the whole range is computed with
+    a single :func:`compute_costs` call instead, as every day takes the
+    queries of a whole range, and the missing days are cached by a job of
+    the queue.
+    """
+
+    days = (end - start).days + 1
+    dates = [start + datetime.timedelta(days=day) for day in xrange(days)]
+    versions = get_daily_data_versions(start, end)
+    keys = dict((date, _get_day_keys(date, versions[date])) for date in dates)
+    cache = get_cache(CACHE_NAME)
+    cached = cache.get_many([
+        key for day_keys in keys.itervalues() for key in day_keys
+    ])
+    missing = set(
+        date for date in dates
+        if any(key not in cached for key in keys[date])
+    )
+    if (
+        len(missing) > 1 and
+        len(missing) > MAX_MISSING_DAYS * days and
+        QUEUE_NAME
+    ):
+        django_rq.get_queue(QUEUE_NAME).enqueue(
+            cache_day_costs,
+            sorted(missing),
+        )
+        return compute_costs(start, end, ventures)
+    today = datetime.date.today()
+    daily_costs = []
+    for date in dates:
+        if date in missing:
+            costs = compute_costs(date, date)
+            if date < today:
+                _set_day_costs(cache, date, versions[date], costs)
+        else:
+            costs = _join_day_costs(cached[key] for key in keys[date])
+        daily_costs.append(costs)
+    if ventures is not None:
+        ventures = set(Venture.objects.filter(
+            id__in=ventures,
+        ).values_list('id', flat=True))
+    average = dict(UsageType.objects.values_list('id', 'average'))
+    assets = {}
+    usages = {}
+    extra_costs = {}
+    for day_assets, day_usages, day_extra_costs in daily_costs:
+        for venture_id, (count, price, cost) in day_assets.iteritems():
+            if ventures is not None and venture_id not in ventures:
+                continue
+            total_count, total_price, total_cost = assets.get(
+                venture_id,
+                (0, 0, 0),
+            )
+            assets[venture_id] = (
+                total_count + count,
+                total_price + price,
+                total_cost + cost,
+            )
+        for key, (count, price) in day_usages.iteritems():
+            if ventures is not None and key[0] not in ventures:
+                continue
+            total_count, total_price = usages.get(key, (0, D(0)))
+            if price is None or total_price is None:
+                total_price = None
+            else:
+                total_price += price
+            usages[key] = total_count + count, total_price
+        for key, price in day_extra_costs.iteritems():
+            if ventures is not None and key[0] not in ventures:
+                continue
+            extra_costs[key] = extra_costs.get(key, 0) + price
+    for venture_id, (count, price, cost) in assets.iteritems():
+        assets[venture_id] = count / days, price / days, cost
+    for (venture_id, type_id), (count, price) in usages.iteritems():
+        if average[type_id]:
+            usages[venture_id, type_id] = count / days, price
+    return assets, usages, extra_costs
+
+
+def compute_costs(start, end, ventures=None):
+    """
+    Compute the costs like :func:`get_costs` does, without reusing the
+    costs of the single days.
+    """
+
+    def by_venture(query):
+        if ventures is None:
+            return query.all()
+        return query.filter(pricing_venture__in=ventures)
+
+    backend = get_backend()
+    if backend == 'rollup':
+        return get_daily_venture_costs(
+            start,
+            end,
+            by_venture(DailyVentureCost.objects),
+        )
+    assets = get_assets_count_price_cost_by_venture(
+        start,
+        end,
+        by_venture(DailyDevice.objects),
+    )
+    calendar = PriceCalendar(start=start, end=end)
+    if backend == 'numpy':
+        usages = UsageColumns(
+            start,
+            end,
+            by_venture(DailyUsage.objects),
+            calendar,
+        ).get_usages()
+    else:
+        usages = get_usages_count_price_by_type(
+            by_venture(DailyUsage.objects),
+            start,
+            end,
+            calendar,
+            key='pricing_venture',
+        )
+    extra_costs = get_extra_costs_by_venture(
+        start,
+        end,
+        by_venture(ExtraCost.objects),
+    )
+    return assets, usages, extra_costs
+
+
+def get_venture_costs(start, end, ventures=None):
+    """
+    Return a dict of ``{venture_id: costs}`` with the costs of every venture,
+    or of the ``ventures`` query if given, by itself (not including its
+    descendants), as dicts indexed by
+    ``'assets_count'``, ``'assets_price'``, ``'assets_cost'``,
+    ``('usage_count', type_id)``, ``('usage_price', type_id)`` and
+    ``('extra_cost', type_id)``.
+    """
+
+    assets, usages, extra_costs = get_costs(start, end, ventures)
+    costs = collections.defaultdict(dict)
+    for venture_id, (count, price, cost) in assets.iteritems():
+        costs[venture_id].update({
+            'assets_count': count,
+            'assets_price': price,
+            'assets_cost': cost,
+        })
+    for (venture_id, type_id), (count, price) in usages.iteritems():
+        costs[venture_id]['usage_count', type_id] = count
+        costs[venture_id]['usage_price', type_id] = price
+    for (venture_id, type_id), price in extra_costs.iteritems():
+        costs[venture_id]['extra_cost', type_id] = price
+    return costs
+
+
+def get_rows(ventures, costs, no_price='NO PRICE'):
+    """
+    Yield the progress and the report rows for the ``(venture, name,
+    show_venture)`` tuples in ``ventures``, using their ``costs`` as
+    returned by :func:`get_venture_costs` or summed up for the subtrees.
+    """
+
+    usage_types = list(UsageType.objects.order_by('name'))
+    extra_cost_types = list(ExtraCostType.objects.order_by('name'))
+    # The columns of the percentages, found while filling the first row.
+    percentages = {}
+    total_count = len(ventures) + 1  # additional step for post-process
+    data = []
+    for i, (venture, name, show_venture) in enumerate(ventures):
+        venture_costs = costs.get(venture.id, {})
+        row = [
+            venture.venture_id,
+            name,
+            show_venture,
+            venture.department,
+            venture.business_segment,
+            venture.profit_center,
+            venture_costs.get('assets_count', 0),
+            currency(venture_costs.get('assets_price', 0)),
+            currency(venture_costs.get('assets_cost', 0)),
+        ]
+        for usage_type in usage_types:
+            price = venture_costs.get(('usage_price', usage_type.id), D(0))
+            row.append(venture_costs.get(('usage_count', usage_type.id), 0))
+            if usage_type.show_value_percentage:
+                percentages[len(row)] = 'usage_count', usage_type.id
+                row.append('')
+            if price is None:
+                row.append(no_price)
+            else:
+                row.append(currency(price))
+            if usage_type.show_price_percentage:
+                percentages[len(row)] = 'usage_price', usage_type.id
+                row.append('')
+        for extra_cost_type in extra_cost_types:
+            row.append(currency(
+                venture_costs.get(('extra_cost', extra_cost_type.id), 0),
+            ))
+        progress = (100 * i) // total_count
+        data.append(row)
+        yield min(progress, 99), data
+    for column, key in percentages.iteritems():
+        values = [
+            costs.get(venture.id, {}).get(key) or 0
+            for venture, name, show_venture in ventures
+        ]
+        total = sum(values)
+        if total:
+            for row, value in zip(data, values):
+                row[column] = '{:.2f}%'.format(100 * value / total)
+    yield 100, data
+
+
 class AllVentures(Report):
     template_name = 'ralph_pricing/ventures_all.html'
     Form = DateRangeForm
@@ -22,77 +379,47 @@ class AllVentures(Report):
     report_name = _('All Ventures Report')
 
     @staticmethod
-    def get_data(start, end, show_in_ralph=False, **kwargs):
-        ventures = Venture.objects.order_by('name')
-        total_count = ventures.count() + 1  # additional step for post-process
-        data = []
-        totals = {}
-        values = []
-        for i, venture in enumerate(ventures):
-            show_venture = ralph_venture.objects.get(
-                id=venture.venture_id
-            ).show_in_ralph
-            if show_in_ralph and not show_venture:
-                continue
-            values_row = {}
-            values.append(values_row)
-            count, price, cost = venture.get_assets_count_price_cost(
-                start, end,
-            )
-            path = '/'.join(
-                v.name for v in venture.get_ancestors(include_self=True),
-            )
-            row = [
-                venture.venture_id,
-                path,
-                show_in_ralph,
-                venture.department,
-                venture.business_segment,
-                venture.profit_center,
-                count,
-                currency(price),
-                currency(cost),
-            ]
-            column = len(row)
-            for usage_type in UsageType.objects.order_by('name'):
-                count, price = venture.get_usages_count_price(
-                    start,
-                    end,
-                    usage_type,
-                )
-                row.append(count)
-                column += 1
-                if usage_type.show_value_percentage:
-                    row.append('')
-                    totals[column] = totals.get(column, 0) + count
-                    values_row[column] = count
-                    column += 1
-                if price is None:
-                    row.append('NO PRICE')
-                else:
-                    row.append(currency(price))
-                column += 1
-                if usage_type.show_price_percentage:
-                    row.append('')
-                    totals[column] = totals.get(column, 0) + count
-                    values_row[column] = price
-                    column += 1
-            for extra_cost_type in ExtraCostType.objects.order_by('name'):
-                row.append(currency(venture.get_extra_costs(
-                    start,
-                    end,
-                    extra_cost_type,
-                )))
-            progress = (100 * i) // total_count
-            data.append(row)
-            yield min(progress, 99), data
-        for row, values_row in zip(data, values):
-            for column, total in totals.iteritems():
-                if total:
-                    row[column] = '{:.2f}%'.format(
-                        100 * values_row[column] / total,
-                    )
-        yield 100, data
+    def get_ventures(show_in_ralph=False):
+        """Return a query of the ventures in the rows of the report."""
+
+        ventures = Venture.objects.all()
+        if show_in_ralph:
+            ventures = filter_shown(ventures)
+        return ventures
+
+    @classmethod
+    def get_data(cls, start, end, show_in_ralph=False, **kwargs):
+        ventures = cls.get_ventures(show_in_ralph).values('id')
+        return cls.merge_shards(
+            [cls.get_shard_data(ventures, start, end)],
+            start,
+            end,
+            show_in_ralph,
+        )
+
+    @classmethod
+    def get_shards(cls, start, end, show_in_ralph=False, **kwargs):
+        ids = list(cls.get_ventures(show_in_ralph).order_by(
+            'id',
+        ).values_list('id', flat=True))
+        return [ids[i::SHARDS] for i in xrange(min(SHARDS, len(ids)))]
+
+    @staticmethod
+    def get_shard_data(shard, start, end, **kwargs):
+        return dict(get_venture_costs(start, end, shard))
+
+    @classmethod
+    def merge_shards(cls, results, start, end, show_in_ralph=False, **kwargs):
+        costs = {}
+        for result in results:
+            costs.update(result)
+        shown = get_show_in_ralph()
+        tree = get_venture_tree()
+        rows = [
+            (venture, tree.paths[venture.id], shown.get(venture.venture_id))
+            for venture in cls.get_ventures(show_in_ralph).order_by('name')
+        ]
+        return get_rows(rows, costs)
 
     @staticmethod
     def get_header(**kwargs):
@@ -125,72 +452,36 @@ class TopVentures(AllVentures):
     report_name = _('Top Ventures Report')
 
     @staticmethod
-    def get_data(start, end, show_in_ralph=False, **kwargs):
-        ventures = Venture.objects.root_nodes().order_by('name')
-        total_count = ventures.count() + 1  # additional step for post-process
-        data = []
-        totals = {}
-        values = []
-        for i, venture in enumerate(ventures):
-            show_venture = ralph_venture.objects.get(
-                id=venture.venture_id
-            ).show_in_ralph
-            if show_in_ralph and not show_venture:
-                continue
-            values_row = {}
-            values.append(values_row)
-            count, price, cost = venture.get_assets_count_price_cost(
-                start,
-                end,
-                descendants=True,
-            )
-            row = [
-                venture.venture_id,
-                venture.name,
-                ralph_venture.objects.get(id=venture.venture_id).show_in_ralph,
-                venture.department,
-                venture.business_segment,
-                venture.profit_center,
-                count,
-                currency(price),
-                currency(cost),
-            ]
-            column = len(row)
-            for usage_type in UsageType.objects.order_by('name'):
-                count, price = venture.get_usages_count_price(
-                    start,
-                    end,
-                    usage_type,
-                    descendants=True,
-                )
-                row.append(count)
-                column += 1
-                if usage_type.show_value_percentage:
-                    row.append('')
-                    totals[column] = totals.get(column, 0) + count
-                    values_row[column] = count
-                    column += 1
-                row.append(currency(price))
-                column += 1
-                if usage_type.show_price_percentage:
-                    row.append('')
-                    totals[column] = totals.get(column, 0) + price
-                    values_row[column] = price
-                    column += 1
-            for extra_cost_type in ExtraCostType.objects.order_by('name'):
-                row.append(currency(venture.get_extra_costs(
-                    start,
-                    end,
-                    extra_cost_type,
-                    descendants=True,
-                )))
-            progress = (100 * i) // total_count
-            data.append(row)
-            yield min(progress, 99), data
-        for row, values_row in zip(data, values):
-            for column, total in totals.iteritems():
-                if total:
-                    row[column] = '{:.2f}%'.format(
-                        100 * values_row[column] / total,
-                    )
-        yield 100, data
+    def get_ventures(show_in_ralph=False):
+        roots = Venture.objects.filter(parent=None)
+        if show_in_ralph:
+            roots = filter_shown(roots)
+        return roots
+
+    @staticmethod
+    def get_shard_data(shard, start, end, **kwargs):
+        query = Venture.objects.filter(
+            tree_id__in=Venture.objects.filter(id__in=shard).values('tree_id'),
+        )
+        ventures = list(query)
+        totals = get_subtree_totals(
+            ventures,
+            get_venture_costs(start, end, query.values('id')),
+        )
+        return {
+            venture.id: totals[venture.id]
+            for venture in ventures
+            if venture.parent_id is None
+        }
+
+    @classmethod
+    def merge_shards(cls, results, start, end, show_in_ralph=False, **kwargs):
+        costs = {}
+        for result in results:
+            costs.update(result)
+        shown = get_show_in_ralph()
+        ventures = [
+            (venture, venture.name, shown.get(venture.venture_id))
+            for venture in cls.get_ventures(show_in_ralph).order_by('name')
+        ]
+        return get_rows(ventures, costs, no_price=currency(None))